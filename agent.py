@@ -1,66 +1,474 @@
 # agent.py
 
-import time, random
-import schedule
-from graph_mail_reader import graph_mail_reader
+import os, time, random, signal, asyncio, threading, argparse, multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, time as day_time
+from zoneinfo import ZoneInfo
+from graph_mail_reader import DELTA_LINK_PATH, iter_unread_messages, iter_inbox_delta, iter_messages_by_id
+from graph_webhook import NOTIFICATION_URL, RENEW_MARGIN, NotificationReceiver, InboxSubscription
 from utils.filters import should_reply
-from gpt.generator import generate_reply
-from graph_mail_sender import send_email, mark_as_read
+from gpt.generator import generate_replies, trim_email_body, get_reply_cache
+from graph_mail_sender import NO_RESPONSE, send_emails, mark_many_as_read
+from reply_queue import ReplyQueue
+from mailboxes import MAILBOXES_PATH, Mailbox, load_mailboxes, shard
+from utils import metrics
+from utils.resilience import TRANSIENT_STATUSES
 
 # --- CONFIG ---
 MIN_DELAY = 1 * 3600    # 1 hour
 MAX_DELAY = 6 * 3600    # 6 hours
 START_HOUR = 7          # 7:00 AM PST
 END_HOUR   = 24         # midnight PST
+USE_DELTA_SYNC = True   # only fetch messages added/changed since the last poll
+MARK_FILTERED_AS_READ = False  # mark filtered messages (auto-replies etc.) as read in bulk
+QUEUE_DB_PATH = os.getenv("AGENT_QUEUE_DB", "reply_queue.db")  # survives restarts
+RETRY_DELAY = 15 * 60   # wait before retrying a rejected send
+DRAFT_WAIT  = 5 * 60    # push back a due reply whose draft isn't ready yet
+FETCH_INTERVAL = 3600   # poll the inbox hourly
+USE_PUSH = bool(NOTIFICATION_URL)  # also take Graph change notifications (see graph_webhook.py)
+SUBSCRIBE_RETRY = 10 * 60  # wait before retrying a failed subscription; polling covers the gap
+DRAFT_INTERVAL = 15 * 60  # retry drafts that failed earlier at least this often
+METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", "9108"))  # Prometheus /metrics; 0 = off
+METRICS_HOST = os.getenv("AGENT_METRICS_HOST", "127.0.0.1")
+METRICS_LOG_INTERVAL = 5 * 60  # seconds between JSON metrics log lines; 0 = off
+WORKERS = int(os.getenv("AGENT_WORKERS", "16"))  # threads running fetch/draft/send jobs, all mailboxes together
+PROCESSES = int(os.getenv("AGENT_PROCESSES", "1"))  # worker processes the mailboxes are sharded across
+DRAFT_BATCH = 50        # drafts per mailbox per round, so a big backlog can't starve the other mailboxes
+FETCH_STAGGER = 60      # spread the mailboxes' first fetches over this many seconds
 
-# In-memory queue: [(send_timestamp, msg_dict), ...]
-queue = []
+_default_mailbox = None
+_mailboxes = []  # the mailboxes this process serves
 
-def enqueue_replies():
-    raw_msgs = graph_mail_reader()  # unread messages
-    
-    processed_msgs_for_queue = []
-    for m in raw_msgs:
-        reply_flag, reason = should_reply(m)
+def get_default_mailbox():
+    """
+    The EMAIL_ADDRESS mailbox, with its durable reply queue at QUEUE_DB_PATH,
+    opened on first use. With --mailboxes, each configured mailbox has its
+    own, and worker processes never open this one.
+    """
+    global _default_mailbox
+    if _default_mailbox is None:
+        _default_mailbox = Mailbox(queue=ReplyQueue(QUEUE_DB_PATH), delta_link_path=DELTA_LINK_PATH)
+    return _default_mailbox
+
+# --- Metrics (see utils/metrics.py); Graph, parsing and LLM calls are timed where they happen ---
+_JOB_SECONDS = metrics.histogram("agent_job_seconds", "Duration of each fetch/draft/dispatch run", ["job"])
+_STAGE_SECONDS = metrics.histogram("agent_stage_seconds", "Time per pipeline stage", ["stage"])
+_MESSAGES = metrics.counter("agent_messages_total", "Messages seen by enqueue_replies", ["kind"])
+_DECISIONS = metrics.counter("filter_decisions_total", "should_reply decisions by reason", ["reason"])
+_SENDS = metrics.counter("replies_sent_total", "Reply sends by Graph status", ["status"])
+
+def _queue_states():
+    totals = {}
+    for mailbox in _mailboxes:
+        for state, n in mailbox.queue.count_by_state().items():
+            totals[state] = totals.get(state, 0) + n
+    return totals
+
+metrics.gauge("queue_replies", "Replies in the queue databases by state", ["state"], fn=_queue_states)
+metrics.gauge("queue_scheduled", "Replies waiting for their send time",
+              fn=lambda: sum(len(mailbox.queue) for mailbox in _mailboxes))
+
+def enqueue_replies(messages=None, mailbox=None):
+    """
+    Filter new messages and schedule replies to the ones that need one.
+    By default polls the Inbox; push mode passes in just the messages a
+    change notification named. `mailbox` defaults to EMAIL_ADDRESS's, as
+    in the other jobs below.
+    """
+    mailbox = mailbox or get_default_mailbox()
+    queue = mailbox.queue
+    enqueued = 0
+    filtered_ids = []
+    if messages is None:
+        if USE_DELTA_SYNC:
+            messages = iter_inbox_delta(path=mailbox.delta_link_path, user_email=mailbox.address,
+                                        client=mailbox.client)
+        else:
+            messages = iter_unread_messages(user_email=mailbox.address, client=mailbox.client)
+    # Messages stream in page by page; filter and enqueue as they arrive
+    for m in messages:
+        if "@removed" in m or m.get("isRead"):
+            # Deleted or read since the last sync: no reply needed any more
+            _MESSAGES.inc(kind="read_or_removed")
+            if queue.cancel(m["id"]):
+                print(f"{mailbox.label}Cancelled queued reply to message {m['id']} (read or deleted).")
+            continue
+        if queue.has_message(m["id"]):
+            _MESSAGES.inc(kind="already_queued")
+            continue  # already waiting out its delay, or answered
+        _MESSAGES.inc(kind="new")
+        # Filter and draft on what the sender wrote, not quoted history or footers
+        with _STAGE_SECONDS.time(stage="filter"):
+            m["trimmed_body_text"] = trim_email_body(m.get("full_body_text", ""))
+            reply_flag, reason = should_reply({
+                "from": m.get("from", ""),
+                "subject": m.get("subject", ""),
+                "body": m["trimmed_body_text"],
+            })
+        _DECISIONS.inc(reason=reason)
         if reply_flag:
-            processed_msgs_for_queue.append(m)
+            # Follow-ups in a thread that already has a reply waiting are
+            # folded into it, so the thread gets one reply to its latest message
+            send_at = time.time() + random.uniform(MIN_DELAY, MAX_DELAY)
+            if queue.push(m, send_at):  # False if the other ingest path got it first
+                enqueued += 1
         else:
-            print(f"Agent filtering: Message ID {m.get('id', 'N/A')} from {m.get('from',{}).get('emailAddress',{}).get('address','N/A')} due to: {reason}")
-            # Mark as read if configured to do so for filtered messages
-            # mark_as_read(m["id"]) # Uncomment if you want to mark filtered messages as read immediately
-            
-    for msg in processed_msgs_for_queue:
-        send_at = time.time() + random.uniform(MIN_DELAY, MAX_DELAY)
-        queue.append((send_at, msg))
+            print(f"{mailbox.label}Agent filtering: Message ID {m.get('id', 'N/A')} from {m.get('from',{}).get('emailAddress',{}).get('address','N/A')} due to: {reason}")
+            filtered_ids.append(m["id"])
+
+    # Mark filtered messages as read in a handful of $batch calls
+    if MARK_FILTERED_AS_READ and filtered_ids:
+        statuses = mark_many_as_read(filtered_ids, mailbox.address, mailbox.client)
+        failed = [mid for mid, status in statuses.items() if not 200 <= status < 300]
+        print(f"{mailbox.label}Marked {len(filtered_ids) - len(failed)} filtered messages as read ({len(failed)} failed).")
         
-    if processed_msgs_for_queue:
-        print(f"Enqueued {len(processed_msgs_for_queue)} replies.")
+    if enqueued:
+        print(f"{mailbox.label}Enqueued {enqueued} messages ({len(queue)} replies scheduled).")
+        _wake(mailbox.draft_requested)
+        _wake(mailbox.queue_changed)  # a new reply may be due before the current wake-up
+
+def draft_pending(mailbox=None):
+    """
+    Generate drafts for queued replies during their send delay, earliest
+    send time first, so dispatch only has to send them. Drafts at most
+    DRAFT_BATCH per call and asks for another round if more are waiting.
+    """
+    mailbox = mailbox or get_default_mailbox()
+    queue = mailbox.queue
+    pending = queue.pending_drafts()
+
+    def items():
+        for reply_id in pending[:DRAFT_BATCH]:
+            found = queue.get_message(reply_id, with_version=True)
+            if found is not None:  # cancelled in the meantime
+                msg, version = found
+                # Reply to the latest message (trimmed body text), with the
+                # earlier unanswered messages of the thread as context
+                yield ((reply_id, version),
+                       msg.get("trimmed_body_text") or msg.get("full_body_text", ""),
+                       [text for _, text in msg.get("thread_context", [])])
+
+    drafted = failed = 0
+    for (reply_id, version), draft, error in generate_replies(items()):
+        if error is not None:
+            # Left pending; the next drafting round tries again
+            print(f"{mailbox.label}Could not draft reply {reply_id}: {error}")
+            failed += 1
+            continue
+        # Refused if a follow-up was folded in meanwhile; it is drafted again
+        if queue.set_draft(reply_id, draft, version):
+            drafted += 1
+    if drafted or failed:
+        stats = get_reply_cache().stats()
+        print(f"{mailbox.label}Drafted {drafted} replies ({failed} failed); reply cache "
+              f"{stats['hits'] + stats['near_hits']} hits / {stats['misses']} misses.")
+    if drafted:
+        _wake(mailbox.queue_changed)  # replies postponed for their draft can go now
+        if len(pending) > DRAFT_BATCH:
+            _wake(mailbox.draft_requested)  # more to do, after the other mailboxes' turn
+
+def next_send_time(t: float, mailbox=None) -> float:
+    """
+    The earliest time at or after `t` inside the mailbox's sending window:
+    START_HOUR-END_HOUR local time (PST), unless the mailbox config sets
+    its own hours or timezone.
+    """
+    mailbox = mailbox or get_default_mailbox()
+    start = START_HOUR if mailbox.start_hour is None else mailbox.start_hour
+    end = END_HOUR if mailbox.end_hour is None else mailbox.end_hour
+    zone = ZoneInfo(mailbox.timezone) if mailbox.timezone else None
+    now = datetime.fromtimestamp(t, zone)
+    if start <= now.hour < end:
+        return t
+    day = now.date() + timedelta(days=1 if now.hour >= end else 0)
+    return datetime.combine(day, day_time(start), tzinfo=zone).timestamp()
 
-def dispatch_queue():
+def dispatch_queue(mailbox=None):
+    mailbox = mailbox or get_default_mailbox()
+    queue = mailbox.queue
     now = time.time()
-    for send_at, msg in queue.copy():
-        # Check time window (PST) and scheduled time
-        local_hour = time.localtime(now).tm_hour
-        if now >= send_at and START_HOUR <= local_hour < END_HOUR:
-            # Use the full_body_text for generating the reply
-            email_body_for_gpt = msg.get("full_body_text", msg.get("bodyPreview", "")) 
-            draft = generate_reply(email_body_for_gpt)
-            
-            to_addr = msg["from"]["emailAddress"]["address"]
-            # Ensure subject is a string before concatenation
-            original_subject = str(msg.get("subject", ""))
-            subj    = "Re: " + original_subject
-            
-            send_email(to_addr, subj, draft)
-            mark_as_read(msg["id"])
-            queue.remove((send_at, msg))
-            print(f"Sent reply to {to_addr} at {time.strftime('%X')}")
-
-# Schedule: fetch new replies every hour, dispatch every 5 minutes
-schedule.every().hour.do(enqueue_replies)
-schedule.every(5).minutes.do(dispatch_queue)
-
-print("🤖 Agent started. Press Ctrl+C to stop.")
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+    if next_send_time(now, mailbox) > now:
+        return  # outside the sending window
+    due = queue.pop_due(now)
+    if not due:
+        return
+
+    # Drafts were generated in the background; only sending is left here
+    replies = []
+    for reply_id, send_at, msg, draft in due:
+        if draft is None:
+            queue.postpone(reply_id, now + DRAFT_WAIT)
+            _wake(mailbox.draft_requested)
+            continue
+        
+        to_addr = msg["from"]["emailAddress"]["address"]
+        # Ensure subject is a string before concatenation
+        original_subject = str(msg.get("subject", ""))
+        subj    = "Re: " + original_subject
+        replies.append((reply_id, to_addr, subj, draft))
+    if not replies:
+        return  # all waiting for their drafts
+
+    # Record the sends before making them: after a crash from here on, the
+    # reply counts as sent and is never sent a second time.
+    queue.mark_sending([r[0] for r in replies])
+    try:
+        with _STAGE_SECONDS.time(stage="send"):
+            send_statuses = send_emails(replies, mailbox.address, mailbox.client)
+    except Exception:
+        # Raised before a batch went out (e.g. no access token): nothing was
+        # sent, so the replies go back on the schedule instead of staying in
+        # SENDING, where a restart would count them as sent.
+        for reply_id, _, _, _ in replies:
+            queue.postpone(reply_id, now + RETRY_DELAY)
+        raise
+    for status in send_statuses.values():
+        _SENDS.inc(status=status)
+    sent_ids = [mid for mid, status in send_statuses.items() if 200 <= status < 300]
+    queue.mark_sent(sent_ids)
+
+    for reply_id, to_addr, _, _ in replies:
+        status = send_statuses[reply_id]
+        if 200 <= status < 300:
+            print(f"{mailbox.label}Sent reply to {to_addr} at {time.strftime('%X')}")
+        elif status == NO_RESPONSE or status in TRANSIENT_STATUSES:
+            # No answer or a server error: Graph may have sent it. It stays in
+            # SENDING, so it is never sent again; a restart marks the message read.
+            print(f"{mailbox.label}Reply to {to_addr} may or may not have gone out (status {status}); "
+                  f"not resending.")
+        elif queue.retry(reply_id, now + RETRY_DELAY):
+            print(f"{mailbox.label}Failed to send reply to {to_addr} (status {status}); will retry.")
+        else:
+            print(f"{mailbox.label}Giving up on reply to {to_addr} (status {status}).")
+
+    mark_replied_as_read(sent_ids, mailbox)
+
+def mark_replied_as_read(reply_ids, mailbox=None):
+    """
+    Flag every message the sent replies answered as read, in $batch calls,
+    and record it in the queue once all messages of a reply succeeded.
+    """
+    if not reply_ids:
+        return
+    mailbox = mailbox or get_default_mailbox()
+    queue = mailbox.queue
+    thread_ids = {reply_id: queue.message_ids(reply_id) for reply_id in reply_ids}
+    with _STAGE_SECONDS.time(stage="mark_read"):
+        read_statuses = mark_many_as_read([mid for ids in thread_ids.values() for mid in ids],
+                                          mailbox.address, mailbox.client)
+    failed = {mid for mid, status in read_statuses.items() if not 200 <= status < 300}
+    queue.mark_read([reply_id for reply_id, ids in thread_ids.items() if failed.isdisjoint(ids)])
+    for msg_id in failed:
+        print(f"{mailbox.label}Warning: could not mark message {msg_id} as read (status {read_statuses[msg_id]}).")
+
+def recover_unfinished_sends(mailbox=None):
+    """
+    After a crash, finish replies that went out but whose original message
+    was never marked read. They are not sent again.
+    """
+    mailbox = mailbox or get_default_mailbox()
+    unfinished = mailbox.queue.unfinished_sends()
+    if unfinished:
+        print(f"{mailbox.label}Recovering {len(unfinished)} replies sent before the last shutdown.")
+        mark_replied_as_read(unfinished, mailbox)
+
+# --- Runtime ---
+# Fetching, drafting and sending each run as one asyncio task that hands its
+# blocking work to a thread, so a slow LLM call or Graph request never holds
+# up the other two, and none of them overlaps itself. Between jobs the tasks
+# sleep until something can happen: the next fetch, a drafting request, or
+# the earliest reply's send time moved into the sending window.
+# With USE_PUSH, a fourth task takes Graph change notifications so new
+# mail is enqueued within seconds; the hourly poll stays as the fallback.
+# Serving several mailboxes, each gets its own three tasks and events
+# (Mailbox.draft_requested: replies are waiting for a draft; queue_changed:
+# the earliest send time may have moved; fetch_requested: poll now), and
+# their jobs share a pool of WORKERS threads.
+_loop = None
+_push_received = None    # asyncio.Event: notified ids or lifecycle events are waiting
+_pushed_ids = {}         # message ids from notifications, in arrival order
+_lifecycle_events = set()
+_push_lock = threading.Lock()
+
+def _wake(event):
+    """Set `event` from any thread; a no-op outside the runtime."""
+    if _loop is not None and event is not None:
+        _loop.call_soon_threadsafe(event.set)
+
+async def _wait(event, timeout):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    event.clear()
+
+async def _run(job, *args):
+    try:
+        with _JOB_SECONDS.time(job=job.__name__):
+            await asyncio.to_thread(job, *args)
+    except Exception as e:
+        print(f"Error in {job.__name__}: {e}")
+
+async def metrics_log_loop():
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        print(metrics.log_line())
+
+async def fetch_loop(mailbox, delay=0):
+    await asyncio.sleep(delay)
+    while True:
+        await _run(enqueue_replies, None, mailbox)
+        await _wait(mailbox.fetch_requested, FETCH_INTERVAL)
+
+def _on_notified_messages(message_ids):
+    # Runs on the receiver's thread; Graph wants a quick answer
+    with _push_lock:
+        _pushed_ids.update(dict.fromkeys(message_ids))
+    _wake(_push_received)
+
+def _on_lifecycle_event(event):
+    print(f"Graph subscription lifecycle event: {event}")
+    if event == "missed":
+        _wake(get_default_mailbox().fetch_requested)  # notifications were dropped; a delta poll catches up
+    else:
+        with _push_lock:
+            _lifecycle_events.add(event)
+        _wake(_push_received)
+
+async def push_loop():
+    """
+    Keep an Inbox subscription alive and enqueue notified messages as soon
+    as they arrive. Polling keeps running, so a failed subscription only
+    costs latency.
+    """
+    receiver = NotificationReceiver(_on_notified_messages, _on_lifecycle_event).start()
+    subscription = InboxSubscription(NOTIFICATION_URL)
+    try:
+        while True:
+            with _push_lock:
+                message_ids, events = list(_pushed_ids), set(_lifecycle_events)
+                _pushed_ids.clear()
+                _lifecycle_events.clear()
+            if message_ids:
+                await _run(enqueue_replies, iter_messages_by_id(message_ids))
+
+            if "subscriptionRemoved" in events:
+                subscription.id = None
+            if events or subscription.seconds_left() < RENEW_MARGIN:
+                try:
+                    await asyncio.to_thread(subscription.renew)
+                except Exception as e:
+                    print(f"Could not subscribe to Inbox notifications ({e}); polling only for now.")
+                    await _wait(_push_received, SUBSCRIBE_RETRY)
+                    continue
+            await _wait(_push_received, subscription.seconds_left() - RENEW_MARGIN)
+    finally:
+        receiver.stop()
+        try:
+            subscription.delete()
+        except Exception as e:
+            print(f"Could not delete subscription {subscription.id}: {e}")
+
+async def draft_loop(mailbox):
+    while True:
+        await _run(draft_pending, mailbox)
+        await _wait(mailbox.draft_requested, DRAFT_INTERVAL)
+
+async def dispatch_loop(mailbox):
+    while True:
+        next_at = mailbox.queue.next_send_at()
+        # An overdue reply waits for the window to open, not for its own send time
+        delay = None if next_at is None else next_send_time(max(next_at, time.time()), mailbox) - time.time()
+        if delay is None or delay > 0:
+            await _wait(mailbox.queue_changed, delay)
+            continue
+        await _run(dispatch_queue, mailbox)
+
+async def main(mailboxes=None, metrics_port=METRICS_PORT):
+    global _loop, _push_received
+    _loop = asyncio.get_running_loop()
+    _loop.set_default_executor(ThreadPoolExecutor(WORKERS, thread_name_prefix="agent"))
+    _push_received = asyncio.Event()
+    _mailboxes[:] = mailboxes or [get_default_mailbox()]
+
+    for mailbox in _mailboxes:
+        mailbox.draft_requested, mailbox.queue_changed = asyncio.Event(), asyncio.Event()
+        mailbox.fetch_requested = asyncio.Event()
+        # Pick up where the last run left off: pending replies are already in the
+        # queue database, and anything sent but not yet marked read is finished now.
+        print(f"{mailbox.label}Resuming with {len(mailbox.queue)} scheduled replies.")
+        await _run(recover_unfinished_sends, mailbox)
+
+    if metrics_port:
+        metrics.serve(metrics_port, METRICS_HOST)
+        print(f"Metrics at http://{METRICS_HOST}:{metrics_port}/metrics")
+
+    print("🤖 Agent started. Press Ctrl+C to stop.")
+    tasks = []
+    for mailbox in _mailboxes:
+        stagger = random.uniform(0, FETCH_STAGGER) if len(_mailboxes) > 1 else 0
+        tasks += [fetch_loop(mailbox, stagger), draft_loop(mailbox), dispatch_loop(mailbox)]
+    if USE_PUSH:
+        if mailboxes is None:
+            tasks.append(push_loop())
+        else:
+            print("Push mode only covers the EMAIL_ADDRESS mailbox; polling the configured mailboxes.")
+    if METRICS_LOG_INTERVAL:
+        tasks.append(metrics_log_loop())
+    await asyncio.gather(*tasks)
+
+def run_shard(path, index, count):
+    """
+    Serve worker `index` of `count`'s share of the mailboxes in `path`.
+    """
+    mailboxes = [Mailbox.from_config(entry) for entry in shard(load_mailboxes(path), index, count)]
+    print(f"Worker {index + 1}/{count} serving {len(mailboxes)} mailboxes.")
+    try:
+        asyncio.run(main(mailboxes, METRICS_PORT + index if METRICS_PORT else 0))
+    except KeyboardInterrupt:
+        pass
+
+def run_mailboxes(path, processes=PROCESSES):
+    """
+    Serve every mailbox in the config file `path`, sharded across
+    `processes` worker processes (metrics on METRICS_PORT + worker index).
+    Each worker runs all its mailboxes on one event loop and one pool of
+    WORKERS threads, reusing a single token and connection pool per tenant.
+    """
+    count = max(1, min(processes, len(load_mailboxes(path))))
+    if count == 1:
+        return run_shard(path, 0, 1)
+    # Workers re-read these at import: give each an equal slice of the OpenAI quota
+    os.environ["OPENAI_RPM"] = str(max(1, int(os.getenv("OPENAI_RPM", "500")) // count))
+    os.environ["OPENAI_TPM"] = str(max(1, int(os.getenv("OPENAI_TPM", "200000")) // count))
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_shard, args=(path, i, count), name=f"agent-{i}")
+               for i in range(count)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Ctrl+C in a terminal reaches the workers too; a supervisor may only signal us
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for worker in workers:
+            worker.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reply to new mail in one or many mailboxes.")
+    parser.add_argument("--mailboxes", default=MAILBOXES_PATH,
+                        help="mailbox config file (see mailboxes.py); default: EMAIL_ADDRESS only")
+    parser.add_argument("--processes", type=int, default=PROCESSES,
+                        help="worker processes to shard the mailboxes across")
+    args = parser.parse_args()
+
+    if args.mailboxes:
+        run_mailboxes(args.mailboxes, args.processes)
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,71 @@
+"""
+Benchmark for utils/body_text against the BeautifulSoup extraction it replaced.
+
+Generates large HTML newsletters (nested tables, inline styles, <style>
+blocks, comments, entities) and reports bodies/sec for BeautifulSoup,
+html_to_text, and extract_body_text on a repeat poll (served from the
+cache). That html_to_text gives the same text as BeautifulSoup's
+get_text('\\n', strip=True) is tested in tests/test_body_text.py.
+
+    python benchmarks/bench_body_text.py --bodies 200 --size-kb 150
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import body_text
+
+_WORDS = ("new drop this week shop the look members save &amp; more &nbsp; "
+          "limited edition &quot;bestseller&quot; free shipping over $50 a < b").split()
+
+def newsletter_html(size_kb: int, rng: random.Random) -> str:
+    parts = ["<!DOCTYPE html><html><head><meta charset='utf-8'>",
+             "<style>td{padding:0} .btn>a{color:#fff}</style>",
+             "<script>var t = '<b>not text</b>';</script></head><body>",
+             "<!-- preheader -->"]
+    while sum(len(p) for p in parts) < size_kb * 1024:
+        cells = "".join(
+            f"<td style=\"font-family:Arial;width:{rng.randint(10, 90)}%\" title='a>b'>"
+            f"<a href=\"https://example.com/p/{rng.randint(1, 9999)}\">"
+            + " ".join(rng.choice(_WORDS) for _ in range(rng.randint(3, 25)))
+            + "</a><br/></td>"
+            for _ in range(rng.randint(1, 4)))
+        parts.append(f"<table role=\"presentation\"><tr>{cells}</tr></table>\n")
+    parts.append("<p>Unsubscribe &copy; 2025</p></body></html>")
+    return "".join(parts)
+
+def bs4_text(content: str) -> str:
+    return BeautifulSoup(content, 'html.parser').get_text(separator='\n', strip=True)
+
+def rate(fn, items) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bodies", type=int, default=100)
+    parser.add_argument("--size-kb", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    bodies = [newsletter_html(args.size_kb, rng) for _ in range(args.bodies)]
+    messages = [{"id": str(i), "changeKey": "ck1", "body": {"contentType": "html", "content": b}}
+                for i, b in enumerate(bodies)]
+
+    print(f"{args.bodies} newsletters of ~{args.size_kb} KB")
+
+    soup_rate = rate(bs4_text, bodies)
+    fast_rate = rate(body_text.html_to_text, bodies)
+    rate(body_text.extract_body_text, messages)  # first poll fills the cache
+    cached_rate = rate(body_text.extract_body_text, messages)
+    print(f"BeautifulSoup:          {soup_rate:10.1f} bodies/sec")
+    print(f"html_to_text:           {fast_rate:10.1f} bodies/sec  ({fast_rate / soup_rate:.1f}x)")
+    print(f"extract_body_text, hit: {cached_rate:10.1f} bodies/sec  ({cached_rate / soup_rate:.0f}x)")
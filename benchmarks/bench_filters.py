@@ -0,0 +1,100 @@
+"""
+Parity check and microbenchmark for utils/filters.should_reply.
+
+Runs the original one-regex-search-per-pattern loop and the current
+FilterEngine over the same messages. Fails if any decision differs, then
+prints messages/sec for each.
+
+    python benchmarks/bench_filters.py                  # uses replies.jsonl
+    python benchmarks/bench_filters.py --synthetic 5000 # no export needed
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.filters import COMPILED_FILTERS, NO_REPLY_ADDRESSES, iter_messages, should_reply
+
+def legacy_should_reply(message: dict) -> tuple[bool, str]:
+    """
+    should_reply as it was before FilterEngine: one search per pattern.
+    """
+    subject = message.get('subject') or ''
+    body = message.get('body', '')
+    sender = message.get('from', '').lower()
+    for deny_addr in NO_REPLY_ADDRESSES:
+        if deny_addr in sender:
+            return False, 'Sender in deny list'
+    if not body.strip():
+        return False, 'Empty message body'
+    text_to_check = subject + '\n' + body
+    for pat, reason in COMPILED_FILTERS:
+        if pat.search(text_to_check):
+            return False, reason
+    return True, 'Genuine question'
+
+_WORDS = ("hi there i love your content what is included in the product how do i "
+          "access it after buying is there a student discount can you resend the link "
+          "thanks so much looking forward to it best regards").split()
+_TRIGGERS = ["I am Out of Office until Monday", "This is an automatic response",
+             "Thanks for your email, we will get back to you", "please UNSUBSCRIBE me",
+             "Your one-time passcode is 123456", "Je vous remercie pour votre message",
+             "Ich bin im Urlaub – ſcam alert", "Currently out with limited access"]
+
+def synthetic_messages(count: int, seed: int = 7) -> list:
+    """
+    Messages of mixed length (including long quoted threads), about a third
+    containing a filter trigger, some with non-ASCII text.
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        body = " ".join(rng.choice(_WORDS) for _ in range(rng.choice([40, 200, 1500])))
+        if rng.random() < 0.35:
+            words = body.split()
+            words.insert(rng.randrange(len(words) + 1), rng.choice(_TRIGGERS))
+            body = " ".join(words)
+        if rng.random() < 0.1:
+            body += " 🙂 café déjà vu"
+        messages.append({
+            "id": str(i),
+            "from": rng.choice(["fan@example.com", "no-reply@shop.example", "Someone@Mail.com"]),
+            "subject": rng.choice(["Question", "Re: your product", "Automatic reply: hi", ""]),
+            "body": body,
+        })
+    return messages
+
+def throughput(fn, messages, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for m in messages:
+            fn(m)
+    return repeat * len(messages) / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="replies.jsonl", help="export to check (JSON array or JSON Lines)")
+    parser.add_argument("--synthetic", type=int, help="use N generated messages instead of --input")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        messages, source = synthetic_messages(args.synthetic), f"{args.synthetic} synthetic messages"
+    else:
+        messages, source = list(iter_messages(args.input)), args.input
+
+    mismatches = [(m.get('id'), legacy_should_reply(m), should_reply(m))
+                  for m in messages if legacy_should_reply(m) != should_reply(m)]
+    if mismatches:
+        for mismatch in mismatches[:10]:
+            print("MISMATCH", mismatch, file=sys.stderr)
+        sys.exit(f"{len(mismatches)} of {len(messages)} decisions differ")
+    print(f"Parity OK on {source}")
+
+    before = throughput(legacy_should_reply, messages, args.repeat)
+    after = throughput(should_reply, messages, args.repeat)
+    print(f"legacy loop:   {before:10.0f} messages/sec")
+    print(f"FilterEngine:  {after:10.0f} messages/sec  ({after / before:.1f}x)")
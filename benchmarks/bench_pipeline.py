@@ -0,0 +1,376 @@
+"""
+End-to-end benchmarks for the reply pipeline, fully offline.
+
+Fills a synthetic mailbox (benchmarks/synthetic_mailbox.py) in the fake
+Graph from utils/fake_graph.py, points the generator at
+benchmarks/fake_openai.py, and runs one scenario per stage:
+
+    reader     graph_mail_reader.iter_unread_messages over the whole Inbox
+    sync       graph_mail_reader.iter_inbox_delta: full sync, incremental syncs
+               of new, read and deleted mail, and the full resync after a 410
+    filters    utils.filters.should_reply on every message
+    generator  gpt.generator.generate_replies against the fake OpenAI
+    agent      agent.py's fetch -> draft -> send cycle, mail arriving in --waves
+    push       agent.push_loop: new mail -> change notification -> enqueued
+
+Each scenario runs in its own process and reports items/sec, p50/p99
+latency per item and peak RSS; the exit code is non-zero if one crashed.
+Whether the pipeline does the right thing is tested in tests/ (pytest);
+these only measure how fast it does it.
+
+    python benchmarks/bench_pipeline.py                    # all scenarios
+    python benchmarks/bench_pipeline.py --quick            # small and fast, for CI
+    python benchmarks/bench_pipeline.py --scenario agent --messages 5000 \\
+        --graph-latency 0.02 --throttle-rate 0.05 --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+USER = "bench@example.com"
+SCENARIOS = ("reader", "sync", "filters", "generator", "agent", "push")
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _configure(args, graph=None, llm=None, tmp=None):
+    """
+    Point the project's modules at the fakes. Must run before they are
+    imported, since they read their settings at import time.
+    """
+    os.chdir(REPO_DIR)
+    os.environ.update({
+        "EMAIL_ADDRESS": USER,
+        "GRAPH_ACCESS_TOKEN": "fake",
+        "GRAPH_RPS": str(args.graph_rps),
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_RPM": "10000000",
+        "OPENAI_TPM": "1000000000",
+        "REPLY_CACHE_PATH": "",
+        "AGENT_QUEUE_DB": ":memory:",
+        "AGENT_METRICS_PORT": "0",
+    })
+    if graph is not None:
+        os.environ["GRAPH_BASE_URL"] = graph.base_url
+    if llm is not None:
+        os.environ["OPENAI_BASE_URL"] = llm.base_url
+    if tmp is not None:
+        os.environ["GRAPH_DELTA_LINK_PATH"] = os.path.join(tmp, "delta_link")
+
+
+def _mailbox_options(args):
+    return dict(html_ratio=args.html_ratio, thread_depth=args.thread_depth,
+                auto_reply_ratio=args.auto_reply_ratio, html_kb=args.html_kb, seed=args.seed)
+
+
+def _fake_graph(args):
+    from utils.fake_graph import FakeGraph
+    return FakeGraph(latency=args.graph_latency, throttle_rate=args.throttle_rate,
+                     retry_after=args.retry_after, seed=args.seed)
+
+
+def _fake_openai(args):
+    from fake_openai import FakeOpenAI
+    return FakeOpenAI(latency=args.llm_latency, jitter=args.llm_latency, throttle_rate=args.llm_throttle_rate,
+                      retry_after=args.retry_after, seed=args.seed)
+
+
+def run_reader(args):
+    from synthetic_mailbox import fill_mailbox
+    with _fake_graph(args) as graph:
+        fill_mailbox(graph, USER, args.messages, **_mailbox_options(args))
+        _configure(args, graph=graph)
+        from graph_mail_reader import iter_unread_messages
+
+        latencies = []
+        start = last = time.perf_counter()
+        for _ in iter_unread_messages():
+            now = time.perf_counter()
+            latencies.append(now - last)  # wait for each message, page fetches included
+            last = now
+        elapsed = time.perf_counter() - start
+        return {"items": len(latencies), "seconds": elapsed, "latencies": latencies,
+                "notes": f"{graph.throttled} throttled"}
+
+
+def run_sync(args):
+    from synthetic_mailbox import fill_mailbox
+    with _fake_graph(args) as graph, tempfile.TemporaryDirectory() as tmp:
+        fill_mailbox(graph, USER, args.messages, **_mailbox_options(args))
+        _configure(args, graph=graph, tmp=tmp)
+        from graph_mail_reader import iter_inbox_delta
+
+        latencies = []
+
+        def sync():
+            start = time.perf_counter()
+            changes = list(iter_inbox_delta())
+            took = time.perf_counter() - start
+            latencies.extend([took / max(1, len(changes))] * len(changes))
+            return changes
+
+        start = time.perf_counter()
+        ids = [m["id"] for m in sync()]
+        step = max(1, len(ids) // 10)
+        for i in range(5):
+            graph.add_message(USER, subject=f"New {i}", body="Is the course still open?")
+        for mid in ids[::step][:5]:
+            graph.update_message(USER, mid, isRead=True)
+        for mid in ids[1::step][:5]:
+            graph.delete_message(USER, mid)
+        sync()  # incremental
+        sync()  # nothing changed
+        # Graph drops old sync state: the stored link gets 410 and a full resync follows
+        graph.expire_delta_tokens()
+        sync()
+        elapsed = time.perf_counter() - start
+        return {"items": len(latencies), "seconds": elapsed, "latencies": latencies,
+                "notes": f"{len(graph.requests)} Graph requests"}
+
+
+def run_filters(args):
+    from synthetic_mailbox import generate_messages
+    _configure(args)
+    from utils.body_text import extract_body_text
+    from utils.filters import should_reply
+
+    messages = []
+    for m in generate_messages(args.messages, **_mailbox_options(args)):
+        graph_message = {"subject": m["subject"], "from": {"emailAddress": {"address": m["sender"]}},
+                         "body": {"contentType": m["content_type"], "content": m["body"]}}
+        graph_message["full_body_text"] = extract_body_text(graph_message)
+        messages.append(graph_message)
+
+    latencies, replies = [], 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for m in messages:
+            t = time.perf_counter()
+            reply, _ = should_reply(m)
+            latencies.append(time.perf_counter() - t)
+            replies += reply
+    elapsed = time.perf_counter() - start
+    return {"items": len(latencies), "seconds": elapsed, "latencies": latencies,
+            "notes": f"{replies // args.repeat} of {len(messages)} need a reply"}
+
+
+def run_generator(args):
+    from synthetic_mailbox import generate_messages
+    with _fake_openai(args) as llm:
+        _configure(args, llm=llm)
+        import gpt.generator as generator
+        generator.get_client()  # built on first use; keep the SDK import out of the timings
+
+        latencies = []
+        generate_reply = generator.generate_reply
+
+        def timed(*a, **kw):
+            t = time.perf_counter()
+            try:
+                return generate_reply(*a, **kw)
+            finally:
+                latencies.append(time.perf_counter() - t)
+
+        generator.generate_reply = timed
+        bodies = [(i, m["body"]) for i, m in enumerate(generate_messages(
+            args.messages, **dict(_mailbox_options(args), html_ratio=0, auto_reply_ratio=0)))]
+        start = time.perf_counter()
+        results = list(generator.generate_replies(bodies))
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for _, _, error in results if error is not None)
+        return {"items": len(results), "seconds": elapsed, "latencies": latencies,
+                "notes": f"{llm.requests} API calls, {llm.throttled} throttled, {failed} failed"}
+
+
+def run_agent(args):
+    from synthetic_mailbox import generate_messages
+    messages = list(generate_messages(args.messages, **_mailbox_options(args)))
+    with _fake_graph(args) as graph, _fake_openai(args) as llm, tempfile.TemporaryDirectory() as tmp:
+        _configure(args, graph=graph, llm=llm, tmp=tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            import agent
+        from gpt.generator import get_client
+        get_client()  # as in run_generator
+        agent.MIN_DELAY = agent.MAX_DELAY = 0
+        agent.START_HOUR, agent.END_HOUR = 0, 24
+        agent.DRAFT_BATCH = len(messages)  # jobs run once per wave here, not re-woken by the runtime
+
+        latencies, elapsed = [], 0.0
+        wave_size = -(-len(messages) // args.waves)
+        for offset in range(0, len(messages), wave_size):
+            wave = messages[offset:offset + wave_size]
+            for m in wave:
+                graph.add_message(USER, **m)
+            # New mail has arrived; time until every reply to it is out
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                agent.enqueue_replies()
+                agent.draft_pending()
+                agent.dispatch_queue()
+            took = time.perf_counter() - start
+            elapsed += took
+            latencies.extend([took] * len(wave))
+
+        return {"items": len(messages), "seconds": elapsed, "latencies": latencies,
+                "notes": f"{len(graph.sent_mail)} replies, {llm.requests} LLM calls, "
+                         f"{graph.throttled} Graph 429s"}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _until(condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+def run_push(args):
+    with _fake_graph(args) as graph, tempfile.TemporaryDirectory() as tmp:
+        _configure(args, graph=graph, tmp=tmp)
+        port = _free_port()
+        os.environ.update({
+            "GRAPH_WEBHOOK_HOST": "127.0.0.1",
+            "GRAPH_WEBHOOK_PORT": str(port),
+            "GRAPH_NOTIFICATION_URL": f"http://127.0.0.1:{port}/notifications",
+        })
+        with contextlib.redirect_stdout(io.StringIO()):
+            import agent
+        return asyncio.run(_push_scenario(args, graph, agent))
+
+
+async def _push_scenario(args, graph, agent):
+    agent._loop = asyncio.get_running_loop()
+    agent._push_received = asyncio.Event()
+    mailbox = agent.get_default_mailbox()
+    mailbox.draft_requested, mailbox.queue_changed = asyncio.Event(), asyncio.Event()
+    mailbox.fetch_requested = asyncio.Event()
+    queue = mailbox.queue
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        task = asyncio.create_task(agent.push_loop())
+        try:
+            if not await _until(lambda: graph.subscriptions):
+                raise RuntimeError("push_loop never subscribed")
+
+            # New mail -> notification -> fetched by id -> enqueued
+            added = []
+            start = time.perf_counter()
+            for i in range(args.messages):
+                graph.add_message(USER, subject=f"Question {i}", sender=f"fan{i}@example.com",
+                                  body="Hi! What is included in the course and how long do I have access?")
+                added.append(time.perf_counter())
+            latencies = []
+            while len(latencies) < len(added):
+                if not await _until(lambda: len(queue) > len(latencies)):
+                    raise RuntimeError(f"{len(added) - len(latencies)} notified messages never enqueued")
+                now = time.perf_counter()
+                latencies += [now - t for t in added[len(latencies):len(queue)]]
+            elapsed = time.perf_counter() - start
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    return {"items": len(latencies), "seconds": elapsed, "latencies": latencies,
+            "notes": f"{len(graph.notifications)} notifications posted"}
+
+
+def child(args):
+    result = globals()["run_" + args.child](args)
+    latencies = result.pop("latencies")
+    result.update(scenario=args.child,
+                  per_second=result["items"] / result["seconds"] if result["seconds"] else None,
+                  p50_ms=_ms(percentile(latencies, 0.50)), p99_ms=_ms(percentile(latencies, 0.99)),
+                  peak_rss_mb=round(peak_rss_mb(), 1))
+    print(json.dumps(result))
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def main(args, argv):
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    for scenario in scenarios:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--child", scenario],
+                              capture_output=True, text=True)
+        lines = proc.stdout.strip().splitlines()
+        try:
+            results.append(json.loads(lines[-1]))
+        except (IndexError, ValueError):
+            results.append({"scenario": scenario, "error": proc.stderr.strip()[-2000:] or "no output"})
+
+    print(f"{'scenario':<10} {'items':>7} {'items/sec':>11} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS':>9}  notes")
+    for r in results:
+        if "items" not in r:
+            print(f"{r['scenario']:<10} FAILED: {r['error']}")
+            continue
+        print(f"{r['scenario']:<10} {r['items']:>7} {r['per_second']:>11.1f} {r['p50_ms']:>9.3f} "
+              f"{r['p99_ms']:>9.3f} {r['peak_rss_mb']:>7.1f}MB  {r['notes']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--html-ratio", type=float, default=0.5)
+    parser.add_argument("--html-kb", type=int, default=20, help="approximate size of HTML bodies")
+    parser.add_argument("--thread-depth", type=float, default=1.5, help="average messages per thread")
+    parser.add_argument("--auto-reply-ratio", type=float, default=0.2)
+    parser.add_argument("--graph-latency", type=float, default=0.005, help="seconds per Graph request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Graph requests answered 429")
+    parser.add_argument("--graph-rps", type=float, default=1_000_000, help="client-side Graph request budget")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per completion (plus jitter)")
+    parser.add_argument("--llm-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with injected 429s")
+    parser.add_argument("--waves", type=int, default=5, help="batches the agent's mail arrives in")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the mailbox for the filters scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="small sizes, for CI")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.quick:
+        args.messages, args.waves, args.llm_latency, args.html_kb = min(args.messages, 200), 2, 0.01, 5
+
+    if args.child:
+        child(args)
+    else:
+        sys.exit(main(args, [a for a in sys.argv[1:] if a != "--child"]))
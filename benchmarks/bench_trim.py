@@ -0,0 +1,32 @@
+"""
+Benchmark for gpt.generator.trim_email_body: bodies/sec over a synthetic
+mailbox. What it must and must not cut is tested in tests/test_trim.py.
+
+    python benchmarks/bench_trim.py --bodies 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from gpt.generator import trim_email_body
+from synthetic_mailbox import generate_messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark trim_email_body.")
+    parser.add_argument("--bodies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bodies = [m["body"] for m in generate_messages(args.bodies, html_ratio=0)]
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for body in bodies:
+            trim_email_body(body)
+    elapsed = time.perf_counter() - start
+    print(f"trim_email_body: {len(bodies) * args.repeat / elapsed:,.0f} bodies/sec")
@@ -0,0 +1,127 @@
+"""
+A local stand-in for the OpenAI chat-completions endpoint, so the generator
+and the agent can be benchmarked (or run) without network access or cost.
+
+    python benchmarks/fake_openai.py --port 8766 --latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=fake python agent.py
+
+Every request waits `latency` seconds (plus up to `jitter` more) and gets a
+short canned reply with a usage block. A `throttle_rate` fraction of
+requests is answered 429 with a retry-after header instead.
+"""
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Hi! Thanks so much for reaching out. The course includes lifetime access, "
+         "and you can find everything in your member area. Let me know if anything is unclear!")
+
+
+class FakeOpenAI:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def complete(self, body):
+        """Returns (status, json_body, headers) for one chat completion request."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.random() * self.jitter
+            throttle = self._rng.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+        if throttle:
+            return 429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                   "code": "rate_limit_exceeded"}}, {"retry-after": str(self.retry_after)}
+        time.sleep(delay)
+        prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4 + 1
+        completion_tokens = len(REPLY) // 4 + 1
+        return 200, {
+            "id": "chatcmpl-" + uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": REPLY}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }, {}
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; without this, Nagle
+            # plus delayed ACKs add ~40 ms to every keep-alive request
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/").endswith("/chat/completions"):
+                status, data, headers = fake.complete(body)
+            else:
+                status, data, headers = 404, {"error": {"message": f"Unknown path {self.path}"}}, {}
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat-completions server.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(port=args.port, latency=args.latency, jitter=args.jitter,
+                      throttle_rate=args.throttle_rate)
+    print(f"Fake OpenAI listening on {fake.base_url}")
+    fake._server.serve_forever()
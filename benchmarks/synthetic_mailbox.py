@@ -0,0 +1,129 @@
+"""
+Synthetic mailboxes for benchmarks: fan questions, follow-ups in the same
+thread, quoted history and signatures, auto-replies and no-reply senders,
+as plain text or wrapped in newsletter-style HTML.
+
+    from synthetic_mailbox import fill_mailbox
+    stats = fill_mailbox(graph, "bench@example.com", size=1000, html_ratio=0.5)
+
+or print a sample:
+
+    python benchmarks/synthetic_mailbox.py --size 5
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+_QUESTIONS = [
+    "Hi! I love your content. What is included in the course and how long do I have access?",
+    "Hello, I bought the bundle yesterday but never got the download link. Can you resend it?",
+    "Is there a student discount? I'd love to join but money is tight this month.",
+    "Quick question: does the membership renew automatically, and how do I cancel?",
+    "Can I use the templates for client work or only for personal projects?",
+    "Will there be a live Q&A this month? I have a few questions about module 3.",
+]
+_FOLLOW_UPS = [
+    "Just following up on my message below, any news?",
+    "Sorry, one more thing: I'm on the annual plan if that matters.",
+    "Never mind the link, I found it, but the second question still stands!",
+]
+_AUTO_REPLIES = [
+    ("Automatic reply: {subject}", "I am out of the office until Monday with limited access to email."),
+    ("Out of Office: {subject}", "Thanks for your email, we will get back to you within 2 business days."),
+    ("Your order confirmation", "Your one-time passcode is {code}. Do not share it with anyone."),
+]
+_NO_REPLY_SENDERS = ["no-reply@shop.example", "noreply@newsletter.example", "mailer-daemon@example.com"]
+_SIGNATURE = "\n\nThanks,\n{name}\n--\nSent from my iPhone"
+_QUOTE = "\n\nOn Mon, Jun 2, 2025 at 9:14 AM Support <support@example.com> wrote:\n> Thanks for your order!\n> " + \
+         "\n> ".join(["Here is everything you need to get started."] * 6)
+
+
+def _text_body(rng, question, name):
+    body = question + " " + " ".join(rng.choice(_QUESTIONS).split()[:rng.randint(3, 12)])
+    if rng.random() < 0.6:
+        body += _SIGNATURE.format(name=name)
+    if rng.random() < 0.4:
+        body += _QUOTE
+    return body
+
+
+def _html_body(rng, text, size_kb):
+    """Wrap text in table-heavy, inline-styled markup padded to ~size_kb."""
+    paragraphs = "".join(f"<p style=\"margin:0 0 12px;font-family:Arial\">{line}</p>"
+                         for line in text.split("\n") if line.strip())
+    parts = ["<html><head><style>td{padding:0}</style></head><body>",
+             f"<table role=\"presentation\" width=\"100%\"><tr><td>{paragraphs}</td></tr></table>"]
+    filler = "<table><tr><td style=\"color:#999;font-size:10px\">&nbsp;</td></tr></table>"
+    padding = max(0, size_kb * 1024 - sum(map(len, parts))) // len(filler)
+    parts.append("<!-- layout -->" + filler * padding + "</body></html>")
+    return "".join(parts)
+
+
+def generate_messages(size, html_ratio=0.5, thread_depth=1.5, auto_reply_ratio=0.2,
+                      html_kb=20, seed=0):
+    """
+    Yield `size` add_message() keyword dicts. Threads have 1 to
+    2 * thread_depth - 1 messages (thread_depth on average), from one sender.
+    An `auto_reply_ratio` fraction are auto-replies or no-reply senders.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    produced = thread_no = 0
+    while produced < size:
+        thread_no += 1
+        name = f"fan{thread_no}"
+        sender = f"{name}@example.com"
+        subject = f"Question #{thread_no}"
+        depth = 1 if thread_depth <= 1 else rng.randint(1, max(1, round(2 * thread_depth - 1)))
+        conversation_id = f"conv-{thread_no}"
+        for position in range(min(depth, size - produced)):
+            received = start + timedelta(minutes=produced)
+            if rng.random() < auto_reply_ratio:
+                if rng.random() < 0.5:
+                    fmt_subject, body = rng.choice(_AUTO_REPLIES)
+                    subject_line = fmt_subject.format(subject=subject)
+                    body = body.format(code=rng.randint(100000, 999999))
+                    msg_sender = sender
+                else:
+                    subject_line, body = "Your weekly digest", _text_body(rng, rng.choice(_QUESTIONS), "Team")
+                    msg_sender = rng.choice(_NO_REPLY_SENDERS)
+            else:
+                question = rng.choice(_FOLLOW_UPS) if position else rng.choice(_QUESTIONS)
+                subject_line = ("Re: " if position else "") + subject
+                body = _text_body(rng, f"{question} (ref {thread_no}-{position})", name)
+                msg_sender = sender
+            html = rng.random() < html_ratio
+            yield {
+                "subject": subject_line,
+                "body": _html_body(rng, body, html_kb) if html else body,
+                "sender": msg_sender,
+                "content_type": "html" if html else "text",
+                "conversationId": conversation_id,
+                "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            produced += 1
+
+
+def fill_mailbox(graph, user, size, **options):
+    """
+    Add generate_messages(size, **options) to a FakeGraph mailbox.
+    Returns {"messages", "threads"}.
+    """
+    conversations = set()
+    for message in generate_messages(size, **options):
+        conversations.add(message["conversationId"])
+        graph.add_message(user, **message)
+    return {"messages": size, "threads": len(conversations)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a sample synthetic mailbox.")
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--html-ratio", type=float, default=0.0)
+    parser.add_argument("--thread-depth", type=float, default=1.5)
+    parser.add_argument("--auto-reply-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+    for m in generate_messages(args.size, html_ratio=args.html_ratio, thread_depth=args.thread_depth,
+                               auto_reply_ratio=args.auto_reply_ratio, html_kb=1):
+        print(f"[{m['conversationId']}] {m['sender']}: {m['subject']}\n{m['body'][:300]}\n")
@@ -1,21 +1,23 @@
 # draft_replies.py
 
-from graph_mail_reader import graph_mail_reader  # our function that returns `data`
-from gpt.generator import generate_reply
+from graph_mail_reader import iter_unread_messages  # yields message dicts page by page
+from gpt.generator import generate_reply, trim_email_body
 
 def main():
-    # 1) Fetch unread messages from Graph
-    unread = graph_mail_reader()  # returns a list of message dicts
-
-    print(f"\nGenerating drafts for {len(unread)} messages…\n")
-    for msg in unread:
-        body_snippet = msg.get("bodyPreview") or ""
-        draft = generate_reply(body_snippet)
+    # 1) Fetch unread messages from Graph, drafting as each page arrives
+    print("\nGenerating drafts for unread messages…\n")
+    count = 0
+    for msg in iter_unread_messages():
+        count += 1
+        # Draft from what the sender wrote, as agent.py does
+        body_text = trim_email_body(msg.get("full_body_text", ""))
+        draft = generate_reply(body_text)
         print("──────────────────────────────────────")
         print(f"To:      {msg['from']['emailAddress']['address']}")
         print(f"Subject: Re: {msg['subject']}")
         print("Draft Reply:")
         print(draft, "\n")
+    print(f"Drafted {count} replies.")
 
 if __name__ == "__main__":
     main()
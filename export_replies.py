@@ -1,30 +1,147 @@
 # export_replies.py
 
+import argparse
+import gzip
 import json
-from graph_mail_reader import graph_mail_reader
 import os
+from graph_mail_reader import iter_message_pages, message_query
 
-def export_to_json(path="replies.json", limit=500):
+EXPORT_PAGE_SIZE = 100
+
+
+def _record(m):
+    return {
+        "id": m.get("id"),
+        "receivedDateTime": m.get("receivedDateTime"),
+        "isRead": m.get("isRead"),
+        "conversationId": m.get("conversationId"),
+        "from": ((m.get("from") or {}).get("emailAddress") or {}).get("address", ""),
+        "subject": m.get("subject", ""),
+        "body": m.get("full_body_text", ""),
+    }
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(state, path):
     """
-    Fetch up to `limit` unread messages and dump them to a JSON file.
+    Write the checkpoint atomically, like save_delta_link().
     """
-    msgs = graph_mail_reader()[:limit]  # take first 500
-    # We only need the fields you care about—subject, from, snippet, id
-    simple = [
-        {
-            "from":  m["from"]["emailAddress"]["address"],
-            "subject": m.get("subject",""),
-            "body": m.get("full_body_text","")
-        }
-        for m in msgs
-    ]
-    full_path = os.path.abspath(path)
-    with open(path, "w") as f:
-        json.dump(simple, f, indent=2)
-    print(f"Exported {len(simple)} messages to {full_path}")
-    
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
 
-if __name__ == "__main__":
-    export_to_json()
 
+def export_jsonl(path="replies.jsonl", limit=None, unread_only=True, received_after=None,
+                 received_before=None, checkpoint=None, compress=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Stream Inbox messages to a JSON Lines file, one message per line, page
+    by page, so memory stays flat however large the export is. Only unread
+    mail unless unread_only=False; received_after/received_before bound
+    receivedDateTime (ISO 8601). `limit` caps the export and is passed to
+    Graph as $top, so no more than needed is downloaded.
+
+    compress gzips the output (default: when path ends in .gz); every page
+    is its own gzip member, which gzip readers concatenate transparently.
+
+    With a `checkpoint` path, the next page link and the output size are
+    saved after each page. Rerunning with the same arguments picks up where
+    an interrupted export stopped: the file is cut back to the last
+    complete page and the export continues from the saved link. The
+    checkpoint is deleted once the export completes, so the next run
+    exports afresh. Returns the number of messages in the file.
+    """
+    if compress is None:
+        compress = path.endswith(".gz")
+    if limit is not None:
+        page_size = max(1, min(page_size, limit))
+    query = message_query(unread_only, received_after, received_before, page_size)
+
+    state = _load_checkpoint(checkpoint) if checkpoint else None
+    if state is not None and state.get("query") != query:
+        raise ValueError(f"{checkpoint} belongs to a different export; delete it to start over")
+    if state is None or state["next_link"] is None or not os.path.exists(path):
+        state = {"query": query, "next_link": query, "exported": 0, "offset": 0}
+
+    exported = state["exported"]
+    with open(path, "r+b" if state["offset"] else "wb") as f:
+        f.truncate(state["offset"])  # drop a page that was cut off mid-write
+        f.seek(state["offset"])
+        # No prefetching under a limit: the page after the last one needed is never fetched
+        for messages, next_link in iter_message_pages(state["next_link"], prefetch=limit is None):
+            lines = []
+            for m in messages:
+                if limit is not None and exported >= limit:
+                    break
+                lines.append(json.dumps(_record(m), ensure_ascii=False) + "\n")
+                exported += 1
+            if limit is not None and exported >= limit:
+                next_link = None
+            data = "".join(lines).encode("utf-8")
+            f.write(gzip.compress(data) if compress and data else data)
+            if checkpoint:
+                f.flush()
+                os.fsync(f.fileno())
+                state.update(next_link=next_link, exported=exported, offset=f.tell())
+                _save_checkpoint(state, checkpoint)
+            if next_link is None:
+                break
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)  # complete; there is nothing to resume
+    print(f"Exported {exported} messages to {os.path.abspath(path)}")
+    return exported
+
+
+def export_to_json(path="replies.json", limit=500, unread_only=True, received_after=None,
+                   received_before=None):
+    """
+    Fetch up to `limit` messages (unread only unless unread_only=False,
+    within the optional receivedDateTime bounds) and write them as a JSON
+    array of from/subject/body, one message at a time. utils/filters.py
+    and prompt.py read this as well as JSON Lines.
+    """
+    count = 0
+    query = message_query(unread_only, received_after, received_before,
+                          page_size=max(1, min(limit, EXPORT_PAGE_SIZE)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for messages, next_link in iter_message_pages(query, prefetch=False):
+            for m in messages:
+                if count >= limit:
+                    break
+                record = {k: v for k, v in _record(m).items() if k in ("from", "subject", "body")}
+                f.write(("\n" if count == 0 else ",\n") + json.dumps(record, indent=2))
+                count += 1
+            if count >= limit or next_link is None:
+                break
+        f.write("\n]\n")
+    print(f"Exported {count} messages to {os.path.abspath(path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Inbox messages to JSON Lines.")
+    parser.add_argument("path", nargs="?", default="replies.jsonl",
+                        help="output file; .gz is gzip-compressed, .json writes a JSON array")
+    parser.add_argument("--limit", type=int, help="at most this many messages")
+    parser.add_argument("--all", action="store_true", help="include read mail")
+    parser.add_argument("--since", help="received at or after this time, e.g. 2025-01-01T00:00:00Z")
+    parser.add_argument("--until", help="received before this time")
+    parser.add_argument("--checkpoint", help="resume state file, deleted once the export completes "
+                                             "(default: PATH.checkpoint)")
+    parser.add_argument("--no-checkpoint", action="store_true")
+    args = parser.parse_args()
 
+    if args.path.endswith(".json"):
+        export_to_json(args.path, args.limit or 500, unread_only=not args.all,
+                       received_after=args.since, received_before=args.until)
+    else:
+        export_jsonl(args.path, args.limit, unread_only=not args.all,
+                     received_after=args.since, received_before=args.until,
+                     checkpoint=None if args.no_checkpoint else (args.checkpoint or args.path + ".checkpoint"))
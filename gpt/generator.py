@@ -1,32 +1,323 @@
 # gpt/generator.py
 
 import os
-from openai import OpenAI
+import re
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
+from utils.rate_limit import TokenBucket
+from utils.resilience import ServiceGuard, retry_after_seconds
+from utils.metrics import counter, gauge, histogram
+from gpt.reply_cache import ReplyCache
 
 # 1. Load keys
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 
-# 2. Init new client
-client = OpenAI(api_key=api_key)
+# 2. The client, prompt and reply cache are built on first use (see
+#    get_client() etc. below), so importing this module stays cheap.
+SYSTEM_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "prompts", "system_prompt_template.txt")
 
-# 3. Load your brand prompt
-with open("gpt/prompts/system_prompt_template.txt", "r") as f:
-    SYSTEM_PROMPT = f.read()
+_client = _system_prompt = _reply_cache = None
+_init_lock = threading.Lock()
 
-def generate_reply(email_body: str) -> str:
+def get_client():
+    """
+    The shared OpenAI client, created on first call. Retries are done by
+    _openai below, so the SDK's own are off and throttling waits are
+    shared across worker threads.
+    """
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                from openai import OpenAI  # ~1 s to import; only when a reply is drafted
+                _client = OpenAI(api_key=api_key, max_retries=0)
+    return _client
+
+def get_system_prompt() -> str:
+    """
+    Your brand prompt, read from SYSTEM_PROMPT_PATH on first call.
+    """
+    global _system_prompt
+    if _system_prompt is None:
+        with open(SYSTEM_PROMPT_PATH, "r") as f:
+            _system_prompt = f.read()
+    return _system_prompt
+
+MODEL = "gpt-4.1-nano"
+MAX_REPLY_TOKENS = 1000
+# Cap on how much of the incoming email is sent to the model
+MAX_INPUT_TOKENS = int(os.getenv("OPENAI_MAX_INPUT_TOKENS", "1500"))
+
+# 4. Concurrency and quota for generate_replies(). Set these to your
+#    account's rate limits so bursts are spread out instead of rejected.
+MAX_WORKERS         = int(os.getenv("OPENAI_MAX_WORKERS", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM", "500"))
+TOKENS_PER_MINUTE   = int(os.getenv("OPENAI_TPM", "200000"))
+
+_token_budget = TokenBucket(rate=TOKENS_PER_MINUTE / 60, capacity=TOKENS_PER_MINUTE)
+
+def _openai_outcome(result, error):
+    """
+    classify() for OpenAI calls (see utils/resilience.ServiceGuard).
+    """
+    if error is None:
+        return None
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        if getattr(error, "code", None) == "insufficient_quota":
+            return None  # out of credit; waiting won't help
+        return "throttled", retry_after_seconds(error.response.headers.get("retry-after"))
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return "failed", None
+    return None
+
+# Requests-per-minute budget, retries with backoff and circuit breaking
+_openai = ServiceGuard("openai", _openai_outcome, rate=REQUESTS_PER_MINUTE / 60,
+                       burst=REQUESTS_PER_MINUTE,
+                       max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")))
+
+# 5. Cache of replies to repeated questions (see gpt/reply_cache.py).
+#    REPLY_CACHE_PATH="" keeps it in memory only.
+def get_reply_cache() -> ReplyCache:
+    """
+    The shared reply cache, loaded from REPLY_CACHE_PATH on first call and
+    saved at exit.
+    """
+    global _reply_cache
+    if _reply_cache is None:
+        with _init_lock:
+            if _reply_cache is None:
+                cache = ReplyCache(
+                    path=os.getenv("REPLY_CACHE_PATH", "reply_cache.json") or None,
+                    max_entries=int(os.getenv("REPLY_CACHE_SIZE", "2000")),
+                    ttl=float(os.getenv("REPLY_CACHE_TTL_HOURS", "168")) * 3600,
+                    near_duplicates=os.getenv("REPLY_CACHE_NEAR_DUPLICATES", "0") == "1",
+                    variants=int(os.getenv("REPLY_CACHE_VARIANTS", "1")),
+                )
+                atexit.register(cache.save)
+                _reply_cache = cache
+    return _reply_cache
+
+_REPLIES = counter("llm_replies_total", "generate_reply() calls by outcome (generated, cached, error)",
+                   ["outcome"])
+_LLM_SECONDS = histogram("llm_request_seconds", "OpenAI chat completion latency, retries included")
+_LLM_TOKENS = counter("llm_tokens_total", "Tokens used as reported by OpenAI", ["kind"])
+gauge("reply_cache_entries", "Replies held in the reply cache",
+      fn=lambda: len(_reply_cache) if _reply_cache is not None else 0)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token for English text).
+    """
+    return len(text) // 4 + 1
+
+# --- Input trimming: keep what the sender wrote, drop history and footers ---
+
+# Start of quoted history. Gmail-style "On <date>, <name> wrote:" may wrap
+# over a couple of lines, so it is matched against a small window of lines.
+_QUOTE_HEADER_RE = re.compile(
+    r"^(On\b.{0,300}?\bwrote:|Le\b.{0,300}?\ba écrit\s?:|Am\b.{0,300}?\bschrieb.{0,100}?:)\s*$",
+    re.IGNORECASE | re.DOTALL)
+_ORIGINAL_MESSAGE_RE = re.compile(r"^-{2,}\s*(Original|Forwarded) Message\s*-{2,}", re.IGNORECASE)
+_OUTLOOK_RULE_RE = re.compile(r"^_{10,}\s*$")
+_OUTLOOK_HEADER_RE = re.compile(r"^\*?(From|De|Von):\*?\s", re.IGNORECASE)
+_OUTLOOK_FIELD_RE = re.compile(r"^\*?(Sent|Date|To|Subject|Envoyé|Gesendet):\*?\s", re.IGNORECASE)
+
+# Start of a signature or footer
+_SIGNATURE_RE = re.compile(
+    r"^(--\s*$"
+    r"|Sent from my \w+"
+    r"|Get Outlook for \w+"
+    r"|Sent from (Outlook|Mail for Windows|Yahoo Mail)"
+    r"|(CONFIDENTIALITY|DISCLAIMER|LEGAL) NOTICE"
+    r"|This (e-?mail|message)( and any attachments)? (is|are|may be) (confidential|intended))",
+    re.IGNORECASE)
+# A sign-off on its own line ("Thanks," / "Best regards"); the name, title
+# and contact block after it are dropped when it's near the end
+_SIGN_OFF_RE = re.compile(
+    r"^(thanks|thank you|thx|cheers|best|best regards|kind regards|warm regards|regards|"
+    r"sincerely|all the best|xo|xoxo|love)[\s,.!]*$", re.IGNORECASE)
+_SIGN_OFF_WINDOW = 8  # lines from the end where a sign-off may start the signature
+_SIGNATURE_LINE_CHARS = 60  # longer lines after a sign-off are message text, not a signature
+# Lines starting like this are the sender talking, not a name or title
+_SENTENCE_START_RE = re.compile(
+    r"^(i|i'm|i've|we|my|our|can|could|would|will|is|are|do|does|did|when|what|where|how|why|"
+    r"please|also|just|p\.?s)\b", re.IGNORECASE)
+
+def _is_signature_block(lines):
+    """
+    Whether the lines after a sign-off are a name/contact block and not
+    more of the message ("Thanks!" followed by the actual question): short
+    lines, none of them a question or a sentence.
+    """
+    for line in lines:
+        line = line.strip()
+        words = line.split()
+        if "?" in line or len(line) > _SIGNATURE_LINE_CHARS or len(words) > 7:
+            return False
+        if len(words) >= 4 and line[-1] in ".!":
+            return False
+        if len(words) >= 3 and _SENTENCE_START_RE.match(line):
+            return False
+    return True
+
+def _quote_start(lines, i):
+    line = lines[i].strip()
+    if line.startswith(">"):
+        return True
+    if _ORIGINAL_MESSAGE_RE.match(line) or _OUTLOOK_RULE_RE.match(line):
+        return True
+    if _OUTLOOK_HEADER_RE.match(line):
+        following = [l.strip() for l in lines[i + 1:i + 5]]
+        return sum(bool(_OUTLOOK_FIELD_RE.match(l)) for l in following) >= 2
+    if line[:3].lower() in ("on ", "le ", "am "):
+        return bool(_QUOTE_HEADER_RE.match(" ".join(l.strip() for l in lines[i:i + 3])) or
+                    _QUOTE_HEADER_RE.match(line))
+    return False
+
+def trim_email_body(text: str, max_tokens: int = MAX_INPUT_TOKENS) -> str:
+    """
+    Reduce an email to what the sender actually wrote: cut everything from
+    the first quoted-history marker ("On ... wrote:", ">" lines, Outlook
+    "From:/Sent:" headers, "Original Message" rules) and from the start of
+    the signature or legal footer, then cap the result at `max_tokens`.
+    A sign-off line only starts the signature if what follows it is a
+    short name/contact block, not more of the message.
+    Falls back to the untrimmed text if nothing would be left.
+    """
+    lines = text.splitlines()
+    end = len(lines)
+    for i in range(len(lines)):
+        if _quote_start(lines, i):
+            end = i
+            break
+    lines = lines[:end]
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _SIGNATURE_RE.match(stripped):
+            lines = lines[:i]
+            break
+        if (_SIGN_OFF_RE.match(stripped) and len(lines) - i <= _SIGN_OFF_WINDOW
+                and _is_signature_block(lines[i + 1:])):
+            lines = lines[:i + 1]
+            break
+
+    trimmed = "\n".join(lines).strip() or text.strip()
+    max_chars = max_tokens * 4
+    if len(trimmed) > max_chars:
+        cut = trimmed.rfind(" ", 0, max_chars)
+        trimmed = trimmed[:cut if cut > max_chars // 2 else max_chars].rstrip() + " …"
+    return trimmed
+
+def _with_thread_context(email_body: str, thread_context) -> str:
+    """
+    The latest message followed by earlier messages of the same thread,
+    keeping the most recent ones that fit in MAX_INPUT_TOKENS.
+    """
+    budget = MAX_INPUT_TOKENS - estimate_tokens(email_body)
+    earlier = []
+    for text in reversed(thread_context):
+        text = trim_email_body(text)
+        budget -= estimate_tokens(text)
+        if budget < 0:
+            break
+        earlier.insert(0, text)
+    if not earlier:
+        return email_body
+    return ("Latest message:\n" + email_body +
+            "\n\nEarlier messages in this thread (oldest first):\n\n" + "\n\n---\n\n".join(earlier))
+
+def complete(messages, model: str = MODEL, max_tokens: int = MAX_REPLY_TOKENS, **kwargs) -> str:
+    """
+    One chat completion within the shared requests/tokens-per-minute
+    budgets, with retries (see utils/resilience.py). Returns the reply
+    text. Other OpenAI callers (e.g. prompt.py) use this so they share the
+    agent's quota handling.
+    """
+    reserved = sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+    _token_budget.acquire(reserved)
+    start = time.perf_counter()
+    try:
+        resp = _openai.call(
+            get_client().chat.completions.create,
+            model=model,
+            messages=messages,
+            max_completion_tokens=max_tokens,
+            **kwargs
+        )
+    except Exception:
+        _token_budget.refund(reserved)
+        raise
+    finally:
+        _LLM_SECONDS.observe(time.perf_counter() - start)
+    # Hand back whatever the real usage didn't need
+    if getattr(resp, "usage", None) is not None:
+        _token_budget.refund(reserved - resp.usage.total_tokens)
+        _LLM_TOKENS.inc(resp.usage.prompt_tokens, kind="prompt")
+        _LLM_TOKENS.inc(resp.usage.completion_tokens, kind="completion")
+    # The new response structure puts content here:
+    return (resp.choices[0].message.content or "").strip()
+
+def generate_reply(email_body: str, thread_context=None, use_cache: bool = True) -> str:
     """
     Uses the V1 openai-python client to draft a reply.
+    The body is trimmed to what the sender wrote (see trim_email_body), and
+    repeated questions are answered from the reply cache without an API call.
+    `thread_context` holds earlier unanswered messages of the same thread,
+    oldest first; one reply answers them all.
+    Waits for room in the requests/tokens-per-minute budgets first, and
+    retries rate limits and transient errors (see utils/resilience.py).
     """
-    resp = client.chat.completions.create(
-        model="gpt-4.1-nano",            # or "gpt-4.1-nano" if you have access
-        messages=[
-            {"role": "system",  "content": SYSTEM_PROMPT},
+    email_body = trim_email_body(email_body)
+    if thread_context:
+        email_body = _with_thread_context(email_body, thread_context)
+    if use_cache:
+        reply_cache = get_reply_cache()
+        cached = reply_cache.get(email_body)
+        if cached is not None:
+            _REPLIES.inc(outcome="cached")
+            return cached
+    try:
+        reply = complete([
+            {"role": "system",  "content": get_system_prompt()},
             {"role": "user",    "content": email_body}
-        ],
-        max_tokens=1000,
-        temperature=0.8
-    )
-    # The new response structure puts content here:
-    return resp.choices[0].message.content.strip()
+        ], temperature=0.8)
+    except Exception:
+        _REPLIES.inc(outcome="error")
+        raise
+    _REPLIES.inc(outcome="generated")
+    if use_cache:
+        reply_cache.put(email_body, reply)
+    return reply
+
+def generate_replies(email_bodies, max_workers: int = MAX_WORKERS):
+    """
+    Draft many replies concurrently on a bounded thread pool.
+    `email_bodies` is an iterable of (key, email_body) or
+    (key, email_body, thread_context). Yields
+    (key, reply, error) as each one finishes, in completion order;
+    exactly one of reply/error is None.
+    """
+    items = iter(email_bodies)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        # Keep a couple of requests per worker queued, never the whole input
+        for key, *args in items:
+            in_flight[pool.submit(generate_reply, *args)] = key
+            if len(in_flight) >= 2 * max_workers:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                error = future.exception()
+                yield key, (None if error else future.result()), error
+                for next_key, *args in items:
+                    in_flight[pool.submit(generate_reply, *args)] = next_key
+                    break
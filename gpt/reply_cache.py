@@ -0,0 +1,198 @@
+# gpt/reply_cache.py
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_NON_WORD_RE = re.compile(r"[^\w$]+")
+
+SIMHASH_BITS = 64
+_BANDS = 4                          # 4 x 16-bit bands: any 2 hashes within
+_BAND_BITS = SIMHASH_BITS // _BANDS  # 3 bits of each other share a band
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, drop URLs and punctuation, collapse whitespace, so trivially
+    different copies of the same question share a key.
+    """
+    text = _URL_RE.sub(" ", text.lower())
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+# Each byte value with its 8 bits spread into 32-bit lanes, so simhash() can
+# count the set bits of a whole digest byte with one addition
+_LANE_BITS = 32
+_LANE_MASK = (1 << _LANE_BITS) - 1
+_SPREAD = [sum((b >> i & 1) << (i * _LANE_BITS) for i in range(8)) for b in range(256)]
+
+def simhash(normalized: str) -> int:
+    """
+    64-bit SimHash over words and word pairs. Similar texts get hashes
+    that differ in only a few bits.
+    """
+    words = normalized.split()
+    features = words + [a + " " + b for a, b in zip(words, words[1:])]
+    ones = [0] * 8  # per digest byte, set-bit counts of its 8 bits in lanes
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        for k, byte in enumerate(digest):
+            ones[k] += _SPREAD[byte]
+    # A bit is set when more features have it set than clear
+    h = 0
+    for k, lanes in enumerate(ones):
+        base = (7 - k) * 8  # the digest is read big-endian
+        for i in range(8):
+            if 2 * (lanes >> (i * _LANE_BITS) & _LANE_MASK) > len(features):
+                h |= 1 << (base + i)
+    return h
+
+def _bands(h: int):
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, h >> (i * _BAND_BITS) & mask) for i in range(_BANDS)]
+
+class ReplyCache:
+    """
+    Generated replies keyed by the normalized email text.
+
+    Lookups try the exact key first and then, if near_duplicates is on, any
+    entry whose SimHash is within max_distance bits. Entries expire after
+    `ttl` seconds, and the least recently used are evicted beyond
+    `max_entries`. Up to `variants` different replies are kept per entry.
+    get() reports a miss until an entry has that many, then picks one at
+    random, so frequent questions don't all get the identical answer.
+
+    With a `path`, the cache is loaded from and saved to a JSON file so it
+    stays warm across restarts.
+    """
+
+    def __init__(self, path=None, max_entries=2000, ttl=7 * 86400,
+                 near_duplicates=False, max_distance=3, variants=1, save_interval=10):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicates = near_duplicates
+        self.max_distance = min(max_distance, _BANDS - 1)
+        self.variants = max(1, variants)
+        self.save_interval = save_interval
+        self.hits = self.near_hits = self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {"simhash", "replies", "created"}
+        self._band_index = {}           # (band, value) -> set of keys
+        self._last_save = 0.0
+        self._dirty = False
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+    def get(self, text: str):
+        """
+        A cached reply for `text`, or None on a miss.
+        """
+        normalized = normalize(text)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        with self._lock:
+            entry = self._live(key)
+            near = False
+            if entry is None and self.near_duplicates:
+                key = self._nearest(simhash(normalized))
+                entry = self._live(key)
+                near = entry is not None
+            if entry is None or len(entry["replies"]) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            return random.choice(entry["replies"])
+
+    def put(self, text: str, reply: str):
+        normalized = normalize(text)
+        key = hashlib.sha256(normalized.encode()).hexdigest()
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = {"simhash": simhash(normalized), "replies": [], "created": time.time()}
+                self._add(key, entry)
+            if reply not in entry["replies"]:
+                entry["replies"] = (entry["replies"] + [reply])[-self.variants:]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._dirty = True
+            if self.path and time.time() - self._last_save >= self.save_interval:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            if self.path and self._dirty:
+                self._save()
+
+    # --- internals (call with the lock held) ---
+    def _nearest(self, h):
+        best_key, best_distance = None, self.max_distance + 1
+        for band in _bands(h):
+            for key in self._band_index.get(band, ()):
+                distance = bin(h ^ self._entries[key]["simhash"]).count("1")
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+        return best_key
+
+    def _add(self, key, entry):
+        self._entries[key] = entry
+        for band in _bands(entry["simhash"]):
+            self._band_index.setdefault(band, set()).add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band in _bands(entry["simhash"]):
+            keys = self._band_index.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._band_index[band]
+
+    def _live(self, key):
+        """The entry for `key` unless missing or past its TTL (then dropped)."""
+        entry = self._entries.get(key)
+        if entry is not None and entry["created"] < time.time() - self.ttl:
+            self._remove(key)
+            entry = None
+        return entry
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        cutoff = time.time() - self.ttl
+        for key, entry in data.get("entries", []):
+            if entry["created"] >= cutoff:
+                self._add(key, entry)
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            cutoff = time.time() - self.ttl
+            json.dump({"entries": [(k, e) for k, e in self._entries.items() if e["created"] >= cutoff]}, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.time()
+        self._dirty = False
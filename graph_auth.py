@@ -1,31 +1,30 @@
 # graph_auth.py
+#
+# Check the app registration's credentials: get a Graph token the way the
+# agent does (see graph_client.AppToken) and report it.
+#
+#     python graph_auth.py
+#
+# Tokens land in the shared MSAL cache (MSAL_TOKEN_CACHE), so a run right
+# before the agent or a CLI tool saves them the login round trip.
 
-import os
-from msal import ConfidentialClientApplication
-from dotenv import load_dotenv
+from graph_client import AppToken, TOKEN_CACHE_PATH
 
-# 1. Load env
-load_dotenv()
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-TENANT_ID     = os.getenv("TENANT_ID")
 
-# 2. MSAL setup
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE     = ["https://graph.microsoft.com/.default"]  # Application permissions
-
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
+def check_token():
+    """
+    Acquire a token for TENANT_ID/CLIENT_ID and print the outcome.
+    Returns True if one was obtained.
+    """
+    result = AppToken().acquire()
+    if "access_token" in result:
+        print("✅ Got token! Expires in", result["expires_in"], "seconds.")
+        if TOKEN_CACHE_PATH:
+            print("   Cached in", TOKEN_CACHE_PATH)
+        return True
+    print("❌ Token error:", result.get("error_description"))
+    return False
 
-# 3. Acquire token
-result = app.acquire_token_silent(SCOPE, account=None)
-if not result:
-    result = app.acquire_token_for_client(scopes=SCOPE)
 
-if "access_token" in result:
-    print("✅ Got token! Expires in", result["expires_in"], "seconds.")
-else:
-    print("❌ Token error:", result.get("error_description"))
+if __name__ == "__main__":
+    raise SystemExit(0 if check_token() else 1)
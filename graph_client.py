@@ -0,0 +1,302 @@
+# graph_client.py
+
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from utils.resilience import ServiceGuard, http_outcome, send_once_outcome
+from utils.metrics import counter, histogram
+
+load_dotenv()
+TENANT_ID     = os.getenv("TENANT_ID")
+CLIENT_ID     = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+
+# Point at a different Graph endpoint (e.g. utils/fake_graph.py) for local testing
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0")
+
+# MSAL setup
+AUTHORITY_URL = "https://login.microsoftonline.com/"
+SCOPE     = ["https://graph.microsoft.com/.default"]
+
+# Keep-alive connections held open to Graph (per tenant). Should be at least the
+# number of threads making Graph calls at once, or extra connections get thrown away.
+POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "10"))
+
+# Refresh the bearer token this many seconds before it actually expires
+TOKEN_REFRESH_MARGIN = 300
+
+# MSAL token cache on disk, shared by every process (agent workers, one-off
+# CLI runs), so a fresh process reuses a live token instead of logging in
+# again. Holds access tokens: keep it private. "" keeps tokens in memory only.
+TOKEN_CACHE_PATH = os.getenv("MSAL_TOKEN_CACHE", ".msal_token_cache.json")
+
+# Outbound quota and retry policy for Graph, per mailbox. Mailbox requests are
+# limited to 10,000 per 10 minutes per app and mailbox; each $batch
+# sub-request counts as one.
+REQUESTS_PER_SECOND = float(os.getenv("GRAPH_RPS", "15"))
+MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "4"))
+REQUEST_TIMEOUT = 30  # seconds; a hung connection counts as a failed attempt
+
+_REQUESTS = counter("graph_requests_total", "Graph HTTP requests (each attempt) by method and status",
+                    ["method", "status"])
+_LATENCY = histogram("graph_request_seconds", "Graph HTTP request latency per attempt", ["method"])
+
+_token_cache = None
+_token_cache_mtime = None
+_token_cache_lock = threading.Lock()
+
+def _load_token_cache():
+    """
+    Return the process-wide MSAL token cache, re-reading TOKEN_CACHE_PATH
+    if another process has written it since. Call with _token_cache_lock held.
+    """
+    global _token_cache, _token_cache_mtime
+    if _token_cache is None:
+        import msal  # only once a token is actually needed
+        _token_cache = msal.SerializableTokenCache()
+    if TOKEN_CACHE_PATH:
+        try:
+            mtime = os.stat(TOKEN_CACHE_PATH).st_mtime_ns
+            if mtime != _token_cache_mtime:
+                with open(TOKEN_CACHE_PATH) as f:
+                    _token_cache.deserialize(f.read())
+                _token_cache_mtime = mtime
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable token cache {TOKEN_CACHE_PATH}: {e}")
+    return _token_cache
+
+def _save_token_cache():
+    """
+    Write the token cache back if MSAL changed it, atomically (like
+    save_delta_link()) and readable by the owner only.
+    """
+    global _token_cache_mtime
+    if not TOKEN_CACHE_PATH or not _token_cache.has_state_changed:
+        return
+    tmp_path = f"{TOKEN_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(_token_cache.serialize())
+        os.replace(tmp_path, TOKEN_CACHE_PATH)
+        _token_cache_mtime = os.stat(TOKEN_CACHE_PATH).st_mtime_ns
+    except OSError as e:
+        print(f"Could not save token cache to {TOKEN_CACHE_PATH}: {e}")
+
+
+class AppToken:
+    """
+    Client-credentials token for one app registration in one tenant, cached
+    and refreshed TOKEN_REFRESH_MARGIN before it expires. Every GraphClient
+    for that tenant shares one AppToken (see get_app_token()), so serving
+    many mailboxes still means one token request per hour, not one each.
+
+    Tokens also go through the on-disk cache at TOKEN_CACHE_PATH, so a new
+    process whose tenant already has a live token there uses it without
+    building an MSAL app (which itself costs a discovery request).
+    """
+
+    def __init__(self, tenant_id=TENANT_ID, client_id=CLIENT_ID, client_secret=CLIENT_SECRET,
+                 msal_app=None):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self._client_secret = client_secret
+        self._msal_app = None
+        self._given_msal_app = msal_app  # caller-supplied app, with its own cache
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return a valid access token, going to MSAL only when the cached one
+        is missing or within TOKEN_REFRESH_MARGIN of expiry.
+        GRAPH_ACCESS_TOKEN, if set, is used as-is (handy against a fake Graph).
+        """
+        if os.getenv("GRAPH_ACCESS_TOKEN"):
+            return os.getenv("GRAPH_ACCESS_TOKEN")
+        with self._lock:
+            if self._token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN:
+                return self._token
+            token_resp = self.acquire()
+            access_token = token_resp.get("access_token")
+            if not access_token:
+                raise RuntimeError(f"Could not obtain access token: {token_resp.get('error_description')}")
+            self._token = access_token
+            self._expires_at = time.time() + int(token_resp.get("expires_in", 0))
+            return access_token
+
+    def acquire(self):
+        """
+        Ask for a token, ignoring the one held in memory. Returns MSAL's
+        result dict: "access_token" and "expires_in", or "error" and
+        "error_description".
+        """
+        if self._given_msal_app is not None:
+            return self._given_msal_app.acquire_token_for_client(scopes=SCOPE)
+        with _token_cache_lock:
+            cache = _load_token_cache()
+            cached = self._cached(cache)
+            if cached is not None:
+                return cached
+            if self._msal_app is None:
+                import msal
+                self._msal_app = msal.ConfidentialClientApplication(
+                    client_id=self.client_id,
+                    client_credential=self._client_secret,
+                    authority=AUTHORITY_URL + str(self.tenant_id),
+                    token_cache=cache
+                )
+            token_resp = self._msal_app.acquire_token_for_client(scopes=SCOPE)
+            _save_token_cache()
+            return token_resp
+
+    def _cached(self, cache):
+        """
+        A still-valid token for this app and tenant from the token cache,
+        shaped like an MSAL result, or None.
+        """
+        now = time.time()
+        for entry in cache.search(cache.CredentialType.ACCESS_TOKEN, target=SCOPE,
+                                  query={"client_id": self.client_id, "realm": str(self.tenant_id)}):
+            expires_in = int(entry["expires_on"]) - now
+            if expires_in > TOKEN_REFRESH_MARGIN:
+                return {"access_token": entry["secret"], "token_type": entry.get("token_type", "Bearer"),
+                        "expires_in": int(expires_in)}
+        return None
+
+
+class GraphClient:
+    """
+    One keep-alive HTTP session plus a cached bearer token for Microsoft Graph.
+    Share a single instance (see get_graph_client()) so a burst of calls reuses
+    the same TLS connections and only asks MSAL for a token when it's about
+    to expire. Every request goes through `guard` (see utils/resilience.py):
+    rate limited to REQUESTS_PER_SECOND, retried on 429/5xx with Retry-After
+    or jittered backoff, and short-circuited while Graph keeps failing.
+
+    Clients for several mailboxes of one tenant pass the same `token` and
+    `session`, so they share the token and the connection pool but each
+    keeps its own guard: Graph throttles per mailbox, so one busy inbox
+    being told to back off doesn't stall the others.
+    """
+
+    def __init__(self, msal_app=None, base_url=GRAPH_BASE_URL, pool_size=POOL_SIZE,
+                 token=None, session=None):
+        self.base_url = base_url
+        self.guard = ServiceGuard("graph", http_outcome, rate=REQUESTS_PER_SECOND,
+                                  burst=REQUESTS_PER_SECOND * 2, max_retries=MAX_RETRIES)
+        self.token = token or AppToken(msal_app=msal_app)
+        self.session = session or _new_session(pool_size)
+
+    def get_token(self):
+        return self.token.get()
+
+    def request(self, method, url, headers=None, cost=1, **kwargs):
+        """
+        Send an authenticated request. `url` may be absolute (e.g. an
+        @odata.nextLink) or a path relative to base_url. `cost` is how many
+        requests it counts as against the quota ($batch passes its size).
+        Returns the last response once retries are used up; raises
+        CircuitOpen if Graph has been failing persistently.
+        Requests that aren't idempotent (see is_idempotent()) are only
+        retried when Graph certainly didn't act on them.
+        """
+        if not url.startswith("http"):
+            url = self.base_url + url
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+
+        def send():
+            all_headers = {
+                "Authorization": f"Bearer {self.get_token()}",
+                "Accept": "application/json",
+            }
+            all_headers.update(headers or {})
+            status = "error"
+            try:
+                with _LATENCY.time(method=method):
+                    resp = self.session.request(method, url, headers=all_headers, **kwargs)
+                status = resp.status_code
+                return resp
+            finally:
+                _REQUESTS.inc(method=method, status=status)
+
+        classify = None if is_idempotent(method, url, kwargs.get("json")) else send_once_outcome
+        return self.guard.call(send, cost=cost, classify=classify)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+
+def is_idempotent(method, url, body=None) -> bool:
+    """
+    Whether sending this Graph request twice does no harm. sendMail is the
+    call that doesn't qualify: repeating one Graph already carried out
+    sends a second email. A $batch is only as safe as its sub-requests.
+    """
+    if method != "POST":
+        return True
+    path = url.split("?", 1)[0]
+    if path.endswith("/sendMail"):
+        return False
+    if path.endswith("/$batch"):
+        return all(is_idempotent(sub.get("method", "GET"), sub.get("url", ""), sub.get("body"))
+                   for sub in (body or {}).get("requests", []))
+    return True
+
+
+def _new_session(pool_size=POOL_SIZE):
+    import requests  # ~100 ms; deferred until a client is actually built
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_client = None
+_client_lock = threading.Lock()
+_tenants = {}         # (tenant_id, client_id) -> (AppToken, session)
+_mailbox_clients = {}  # (tenant_id, client_id, user_email) -> GraphClient
+
+def get_graph_client():
+    """
+    Return the process-wide GraphClient, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GraphClient()
+        return _client
+
+def get_app_token(tenant_id, client_id, client_secret):
+    """
+    Return the shared AppToken for an app registration in a tenant.
+    """
+    with _client_lock:
+        key = (tenant_id, client_id)
+        if key not in _tenants:
+            _tenants[key] = (AppToken(tenant_id, client_id, client_secret), _new_session())
+        return _tenants[key][0]
+
+def get_mailbox_client(user_email, tenant_id=TENANT_ID, client_id=CLIENT_ID, client_secret=CLIENT_SECRET):
+    """
+    Return the GraphClient for one mailbox, creating it on first use. It
+    shares the token and connection pool of every other mailbox in the
+    same tenant and has its own rate limit and throttling state.
+    """
+    token = get_app_token(tenant_id, client_id, client_secret)
+    with _client_lock:
+        key = (tenant_id, client_id, user_email.lower())
+        if key not in _mailbox_clients:
+            _mailbox_clients[key] = GraphClient(token=token, session=_tenants[(tenant_id, client_id)][1])
+        return _mailbox_clients[key]
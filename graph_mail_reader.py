@@ -1,75 +1,273 @@
 import os
-import requests
-from msal import ConfidentialClientApplication
+import queue
+import threading
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from graph_client import get_graph_client
+from utils.body_text import extract_body_text
 
 load_dotenv()
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 USER_EMAIL    = os.getenv("EMAIL_ADDRESS")
 
-# MSAL setup
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE     = ["https://graph.microsoft.com/.default"]
+# Where the delta-sync state (the last @odata.deltaLink) is persisted
+DELTA_LINK_PATH = os.getenv("GRAPH_DELTA_LINK_PATH", ".graph_delta_link")
 
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
+# Messages per Graph page. Smaller pages mean the first results arrive sooner
+# and less of the backlog sits in memory at once.
+PAGE_SIZE = 50
 
 def get_access_token():
     """
-    Acquire an access token using MSAL.
+    Return a bearer token from the shared Graph client's cache.
     """
-    token_resp = app.acquire_token_silent(SCOPE, account=None) or \
-                 app.acquire_token_for_client(scopes=SCOPE)
-    access_token = token_resp.get("access_token")
-    if not access_token:
-        raise RuntimeError(f"Could not obtain access token: {token_resp.get('error_description')}")
-    return access_token
+    return get_graph_client().get_token()
 
 
-def graph_mail_reader():
+def _extract_body_text(message):
     """
-    Fetch unread messages from the user's Inbox via Microsoft Graph API.
-    Returns a list of message dicts, with an added 'full_body_text' field.
+    Store the plain text of the message body under 'full_body_text'.
+    """
+    message["full_body_text"] = extract_body_text(message)
+    return message
+
+
+class DeltaLinkExpired(RuntimeError):
+    """
+    Graph no longer recognises the stored delta link (410 Gone); a full
+    resync is required.
+    """
+
+
+def _iter_pages(url, headers, client=None):
+    """
+    GET `url` and keep following @odata.nextLink, yielding one page
+    (the decoded JSON response) at a time.
+    """
+    client = client or get_graph_client()
+    while url:
+        resp = client.get(url, headers=headers)
+        if resp.status_code == 410:
+            raise DeltaLinkExpired(f"Graph API error: {resp.status_code} {resp.text}")
+        if resp.status_code != 200:
+            raise RuntimeError(f"Graph API error: {resp.status_code} {resp.text}")
+        data = resp.json()
+        yield data
+        url = data.get("@odata.nextLink")
+
+
+def _prefetch(pages):
+    """
+    Download the next page on a background thread while the caller is still
+    working through the current one. At most one page is buffered ahead, so
+    memory stays bounded no matter how large the backlog is.
+    """
+    buffer = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    done = object()
+
+    def producer():
+        try:
+            for page in pages:
+                while not stop.is_set():
+                    try:
+                        buffer.put(page, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            item = done
+        except Exception as e:  # re-raised in the consuming thread
+            item = e
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    worker = threading.Thread(target=producer, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer stopped early (e.g. hit a limit): let the producer exit
+        stop.set()
+
+
+def iter_unread_messages(page_size=PAGE_SIZE, prefetch=True, user_email=None, client=None):
+    """
+    Yield unread messages from the user's Inbox one at a time, following
+    @odata.nextLink until the whole backlog has been read.
+    Each message dict gets an added 'full_body_text' field.
+    user_email/client select another mailbox than EMAIL_ADDRESS (see
+    graph_client.get_mailbox_client()); the other readers take them too.
+    """
+    query = message_query(page_size=page_size, user_email=user_email)
+    for messages, _ in iter_message_pages(query, prefetch, client):
+        yield from messages
+
+
+def message_query(unread_only=True, received_after=None, received_before=None,
+                  page_size=PAGE_SIZE, folder="Inbox", user_email=None):
+    """
+    URL listing the messages in `folder`: only unread ones unless
+    unread_only=False, optionally limited to received_after <=
+    receivedDateTime < received_before (ISO 8601, e.g. "2025-01-01T00:00:00Z").
+    Graph returns at most `page_size` per page.
+    """
+    filters = []
+    if unread_only:
+        filters.append("isRead eq false")
+    if received_after:
+        filters.append(f"receivedDateTime ge {received_after}")
+    if received_before:
+        filters.append(f"receivedDateTime lt {received_before}")
+    endpoint = f"/users/{user_email or USER_EMAIL}/mailFolders/{folder}/messages?"
+    if filters:
+        endpoint += "$filter=" + " and ".join(filters) + "&"
+    return endpoint + (
+        "$select=id,changeKey,conversationId,receivedDateTime,subject,from,body,isRead"
+        f"&$top={page_size}"
+    )
+
+
+def iter_message_pages(url, prefetch=True, client=None):
+    """
+    Yield (messages, next_link) for each page of `url`, a message_query()
+    or a saved @odata.nextLink to resume from. Bodies are parsed lazily as
+    the caller iterates `messages`; next_link is None on the last page.
     """
-    token = get_access_token()
     headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/json",
         "Prefer": 'outlook.body-type="text"'  # Request body as plain text
     }
-    endpoint = (
-        f"https://graph.microsoft.com/v1.0/users/{USER_EMAIL}"
-        "/mailFolders/Inbox/messages"
-        "?$filter=isRead eq false"
-        "&$select=id,subject,from,body"
-        "&$top=500"
+    pages = _iter_pages(url, headers, client)
+    if prefetch:
+        pages = _prefetch(pages)
+    for page in pages:
+        messages = (_extract_body_text(m) for m in page.get("value", []))
+        yield messages, page.get("@odata.nextLink")
+
+
+def load_delta_link(path=DELTA_LINK_PATH):
+    """
+    Return the persisted deltaLink, or None if we've never synced.
+    """
+    try:
+        with open(path, "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_delta_link(delta_link, path=DELTA_LINK_PATH):
+    """
+    Persist the deltaLink atomically so a crash never leaves half a URL.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(delta_link)
+    os.replace(tmp_path, path)
+
+
+def reset_delta_link(path=DELTA_LINK_PATH):
+    """
+    Forget the sync state; the next delta sync starts from scratch.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def iter_inbox_delta(page_size=PAGE_SIZE, path=DELTA_LINK_PATH, user_email=None, client=None):
+    """
+    Yield Inbox messages added or changed since the last delta sync.
+
+    The first run (or a run after reset_delta_link()) walks the whole Inbox.
+    Changes include messages that were read or deleted in the meantime:
+    deleted ones only carry 'id' and '@removed', read ones have isRead=True.
+    Callers decide what to do with those.
+
+    The new deltaLink is only saved once the caller has consumed every
+    change, so an interrupted sync is simply repeated next time.
+    If Graph has expired the stored link, the state is reset and a full
+    resync is performed.
+    """
+    delta_link = load_delta_link(path)
+    headers = {
+        # delta doesn't support $top; page size is a preference instead
+        "Prefer": f'outlook.body-type="text", odata.maxpagesize={page_size}'
+    }
+    endpoint = delta_link or (
+        f"/users/{user_email or USER_EMAIL}"
+        "/mailFolders/Inbox/messages/delta"
+        "?$select=id,changeKey,conversationId,receivedDateTime,subject,from,body,isRead"
     )
-    resp = requests.get(endpoint, headers=headers)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Graph API error: {resp.status_code} {resp.text}")
-    messages = resp.json().get("value", [])
-    
-    # Extract plain text body content for each message
-    for message in messages:
-        body_content_html = message.get("body", {}).get("content", "")
-        # Parse HTML and get text
-        soup = BeautifulSoup(body_content_html, 'html.parser')
-        plain_text_body = soup.get_text(separator='\n', strip=True)
-        message["full_body_text"] = plain_text_body # Store clean text
-        
-    return messages
+
+    new_delta_link = None
+    try:
+        for page in _prefetch(_iter_pages(endpoint, headers, client)):
+            for message in page.get("value", []):
+                if "@removed" in message or message.get("isRead"):
+                    yield message  # no need to parse bodies we won't reply to
+                else:
+                    yield _extract_body_text(message)
+            new_delta_link = page.get("@odata.deltaLink", new_delta_link)
+    except DeltaLinkExpired:
+        if not delta_link:
+            raise
+        print("Delta link expired; resetting and running a full Inbox sync.")
+        reset_delta_link(path)
+        yield from iter_inbox_delta(page_size, path, user_email, client)
+        return
+
+    if new_delta_link:
+        save_delta_link(new_delta_link, path)
+
+
+def iter_messages_by_id(message_ids, user_email=None, client=None):
+    """
+    Yield specific Inbox messages, e.g. the ones a change notification
+    named. A message that no longer exists comes back as {'id', '@removed'}
+    and a read one without its body parsed, as in iter_inbox_delta().
+    """
+    client = client or get_graph_client()
+    headers = {
+        "Prefer": 'outlook.body-type="text"'
+    }
+    for message_id in message_ids:
+        resp = client.get(
+            f"/users/{user_email or USER_EMAIL}/messages/{message_id}"
+            "?$select=id,changeKey,conversationId,receivedDateTime,subject,from,body,isRead",
+            headers=headers)
+        if resp.status_code == 404:
+            yield {"id": message_id, "@removed": {"reason": "deleted"}}
+            continue
+        if resp.status_code != 200:
+            raise RuntimeError(f"Graph API error: {resp.status_code} {resp.text}")
+        message = resp.json()
+        yield message if message.get("isRead") else _extract_body_text(message)
+
+
+def graph_mail_reader():
+    """
+    Fetch unread messages from the user's Inbox via Microsoft Graph API.
+    Returns a list of message dicts, with an added 'full_body_text' field.
+    Prefer iter_unread_messages() for large inboxes.
+    """
+    return list(iter_unread_messages())
 
 
 if __name__ == "__main__":
-    msgs = graph_mail_reader()
-    print(f"Found {len(msgs)} unread message(s).")
-    for msg in msgs:
+    count = 0
+    for msg in iter_unread_messages():
+        count += 1
         sender   = msg["from"]["emailAddress"]
         subject  = msg["subject"]
         full_body = msg.get("full_body_text", "").strip() # Use the new field
@@ -78,3 +276,4 @@ if __name__ == "__main__":
         print(f"From:    {sender['name']} <{sender['address']}>")
         print(f"Subject: {subject}")
         print(f"Body:\\n{full_body}") # Print the full body
+    print(f"Found {count} unread message(s).")
@@ -1,19 +1,18 @@
 # graph_mail_sender.py
 
-import os, requests
-from graph_mail_reader import get_access_token, USER_EMAIL
+from graph_client import get_graph_client, is_idempotent
+from graph_mail_reader import USER_EMAIL
+from utils.resilience import THROTTLED_STATUSES, TRANSIENT_STATUSES, never_sent, retry_after_seconds
 
-def send_email(to_address: str, subject: str, body: str):
-    """
-    Uses Graph API to send an email and saves it to Sent Items.
-    """
-    token = get_access_token()
-    url = f"https://graph.microsoft.com/v1.0/users/{USER_EMAIL}/sendMail"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type":  "application/json"
-    }
-    payload = {
+# Graph accepts at most 20 sub-requests per JSON $batch call
+BATCH_LIMIT = 20
+# Status of sub-requests whose batch call got no response: they may have run
+NO_RESPONSE = 0
+# Status of sub-requests whose batch call never reached Graph: they didn't run
+NOT_SENT = -1
+
+def _send_mail_payload(to_address: str, subject: str, body: str) -> dict:
+    return {
         "message": {
             "subject": subject,
             "body": {
@@ -26,18 +25,123 @@ def send_email(to_address: str, subject: str, body: str):
         },
         "saveToSentItems": "true"
     }
-    resp = requests.post(url, headers=headers, json=payload)
+
+def send_email(to_address: str, subject: str, body: str):
+    """
+    Uses Graph API to send an email and saves it to Sent Items.
+    """
+    url = f"/users/{USER_EMAIL}/sendMail"
+    resp = get_graph_client().post(url, json=_send_mail_payload(to_address, subject, body))
     resp.raise_for_status()
 
 def mark_as_read(message_id: str):
     """
     Flags the original message as read so we don't reply twice.
     """
-    token = get_access_token()
-    url = f"https://graph.microsoft.com/v1.0/users/{USER_EMAIL}/messages/{message_id}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type":  "application/json"
-    }
-    resp = requests.patch(url, headers=headers, json={"isRead": True})
+    url = f"/users/{USER_EMAIL}/messages/{message_id}"
+    resp = get_graph_client().patch(url, json={"isRead": True})
     resp.raise_for_status()
+
+def batch_requests(sub_requests: list, client=None) -> list:
+    """
+    Run many Graph calls through /$batch, BATCH_LIMIT at a time.
+    Each sub-request is a dict with 'method', 'url' (relative, e.g.
+    '/users/x/messages/y') and an optional JSON 'body'.
+    Returns a list of (status, body) in the same order as `sub_requests`.
+    A failed sub-request (or a failed batch call) only affects its own
+    entries, and nothing raised for one batch call stops the others. If
+    the batch call itself failed, its entries get NOT_SENT when it never
+    reached Graph and NO_RESPONSE when it may have been carried out
+    without us hearing back (including an answer that can't be read).
+    Sub-requests Graph throttled (429) or failed transiently (5xx) are
+    retried together in a later batch, after their Retry-After or a
+    jittered backoff, so one throttled item doesn't fail the whole run.
+    Sub-requests that aren't idempotent (sendMail) are not retried on 5xx,
+    since Graph may have sent the mail anyway.
+    """
+    client = client or get_graph_client()
+    results = [(NO_RESPONSE, None)] * len(sub_requests)
+    pending = list(range(len(sub_requests)))
+    attempt = 0
+    while pending:
+        retry, retry_after, throttled = [], None, False
+        for start in range(0, len(pending), BATCH_LIMIT):
+            chunk = pending[start:start + BATCH_LIMIT]
+            payload = {"requests": []}
+            for i, index in enumerate(chunk):
+                sub = sub_requests[index]
+                item = {"id": str(i), "method": sub["method"], "url": sub["url"]}
+                if sub.get("body") is not None:
+                    item["body"] = sub["body"]
+                    item["headers"] = {"Content-Type": "application/json"}
+                payload["requests"].append(item)
+
+            try:
+                resp = client.post("/$batch", json=payload, cost=len(chunk))
+                if resp.status_code == 200:
+                    # Responses may come back in any order; match them up by id
+                    responses = [(chunk[int(item["id"])], item) for item in resp.json().get("responses", [])]
+            except Exception as e:
+                # Not just connection errors: a token refresh failing midway or an
+                # unreadable answer must not lose the earlier chunks' results
+                status = NOT_SENT if never_sent(e) else NO_RESPONSE
+                for index in chunk:
+                    results[index] = (status, {"error": {"message": str(e)}})
+                continue
+            if resp.status_code != 200:
+                # The client already retried the batch call itself
+                for index in chunk:
+                    results[index] = (resp.status_code, {"error": {"message": resp.text}})
+                continue
+            for index, item in responses:
+                results[index] = (item["status"], item.get("body"))
+                sub = sub_requests[index]
+                if (item["status"] in THROTTLED_STATUSES or item["status"] in TRANSIENT_STATUSES
+                        and is_idempotent(sub["method"], sub["url"], sub.get("body"))):
+                    retry.append(index)
+                    throttled = throttled or item["status"] in THROTTLED_STATUSES
+                    wait = retry_after_seconds((item.get("headers") or {}).get("Retry-After"))
+                    if wait is not None:
+                        retry_after = max(retry_after or 0.0, wait)
+
+        if not retry or attempt >= client.guard.max_retries:
+            break
+        if client.guard.backoff(attempt, retry_after, throttled=throttled) is None:
+            break
+        attempt += 1
+        pending = sorted(retry)
+    return results
+
+def send_emails(replies: list, user_email=None, client=None) -> dict:
+    """
+    Send many emails through $batch, from `user_email` (default
+    EMAIL_ADDRESS) using that mailbox's `client`.
+    `replies` is a list of (key, to_address, subject, body); the key is
+    whatever the caller uses to track the reply, e.g. the message id.
+    Returns {key: status}; 202 means Graph accepted the send, NO_RESPONSE
+    (0) that there was no answer, so it may or may not have gone out.
+    Raises before sending anything if no access token can be had; past
+    that point every failure shows up as a status instead.
+    """
+    client = client or get_graph_client()
+    client.get_token()  # fail here, not halfway through the batches
+    sub_requests = [
+        {"method": "POST", "url": f"/users/{user_email or USER_EMAIL}/sendMail",
+         "body": _send_mail_payload(to_address, subject, body)}
+        for _, to_address, subject, body in replies
+    ]
+    results = batch_requests(sub_requests, client)
+    return {reply[0]: status for reply, (status, _) in zip(replies, results)}
+
+def mark_many_as_read(message_ids: list, user_email=None, client=None) -> dict:
+    """
+    Flag many messages as read through $batch.
+    Returns {message_id: status}; 200 means the message is now read.
+    """
+    sub_requests = [
+        {"method": "PATCH", "url": f"/users/{user_email or USER_EMAIL}/messages/{message_id}",
+         "body": {"isRead": True}}
+        for message_id in message_ids
+    ]
+    results = batch_requests(sub_requests, client)
+    return {message_id: status for message_id, (status, _) in zip(message_ids, results)}
@@ -0,0 +1,178 @@
+"""
+Push delivery of new mail through Microsoft Graph change notifications.
+
+An InboxSubscription asks Graph to POST to a public URL whenever a message
+in the Inbox is created or updated; a NotificationReceiver is the small
+HTTP server behind that URL. It answers Graph's validation handshake and
+hands the changed message ids to a callback. agent.py fetches just those
+messages and runs them through the usual filter -> queue path, while
+regular delta polling keeps running as the fallback.
+
+Graph only delivers to HTTPS endpoints it can reach, so in production
+GRAPH_NOTIFICATION_URL is a public URL (reverse proxy, tunnel) forwarding
+to GRAPH_WEBHOOK_HOST:GRAPH_WEBHOOK_PORT. Against utils/fake_graph.py the
+receiver's own http://127.0.0.1 URL works.
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from dotenv import load_dotenv
+from graph_client import get_graph_client
+from graph_mail_reader import USER_EMAIL
+
+load_dotenv()
+# Public URL Graph posts notifications to; push mode is off when unset
+NOTIFICATION_URL = os.getenv("GRAPH_NOTIFICATION_URL")
+WEBHOOK_HOST     = os.getenv("GRAPH_WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT     = int(os.getenv("GRAPH_WEBHOOK_PORT", "8080"))
+# Shared secret Graph echoes in every notification, so forged posts are ignored
+CLIENT_STATE     = os.getenv("GRAPH_WEBHOOK_CLIENT_STATE") or secrets.token_urlsafe(24)
+
+SUBSCRIPTION_MINUTES = 4230   # longest lifetime Graph has always allowed for messages
+RENEW_MARGIN = 12 * 3600      # renew once less than this is left
+
+
+class NotificationReceiver:
+    """
+    HTTP endpoint for Graph change notifications.
+
+    on_messages(ids) is called with the message ids of each notification
+    batch that carries our client state, on_lifecycle(event) with lifecycle
+    events ("missed", "reauthorizationRequired", "subscriptionRemoved").
+    Both run on the server thread and should return quickly: Graph expects
+    an answer within a few seconds and retries otherwise.
+    """
+
+    def __init__(self, on_messages, on_lifecycle=None, client_state=CLIENT_STATE,
+                 host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        self.on_messages = on_messages
+        self.on_lifecycle = on_lifecycle or (lambda event: None)
+        self.client_state = client_state
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/notifications"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, query, body):
+        """
+        Process one POST. Returns (status, content_type, payload bytes).
+        """
+        # Subscription validation: echo the token back as plain text
+        if "validationToken" in query:
+            return 200, "text/plain", query["validationToken"][0].encode()
+        try:
+            notifications = json.loads(body or b"{}").get("value", [])
+        except ValueError:
+            return 400, "text/plain", b"invalid JSON"
+
+        message_ids = []
+        for item in notifications:
+            if item.get("clientState") != self.client_state:
+                continue  # not from our subscription
+            if "lifecycleEvent" in item:
+                self.on_lifecycle(item["lifecycleEvent"])
+            elif (item.get("resourceData") or {}).get("id"):
+                message_ids.append(item["resourceData"]["id"])
+        if message_ids:
+            self.on_messages(message_ids)
+        return 202, "text/plain", b""
+
+
+class InboxSubscription:
+    """
+    A Graph subscription to created/updated messages in a user's Inbox,
+    delivering to `notification_url`.
+    """
+
+    def __init__(self, notification_url, client_state=CLIENT_STATE, user_email=None,
+                 minutes=SUBSCRIPTION_MINUTES):
+        self.notification_url = notification_url
+        self.client_state = client_state
+        self.user_email = user_email or USER_EMAIL
+        self.minutes = minutes
+        self.id = None
+        self.expires_at = 0.0
+
+    def seconds_left(self) -> float:
+        return self.expires_at - time.time() if self.id else 0.0
+
+    def create(self):
+        """
+        Create the subscription. Graph validates the notification URL
+        before answering, so the receiver must already be running.
+        """
+        expires_at, expiration = self._expiration()
+        resp = get_graph_client().post("/subscriptions", json={
+            "changeType": "created,updated",
+            "notificationUrl": self.notification_url,
+            "lifecycleNotificationUrl": self.notification_url,
+            "resource": f"users/{self.user_email}/mailFolders('Inbox')/messages",
+            "expirationDateTime": expiration,
+            "clientState": self.client_state,
+        })
+        if resp.status_code != 201:
+            raise RuntimeError(f"Graph API error: {resp.status_code} {resp.text}")
+        self.id, self.expires_at = resp.json()["id"], expires_at
+        print(f"Subscribed to Inbox notifications (subscription {self.id}).")
+
+    def renew(self):
+        """
+        Push the expiry out again (this also reauthorizes the subscription).
+        Creates a new subscription if Graph has already dropped this one.
+        """
+        if self.id is None:
+            return self.create()
+        expires_at, expiration = self._expiration()
+        resp = get_graph_client().patch(f"/subscriptions/{self.id}",
+                                        json={"expirationDateTime": expiration})
+        if resp.status_code == 404:
+            self.id = None
+            return self.create()
+        if resp.status_code != 200:
+            raise RuntimeError(f"Graph API error: {resp.status_code} {resp.text}")
+        self.expires_at = expires_at
+
+    def delete(self):
+        if self.id is not None:
+            get_graph_client().request("DELETE", f"/subscriptions/{self.id}")
+            self.id = None
+
+    def _expiration(self):
+        expires = datetime.now(timezone.utc) + timedelta(minutes=self.minutes)
+        return expires.timestamp(), expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _make_handler(receiver):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            status, content_type, payload = receiver.handle(
+                parse_qs(urlsplit(self.path).query), self.rfile.read(length))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
@@ -0,0 +1,114 @@
+"""
+Mailbox config for running one agent over many inboxes.
+
+    python agent.py --mailboxes mailboxes.json --processes 4
+
+The file is JSON: either a list of mailboxes or an object with "defaults"
+applied to every entry and a "mailboxes" list.
+
+    {
+      "defaults": {"start_hour": 7, "end_hour": 24},
+      "mailboxes": [
+        {"address": "creator1@contoso.com"},
+        {"address": "creator2@fabrikam.com", "timezone": "Europe/Berlin",
+         "tenant_id": "...", "client_id": "...", "client_secret_env": "FABRIKAM_SECRET"}
+      ]
+    }
+
+Only "address" is required. tenant_id, client_id and client_secret default
+to TENANT_ID, CLIENT_ID and CLIENT_SECRET; keep secrets out of the file
+with "client_secret_env", the name of an environment variable holding it.
+start_hour/end_hour/timezone set the mailbox's sending window (default:
+agent.py's START_HOUR-END_HOUR in local time). Each mailbox keeps its reply
+queue and delta link under AGENT_STATE_DIR, named after its address.
+"""
+
+import json
+import os
+from dotenv import load_dotenv
+from graph_client import TENANT_ID, CLIENT_ID, CLIENT_SECRET, get_mailbox_client
+from reply_queue import ReplyQueue
+
+load_dotenv()
+MAILBOXES_PATH = os.getenv("AGENT_MAILBOXES")
+STATE_DIR      = os.getenv("AGENT_STATE_DIR", "agent_state")
+
+_KEYS = {"address", "tenant_id", "client_id", "client_secret", "client_secret_env",
+         "start_hour", "end_hour", "timezone"}
+
+
+class Mailbox:
+    """
+    One inbox the agent answers: where to reach it (address and Graph
+    client), its reply queue and delta link, and its sending window.
+    Hours and timezone left as None fall back to agent.py's defaults.
+    """
+
+    def __init__(self, address=None, client=None, queue=None, delta_link_path=None,
+                 start_hour=None, end_hour=None, timezone=None, label=""):
+        self.address = address
+        self.client = client
+        self.queue = queue
+        self.delta_link_path = delta_link_path
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.timezone = timezone
+        self.label = label  # prefix for log lines
+        # asyncio.Events, created when the agent's runtime starts
+        self.draft_requested = self.queue_changed = self.fetch_requested = None
+
+    @classmethod
+    def from_config(cls, entry, state_dir=STATE_DIR):
+        """
+        Build a Mailbox from one (validated) config entry, opening its
+        queue database and its tenant's shared Graph client.
+        """
+        address = entry["address"]
+        secret = entry.get("client_secret")
+        if entry.get("client_secret_env"):
+            secret = os.getenv(entry["client_secret_env"])
+        client = get_mailbox_client(address, entry.get("tenant_id", TENANT_ID),
+                                    entry.get("client_id", CLIENT_ID), secret or CLIENT_SECRET)
+        os.makedirs(state_dir, exist_ok=True)
+        stem = os.path.join(state_dir, address.lower())
+        return cls(address, client, ReplyQueue(stem + ".db"), stem + ".delta_link",
+                   entry.get("start_hour"), entry.get("end_hour"), entry.get("timezone"),
+                   label=f"[{address}] ")
+
+
+def load_mailboxes(path=MAILBOXES_PATH) -> list:
+    """
+    Read and validate a mailbox config file. Returns one dict per mailbox
+    with the defaults merged in; raises ValueError on a malformed file.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    defaults = {}
+    if isinstance(data, dict):
+        defaults, data = data.get("defaults", {}), data.get("mailboxes")
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"{path}: expected a non-empty list of mailboxes")
+
+    entries, seen = [], set()
+    for i, item in enumerate(data):
+        entry = dict(defaults, **(item if isinstance(item, dict) else {"address": item}))
+        unknown = set(entry) - _KEYS
+        if unknown:
+            raise ValueError(f"{path}: mailbox {i} has unknown keys {sorted(unknown)}")
+        address = str(entry.get("address") or "").strip()
+        if "@" not in address:
+            raise ValueError(f"{path}: mailbox {i} needs an email address")
+        if address.lower() in seen:
+            raise ValueError(f"{path}: {address} is listed twice")
+        seen.add(address.lower())
+        entry["address"] = address
+        entries.append(entry)
+    return entries
+
+
+def shard(entries, index, count):
+    """
+    The mailboxes worker `index` of `count` serves: every count-th entry,
+    so each worker gets a near-equal share and no mailbox is served twice.
+    """
+    return entries[index::count]
@@ -1,27 +1,53 @@
-import os
+# prompt.py
+"""
+Generate reply filter rules from an export of real mail (see export_replies.py).
+
+    python prompt.py                                  # one prompt with every message -> filter.py
+    python prompt.py --pipeline replies.jsonl.gz      # map-reduce -> filter_patterns.py
+
+The single prompt sends the whole export at once, so it stops fitting the
+model's context after a few hundred messages. --pipeline scales to large
+exports at a cost fixed by --max-samples and --chunk-tokens:
+
+    1. cluster   exact and near-duplicate messages (SimHash, as in the
+                 reply cache) collapse into one sample with a count
+    2. pack      the largest clusters' samples into token-bounded chunks
+    3. map       one prompt per chunk, run concurrently, labels each sample
+                 reply/filter and proposes regexes for the filter ones
+    4. reduce    valid, new patterns that don't hit samples labelled
+                 "reply" are merged into FILTER_PATTERNS, and the result is
+                 checked against the whole export with utils/filters.should_reply
+"""
+
+import argparse
+import hashlib
 import json
-# import openai # No longer need the top-level openai import like this for v1.x
+import math
+import os
+import random
+import re
+import sys
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from openai import OpenAI # Import the OpenAI client
+from gpt.generator import MAX_WORKERS, complete, estimate_tokens, trim_email_body
+from gpt.reply_cache import SIMHASH_BITS, normalize, simhash
+from utils.filters import FILTER_PATTERNS, FilterEngine, iter_messages, should_reply
 
 load_dotenv()
 
-# Initialize the OpenAI client
-# The client will automatically pick up the OPENAI_API_KEY from the environment
-client = OpenAI()
-
-# 1) pull your API key (client does this automatically from env)
-# openai.api_key = os.getenv("OPENAI_API_KEY") # Not needed with new client
-# if not openai.api_key: # Handled by client or will error on API call
-#     raise RuntimeError("Set your OPENAI_API_KEY env var")
-
-# 2) load your data
-with open("replies.json", "r") as f:
-    messages = json.load(f) # Load all messages
+RULES_MODEL = os.getenv("RULES_MODEL", "o4-mini")
+CHUNK_TOKENS = 6000        # sample text per map prompt
+SAMPLE_TOKENS = 150        # cap on each sample's body, after trimming quotes and signatures
+MAX_SAMPLES = 3000         # clusters sent to the model, largest first; bounds the cost
+CLUSTER_WORDS = 60         # leading words compared when clustering near-duplicates
+MAX_DISTANCE = 3           # SimHash bits two near-duplicates may differ in
+RULES_MAX_TOKENS = 8000    # per map answer; reasoning models count their thinking here
+MAX_FALSE_POSITIVE_RATE = 0.05  # share of a pattern's sample hits allowed to be "reply" mail
 
-# Remove SAMPLE_SIZE and messages_sample = all_messages[:SAMPLE_SIZE] if they exist
+_BAND_BITS = SIMHASH_BITS // 4
 
-# 3) craft system + user messages
 system_msg = (
     "You are an expert Python engineer. Your task is to generate the complete contents of a Python script file named `filter.py`. "
     "This script will be used by an influencer named Fiona Frills to filter email replies. "
@@ -30,59 +56,360 @@ system_msg = (
     "She is NOT looking to collaborate, pay for services, or give away free products."
 )
 
-user_prompt = (
-    f"Based on the persona and goals described, generate the full Python code for `filter.py`. "
-    "The script should analyze email messages (provided in a JSON array format below) and decide if Fiona should reply. "
-    "The `filter.py` script must include:\n\n"
-    "1. Imports for `re` and `json` (and any other standard Python libraries necessary).\n"
-    "2. A comprehensive list of compiled regular expressions named `FILTER_PATTERNS`. These patterns should identify and help exclude emails such as:\n"
-    "    - Out of office / vacation auto-replies (e.g., 'Out of Office', 'OOO', 'Away Until', 'On holiday', 'Currently out', 'will be back on').\n"
-    "    - Standard automated replies (e.g., 'Thanks for your email', 'message received', 'auto-reply', 'automatic response').\n"
-    "    - DMARC reports or similar technical/administrative emails (e.g., subjects starting with 'Report Domain').\n"
-    "    - One-time passcodes or security alerts.\n"
-    "    - Inquiries about Fiona paying for services, collaborations, or discussing rates/charges (e.g., 'I charge', 'my rate is', 'flat fee', 'how much do you pay', 'collaboration fee').\n"
-    "    - Explicitly negative or uninterested replies (e.g., 'not interested', 'unsubscribe', 'remove me', 'stop emailing').\n"
-    "    - Emails with overly aggressive or inappropriate language.\n"
-    "3. A function `def should_reply(message: dict) -> tuple[bool, str]:`\n"
-    "    - It takes a single email message dictionary as input. Each message dictionary will have `id`, `from`, `subject`, and `body` (containing the full, plain text email body) keys.\n"
-    "    - It should check the `subject` and `body` of the message against `FILTER_PATTERNS`.\n"
-    "    - It must return a tuple: `(True, \"REASON_TO_REPLY\")` if Fiona should reply, or `(False, \"REASON_TO_FILTER\")` if she should not. \n"
-    "    - The second element of the tuple (the reason string) should be a concise explanation for the decision (e.g., 'Genuine question', 'Out of office', 'Discussing rates').\n"
-    "4. A `if __name__ == '__main__':` block that demonstrates how to:\n"
-    "    - Load messages from `replies.json` (assuming it's in the same directory).\n"
-    "    - Iterate through each message.\n"
-    "    - Call `should_reply()` for each message.\n"
-    "    - Print the `id`, `subject`, and the decision (Reply/Filter) and reason for a representative sample of messages (e.g., the first 10-20 messages, and a few examples of filtered and not-filtered messages if possible).\n\n"
-    "Prioritize accuracy in filtering. The goal is to help Fiona focus her time on meaningful interactions. "
-    "The `body` field in the JSON data contains the plain text content of the email.\n\n"
-    "JSON data representing the email messages:\n"
-    f"{json.dumps(messages, indent=2)}"
+rules_system_msg = (
+    "You write email filter rules for an influencer named Fiona Frills. "
+    "Fiona is selling a $28 info product and personally answers replies from people with genuine questions "
+    "about her product and from potential customers. "
+    "She is NOT looking to collaborate, pay for services, or give away free products. "
+    "Mail she should not answer includes out-of-office and other automated replies, system notifications, "
+    "DMARC or similar reports, passcodes and security alerts, people quoting their rates or fees, "
+    "uninterested or unsubscribe replies, and spam."
 )
 
-# 4) call the API
-print(f"Sending {len(messages)} messages to the OpenAI API.") # Use full 'messages', wording changed from 'sample'
-print(f"Estimated characters in prompt (excluding replies.json): {len(system_msg) + len(user_prompt.split('JSON data representing the email messages:')[0])}")
-print(f"Estimated characters in replies.json data: {len(json.dumps(messages, indent=2))}") # Use full 'messages', wording changed from 'sample'
-
-resp = client.chat.completions.create( # Use the new client syntax
-    model="o4-mini", 
-    messages=[
-        {"role": "system", "content": system_msg},
-        {"role": "user",   "content": user_prompt}
-    ],
-    temperature=1 
+rules_user_prompt = (
+    "Below are sample emails, one JSON object per line with `id`, `count` (how many near-identical emails "
+    "the sample stands for), `from`, `subject` and `body`.\n\n"
+    "1. Label every sample \"reply\" if Fiona should answer it, else \"filter\".\n"
+    "2. Propose Python regular expressions that catch the \"filter\" samples. They are matched with "
+    "re.search and re.IGNORECASE against the subject and body joined by a newline. They must not match "
+    "any \"reply\" sample. Prefer short phrases that generalise to other emails of the same kind over "
+    "whole sentences, names or anything specific to one sender.\n\n"
+    "Answer with JSON only, in this form:\n"
+    "{\"labels\": {\"<id>\": \"reply\" or \"filter\", ...}, "
+    "\"patterns\": [{\"pattern\": \"<regex>\", \"reason\": \"<short reason, e.g. Out of office>\"}, ...]}\n\n"
+    "Samples:\n"
 )
 
-# 5) write out the filter.py
-code_content = resp.choices[0].message.content
 
-# Clean up the response to ensure it's only Python code
-if code_content.startswith("```python"):
-    code_content = code_content[len("```python"):].strip()
-if code_content.endswith("```"):
-    code_content = code_content[:-len("```")].strip()
+def _fields(message):
+    """
+    (sender, subject, body) of an exported or raw Graph message, read the
+    way utils/filters.should_reply reads them.
+    """
+    subject = message.get("subject") or ""
+    body = message.get("body", "")
+    if isinstance(body, dict):
+        body = message.get("full_body_text", body.get("content", ""))
+    sender = message.get("from", "")
+    if isinstance(sender, dict):
+        sender = sender.get("emailAddress", {}).get("address", "")
+    return sender, subject, body or ""
+
+
+def _bands(h):
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, h >> (i * _BAND_BITS) & mask) for i in range(SIMHASH_BITS // _BAND_BITS)]
+
+
+def cluster_messages(messages, max_distance=MAX_DISTANCE):
+    """
+    Group exact and near-duplicate messages, comparing the first
+    CLUSTER_WORDS normalized words of subject and body. Returns (clusters,
+    assignments): a dict per cluster with its first message as 'sample'
+    and its 'count', and each message's cluster index in input order.
+    Only the samples are kept, so memory grows with the number of
+    distinct messages, not the size of the export.
+    """
+    clusters, assignments = [], array("I")
+    exact, by_band = {}, {}
+    for m in messages:
+        sender, subject, body = _fields(m)
+        words = normalize(subject + " " + body).split()[:CLUSTER_WORDS]
+        key = hashlib.blake2b(" ".join(words).encode(), digest_size=16).digest()
+        index = exact.get(key)
+        if index is None:
+            h = simhash(" ".join(words))
+            candidates = {i for band in _bands(h) for i in by_band.get(band, ())}
+            index = min((i for i in candidates if bin(clusters[i]["hash"] ^ h).count("1") <= max_distance),
+                        default=None)
+            if index is None:
+                index = len(clusters)
+                clusters.append({"hash": h, "count": 0, "sample": {
+                    "from": sender, "subject": subject, "body": trim_email_body(body, SAMPLE_TOKENS)}})
+                for band in _bands(h):
+                    by_band.setdefault(band, []).append(index)
+            exact[key] = index
+        clusters[index]["count"] += 1
+        assignments.append(index)
+    return clusters, assignments
+
+
+def pack_chunks(clusters, chunk_tokens=CHUNK_TOKENS, max_samples=MAX_SAMPLES, seed=0):
+    """
+    Pick the samples of the `max_samples` largest clusters (ties broken at
+    random) and deal them out over as few chunks of about `chunk_tokens`
+    as will hold them, so every chunk gets a mix of big and small clusters.
+    Returns a list of chunks, each a list of (cluster index, JSON line).
+    """
+    rng = random.Random(seed)
+    order = sorted(range(len(clusters)), key=lambda i: (-clusters[i]["count"], rng.random()))[:max_samples]
+    lines = [(i, json.dumps({"id": i, "count": clusters[i]["count"], **clusters[i]["sample"]},
+                            ensure_ascii=False)) for i in order]
+    total = sum(estimate_tokens(line) for _, line in lines)
+    count = max(1, math.ceil(total / (0.9 * chunk_tokens)))  # headroom for uneven dealing
+    dealt = [lines[k::count] for k in range(count)]
+
+    # Dealing evens out the sizes, but split any chunk that still ended up over budget
+    chunks = []
+    for chunk in dealt:
+        current, used = [], 0
+        for i, line in chunk:
+            cost = estimate_tokens(line)
+            if current and used + cost > chunk_tokens:
+                chunks.append(current)
+                current, used = [], 0
+            current.append((i, line))
+            used += cost
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def propose_patterns(chunk, model=RULES_MODEL):
+    """
+    Map step: ask the model to label one chunk's samples and propose
+    patterns. Returns (labels {cluster index: "reply"|"filter"},
+    [(pattern, reason)]).
+    """
+    answer = complete([
+        {"role": "system", "content": rules_system_msg},
+        {"role": "user",   "content": rules_user_prompt + "\n".join(line for _, line in chunk)},
+    ], model=model, max_tokens=RULES_MAX_TOKENS, response_format={"type": "json_object"})
+    data = json.loads(answer)
+    ids = {i for i, _ in chunk}
+    labels = {}
+    for key, label in (data.get("labels") or {}).items():
+        if str(key).isdigit() and int(key) in ids and label in ("reply", "filter"):
+            labels[int(key)] = label
+    patterns = [(str(p.get("pattern") or ""), str(p.get("reason") or "Generated rule").strip())
+                for p in data.get("patterns") or [] if isinstance(p, dict)]
+    return labels, patterns
+
+
+def merge_patterns(proposals, clusters, labels, existing=FILTER_PATTERNS,
+                   max_false_positive_rate=MAX_FALSE_POSITIVE_RATE):
+    """
+    Reduce step: drop proposals that don't compile, match empty text, repeat
+    an existing pattern, or catch no "filter" sample. Each remaining pattern
+    is scored on the labelled samples, weighted by cluster size, and kept
+    if at most `max_false_positive_rate` of what it catches was labelled
+    "reply". Returns (kept [(pattern, reason)] most useful first,
+    {rejection reason: count}).
+    """
+    seen = {pattern for pattern, _ in existing}
+    texts = [(index, c["count"], c["sample"]["subject"] + "\n" + c["sample"]["body"])
+             for index, c in enumerate(clusters) if index in labels]
+    kept, rejected = [], {}
+    for pattern, reason in proposals:
+        pattern = pattern.strip()
+        if not pattern or pattern in seen:
+            rejected["empty or duplicate"] = rejected.get("empty or duplicate", 0) + 1
+            continue
+        seen.add(pattern)
+        try:
+            regex = re.compile(pattern, re.IGNORECASE)
+        except re.error:
+            rejected["invalid regex"] = rejected.get("invalid regex", 0) + 1
+            continue
+        if regex.search("") or regex.search("\n"):
+            rejected["matches anything"] = rejected.get("matches anything", 0) + 1
+            continue
+        hits = {"reply": 0, "filter": 0}
+        for index, count, text in texts:
+            if regex.search(text):
+                hits[labels[index]] += count
+        if not hits["filter"]:
+            rejected["no filter sample matched"] = rejected.get("no filter sample matched", 0) + 1
+        elif hits["reply"] > max_false_positive_rate * (hits["reply"] + hits["filter"]):
+            rejected["matched reply samples"] = rejected.get("matched reply samples", 0) + 1
+        else:
+            kept.append((hits["filter"], pattern, reason or "Generated rule"))
+    kept.sort(key=lambda item: -item[0])
+    return [(pattern, reason) for _, pattern, reason in kept], rejected
+
+
+def validate(path, patterns, assignments, labels):
+    """
+    Run should_reply with `patterns` and with the current FILTER_PATTERNS
+    over every message in the export. Returns a summary dict: filtered
+    counts before/after, per-reason counts, and how many messages land
+    against their sample's label.
+    """
+    engine = FilterEngine(patterns)
+    summary = {"messages": 0, "filtered_before": 0, "filtered_after": 0, "reasons": {},
+               "filtered_but_labelled_reply": 0, "replied_but_labelled_filter": 0}
+    for m, index in zip(iter_messages(path), assignments):
+        summary["messages"] += 1
+        summary["filtered_before"] += not should_reply(m)[0]
+        reply, reason = should_reply(m, engine)
+        summary["reasons"][reason] = summary["reasons"].get(reason, 0) + 1
+        if not reply:
+            summary["filtered_after"] += 1
+            summary["filtered_but_labelled_reply"] += labels.get(index) == "reply"
+        elif labels.get(index) == "filter":
+            summary["replied_but_labelled_filter"] += 1
+    return summary
+
+
+def write_patterns(path, patterns, source, summary):
+    """
+    Write `patterns` as a FILTER_PATTERNS list to paste into utils/filters.py.
+    """
+    def literal(text):
+        # Raw strings read like the hand-written list, where they can hold the text
+        if "'" not in text and "\n" not in text and not text.endswith("\\"):
+            return f"r'{text}'"
+        return repr(text)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# Generated by prompt.py --pipeline from {source} on {time.strftime('%Y-%m-%d')}.\n")
+        f.write(f"# Filters {summary['filtered_after']} of {summary['messages']} messages "
+                f"(current rules: {summary['filtered_before']}).\n")
+        f.write("# Review, then replace FILTER_PATTERNS in utils/filters.py.\n")
+        f.write("FILTER_PATTERNS = [\n")
+        for pattern, reason in patterns:
+            f.write(f"    ({literal(pattern)}, {reason!r}),\n")
+        f.write("]\n")
+
+
+def run_pipeline(path, output="filter_patterns.py", chunk_tokens=CHUNK_TOKENS, max_samples=MAX_SAMPLES,
+                 model=RULES_MODEL, dry_run=False):
+    if path == "-":
+        raise ValueError("--pipeline reads the export twice; pass a file, not stdin")
+    start = time.perf_counter()
+    clusters, assignments = cluster_messages(iter_messages(path))
+    chunks = pack_chunks(clusters, chunk_tokens, max_samples)
+    prompt_tokens = sum(estimate_tokens(rules_system_msg + rules_user_prompt) +
+                        sum(estimate_tokens(line) for _, line in chunk) for chunk in chunks)
+    print(f"{len(assignments)} messages in {len(clusters)} clusters; "
+          f"{sum(len(chunk) for chunk in chunks)} samples in {len(chunks)} chunks, "
+          f"~{prompt_tokens} prompt tokens + up to {len(chunks) * RULES_MAX_TOKENS} completion tokens "
+          f"({time.perf_counter() - start:.1f}s).")
+    if dry_run:
+        return None
+
+    labels, proposals, failed = {}, [], 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = [pool.submit(propose_patterns, chunk, model) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                chunk_labels, chunk_patterns = future.result()
+            except Exception as e:  # one bad chunk shouldn't sink the run
+                print(f"Chunk failed: {e}")
+                failed += 1
+                continue
+            labels.update(chunk_labels)
+            proposals.extend(chunk_patterns)
+            if done % max(1, len(chunks) // 10) == 0 or done == len(chunks):
+                print(f"{done}/{len(chunks)} chunks done, {len(proposals)} patterns proposed.")
+    if failed == len(chunks):
+        raise RuntimeError("Every chunk failed; nothing to merge.")
+
+    new_patterns, rejected = merge_patterns(proposals, clusters, labels)
+    patterns = list(FILTER_PATTERNS) + new_patterns
+    summary = validate(path, patterns, assignments, labels)
+    write_patterns(output, patterns, path, summary)
+
+    print(f"Kept {len(new_patterns)} of {len(proposals)} proposed patterns"
+          + (f" (rejected: {', '.join(f'{n} {why}' for why, n in sorted(rejected.items()))})" if rejected else "")
+          + ".")
+    print(f"Filtered {summary['filtered_after']} of {summary['messages']} messages "
+          f"(current rules: {summary['filtered_before']}); {summary['filtered_but_labelled_reply']} "
+          f"filtered messages were labelled reply, {summary['replied_but_labelled_filter']} "
+          f"replied ones labelled filter.")
+    for reason, n in sorted(summary["reasons"].items(), key=lambda item: -item[1]):
+        print(f"  {n:>7}  {reason}")
+    print(f"✅ {output} written in {time.perf_counter() - start:.1f}s ({failed} chunks failed).")
+    return patterns
+
+
+def run_single(path="replies.jsonl"):
+    """
+    The original mode: every message in one prompt; the model writes filter.py.
+    """
+    # Initialize the OpenAI client (imported here: the SDK is slow to load)
+    # The client will automatically pick up the OPENAI_API_KEY from the environment
+    from openai import OpenAI
+    client = OpenAI()
+
+    # load your data
+    messages = list(iter_messages(path)) # Load all messages
+
+    user_prompt = (
+        f"Based on the persona and goals described, generate the full Python code for `filter.py`. "
+        "The script should analyze email messages (provided in a JSON array format below) and decide if Fiona should reply. "
+        "The `filter.py` script must include:\n\n"
+        "1. Imports for `re` and `json` (and any other standard Python libraries necessary).\n"
+        "2. A comprehensive list of compiled regular expressions named `FILTER_PATTERNS`. These patterns should identify and help exclude emails such as:\n"
+        "    - Out of office / vacation auto-replies (e.g., 'Out of Office', 'OOO', 'Away Until', 'On holiday', 'Currently out', 'will be back on').\n"
+        "    - Standard automated replies (e.g., 'Thanks for your email', 'message received', 'auto-reply', 'automatic response').\n"
+        "    - DMARC reports or similar technical/administrative emails (e.g., subjects starting with 'Report Domain').\n"
+        "    - One-time passcodes or security alerts.\n"
+        "    - Inquiries about Fiona paying for services, collaborations, or discussing rates/charges (e.g., 'I charge', 'my rate is', 'flat fee', 'how much do you pay', 'collaboration fee').\n"
+        "    - Explicitly negative or uninterested replies (e.g., 'not interested', 'unsubscribe', 'remove me', 'stop emailing').\n"
+        "    - Emails with overly aggressive or inappropriate language.\n"
+        "3. A function `def should_reply(message: dict) -> tuple[bool, str]:`\n"
+        "    - It takes a single email message dictionary as input. Each message dictionary will have `id`, `from`, `subject`, and `body` (containing the full, plain text email body) keys.\n"
+        "    - It should check the `subject` and `body` of the message against `FILTER_PATTERNS`.\n"
+        "    - It must return a tuple: `(True, \"REASON_TO_REPLY\")` if Fiona should reply, or `(False, \"REASON_TO_FILTER\")` if she should not. \n"
+        "    - The second element of the tuple (the reason string) should be a concise explanation for the decision (e.g., 'Genuine question', 'Out of office', 'Discussing rates').\n"
+        "4. A `if __name__ == '__main__':` block that demonstrates how to:\n"
+        "    - Load messages from `replies.json` (assuming it's in the same directory).\n"
+        "    - Iterate through each message.\n"
+        "    - Call `should_reply()` for each message.\n"
+        "    - Print the `id`, `subject`, and the decision (Reply/Filter) and reason for a representative sample of messages (e.g., the first 10-20 messages, and a few examples of filtered and not-filtered messages if possible).\n\n"
+        "Prioritize accuracy in filtering. The goal is to help Fiona focus her time on meaningful interactions. "
+        "The `body` field in the JSON data contains the plain text content of the email.\n\n"
+        "JSON data representing the email messages:\n"
+        f"{json.dumps(messages, indent=2)}"
+    )
+
+    # call the API
+    print(f"Sending {len(messages)} messages to the OpenAI API.")
+    print(f"Estimated characters in prompt (excluding replies.json): {len(system_msg) + len(user_prompt.split('JSON data representing the email messages:')[0])}")
+    print(f"Estimated characters in replies.json data: {len(json.dumps(messages, indent=2))}")
+    if estimate_tokens(user_prompt) > 100_000:
+        print("This is a large prompt; consider `python prompt.py --pipeline` instead.")
+
+    resp = client.chat.completions.create( # Use the new client syntax
+        model="o4-mini",
+        messages=[
+            {"role": "system", "content": system_msg},
+            {"role": "user",   "content": user_prompt}
+        ],
+        temperature=1
+    )
+
+    # write out the filter.py
+    code_content = resp.choices[0].message.content
+
+    # Clean up the response to ensure it's only Python code
+    if code_content.startswith("```python"):
+        code_content = code_content[len("```python"):].strip()
+    if code_content.endswith("```"):
+        code_content = code_content[:-len("```")].strip()
+
+    with open("filter.py", "w") as f:
+        f.write(code_content)
+
+    print("✅ filter.py generated!")
+
 
-with open("filter.py", "w") as f:
-    f.write(code_content)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default="replies.jsonl",
+                        help="export to learn from: JSON array or JSON Lines, optionally .gz")
+    parser.add_argument("--pipeline", action="store_true", help="cluster, chunk and merge instead of one prompt")
+    parser.add_argument("--output", default="filter_patterns.py", help="where --pipeline writes FILTER_PATTERNS")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--max-samples", type=int, default=MAX_SAMPLES, help="clusters sent to the model at most")
+    parser.add_argument("--model", default=RULES_MODEL)
+    parser.add_argument("--dry-run", action="store_true", help="cluster and chunk, print the plan, call nothing")
+    args = parser.parse_args()
 
-print("✅ filter.py generated!")
+    if args.path != "-" and not os.path.exists(args.path):
+        sys.exit(f"Error: {args.path} not found. Please run `python export_replies.py {args.path}` first.")
+    if args.pipeline:
+        run_pipeline(args.path, args.output, args.chunk_tokens, args.max_samples, args.model, args.dry_run)
+    else:
+        run_single(args.path)
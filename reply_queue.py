@@ -0,0 +1,340 @@
+# reply_queue.py
+
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+# Reply states, in the order a reply normally moves through them
+PENDING  = "pending"    # scheduled, no draft yet
+DRAFTED  = "drafted"    # draft generated and stored
+SENDING  = "sending"    # send_email may have gone out; never send again
+SENT     = "sent"       # Graph accepted the send
+FAILED   = "failed"     # gave up after MAX_SEND_ATTEMPTS
+
+MAX_SEND_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    msg_id          TEXT PRIMARY KEY,   -- first message queued for this reply
+    send_at         REAL NOT NULL,
+    state           TEXT NOT NULL,
+    message         TEXT NOT NULL,      -- latest message in the thread
+    draft           TEXT,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    marked_read     INTEGER NOT NULL DEFAULT 0,
+    updated_at      REAL NOT NULL,
+    conversation_id TEXT,
+    version         INTEGER NOT NULL DEFAULT 0  -- bumped when a follow-up is folded in
+);
+CREATE INDEX IF NOT EXISTS replies_state ON replies (state);
+CREATE INDEX IF NOT EXISTS replies_conversation ON replies (conversation_id);
+CREATE TABLE IF NOT EXISTS reply_messages (
+    msg_id      TEXT PRIMARY KEY,       -- every message the reply answers
+    reply_id    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reply_messages_reply ON reply_messages (reply_id);
+"""
+
+class ReplyQueue:
+    """
+    Scheduled replies ordered by send time, indexed by Graph message id and
+    stored in SQLite so nothing is lost on restart.
+
+    Unread messages from the same conversation share one reply: pushing a
+    message whose thread already has a reply waiting folds it into that
+    reply (the newest message is the one answered, earlier ones are kept
+    as `thread_context`) and the draft is regenerated. Each fold bumps the
+    reply's version, so a draft written for the earlier message is refused. A reply is identified
+    by the id of the first message queued for it; message_ids() lists every
+    message it answers.
+
+    Every reply ever queued keeps its row, so push() rejects a message id
+    that is queued, in flight or already answered. In memory we only keep a
+    heap of (send_at, id) for replies still waiting to go out: the next due
+    reply is O(log n), cancel() is O(1) (the heap entry is tombstoned and
+    skipped when it surfaces), and message bodies stay on disk until needed.
+
+    path=":memory:" gives the same behaviour without durability.
+    """
+
+    def __init__(self, path=":memory:"):
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._db.executescript(_SCHEMA)
+
+        self._heap = []                   # [send_at, seq, msg_id]
+        self._entries = {}                # msg_id -> heap entry
+        self._seq = itertools.count()     # tie-breaker for equal send times
+        rows = self._db.execute(
+            "SELECT msg_id, send_at FROM replies WHERE state IN (?, ?)", (PENDING, DRAFTED))
+        for msg_id, send_at in rows:
+            self._schedule(msg_id, send_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, reply_id):
+        return reply_id in self._entries
+
+    def has_message(self, msg_id: str) -> bool:
+        """
+        Whether `msg_id` has ever been queued, on its own or as part of a thread.
+        """
+        with self._lock:
+            return self._reply_of(msg_id) is not None
+
+    def message_ids(self, reply_id: str) -> list:
+        """
+        Ids of every message a reply answers, in the order they were queued.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT msg_id FROM reply_messages WHERE reply_id = ? ORDER BY rowid", (reply_id,))
+            return [msg_id for (msg_id,) in rows]
+
+    def push(self, msg: dict, send_at: float) -> bool:
+        """
+        Schedule a reply to `msg` at `send_at`, or fold it into the reply
+        already waiting for its conversation (keeping that reply's send
+        time). Returns False (and changes nothing) if this message id has
+        been queued before.
+        """
+        # The raw Graph body is already captured in full_body_text
+        stored = {k: v for k, v in msg.items() if k != "body"}
+        conversation_id = msg.get("conversationId")
+        with self._lock, self._db:
+            if self._reply_of(msg["id"]) is not None:
+                return False
+            reply_id = self._waiting_reply(conversation_id)
+            if reply_id is not None:
+                (current,) = self._db.execute(
+                    "SELECT message FROM replies WHERE msg_id = ?", (reply_id,)).fetchone()
+                self._db.execute(
+                    "UPDATE replies SET message = ?, draft = NULL, state = ?, updated_at = ?,"
+                    " version = version + 1 WHERE msg_id = ?",
+                    (json.dumps(_merge_thread(json.loads(current), stored)),
+                     PENDING, time.time(), reply_id))
+            else:
+                reply_id = msg["id"]
+                self._db.execute(
+                    "INSERT INTO replies (msg_id, send_at, state, message, updated_at, conversation_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (reply_id, send_at, PENDING, json.dumps(stored), time.time(), conversation_id))
+                self._schedule(reply_id, send_at)
+            self._db.execute(
+                "INSERT INTO reply_messages (msg_id, reply_id) VALUES (?, ?)", (msg["id"], reply_id))
+            return True
+
+    def cancel(self, msg_id: str) -> bool:
+        """
+        Drop the unsent reply that answers `msg_id`, e.g. because the message
+        was read in the meantime. A reply covering several messages of a
+        thread is dropped as a whole. Returns True if something was cancelled.
+        """
+        with self._lock, self._db:
+            reply_id = self._reply_of(msg_id)
+            entry = self._entries.pop(reply_id, None)
+            if entry is None:
+                return False
+            self._db.execute("DELETE FROM replies WHERE msg_id = ?", (reply_id,))
+            self._db.execute("DELETE FROM reply_messages WHERE reply_id = ?", (reply_id,))
+            entry[2] = None  # tombstone; discarded when it reaches the top
+            # Rebuild if tombstones dominate, so the heap can't grow without bound
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [e for e in self._heap if e[2] is not None]
+                heapq.heapify(self._heap)
+            return True
+
+    def next_send_at(self):
+        """
+        The earliest scheduled send time, or None if nothing is waiting.
+        """
+        with self._lock:
+            self._discard_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list:
+        """
+        Take every reply due at or before `now` off the schedule, earliest
+        first, as (reply_id, send_at, msg, draft) with draft None if not
+        drafted yet.
+        O(k log n) for k due replies. The rows stay in their current state
+        until mark_sending()/retry() is called.
+        """
+        with self._lock:
+            due_ids = []
+            while True:
+                self._discard_cancelled()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, _, msg_id = heapq.heappop(self._heap)
+                del self._entries[msg_id]
+                due_ids.append(msg_id)
+            return [(msg_id,) + self._load(msg_id) for msg_id in due_ids]
+
+    def pending_drafts(self) -> list:
+        """
+        Ids of scheduled replies that still need a draft, earliest send first.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT msg_id FROM replies WHERE state = ? ORDER BY send_at", (PENDING,))
+            return [msg_id for (msg_id,) in rows if msg_id in self._entries]
+
+    def get_message(self, msg_id: str, with_version: bool = False):
+        """
+        The stored message for `msg_id`, or None if it is no longer queued.
+        with_version=True returns (message, version) instead, for set_draft().
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT message, version FROM replies WHERE msg_id = ?", (msg_id,)).fetchone()
+            if row is None:
+                return None
+            return (json.loads(row[0]), row[1]) if with_version else json.loads(row[0])
+
+    def set_draft(self, msg_id: str, draft: str, version=None) -> bool:
+        """
+        Attach a draft to a reply that hasn't been sent yet. With the
+        `version` get_message() returned, a draft for a message that has
+        since had a follow-up folded in is ignored. Returns True if stored.
+        """
+        query = "UPDATE replies SET draft = ?, state = ?, updated_at = ? WHERE msg_id = ? AND state IN (?, ?)"
+        params = (draft, DRAFTED, time.time(), msg_id, PENDING, DRAFTED)
+        if version is not None:
+            query += " AND version = ?"
+            params += (version,)
+        with self._lock, self._db:
+            return self._db.execute(query, params).rowcount > 0
+
+    def postpone(self, msg_id: str, send_at: float):
+        """
+        Put a due reply back on the schedule at `send_at` without counting
+        it as a failed attempt, e.g. because its draft isn't ready yet, or
+        because the send failed before anything reached Graph (a reply
+        marked as sending goes back to drafted).
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE replies SET send_at = ?, state = CASE WHEN draft IS NULL THEN ? ELSE ? END,"
+                " updated_at = ? WHERE msg_id = ?",
+                (send_at, PENDING, DRAFTED, time.time(), msg_id))
+            self._schedule(msg_id, send_at)
+
+    def mark_sending(self, msg_ids: list):
+        """
+        Record that a send is about to happen. If we crash before hearing
+        back, the reply is treated as sent rather than risk a second one.
+        """
+        self._set_state(msg_ids, SENDING)
+
+    def mark_sent(self, msg_ids: list):
+        self._set_state(msg_ids, SENT)
+
+    def mark_read(self, msg_ids: list):
+        """
+        Record that the original messages have been flagged read in Graph.
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE replies SET marked_read = 1, updated_at = ? WHERE msg_id = ?",
+                [(time.time(), msg_id) for msg_id in msg_ids])
+
+    def retry(self, msg_id: str, send_at: float) -> bool:
+        """
+        Put a reply whose send was rejected back on the schedule.
+        Returns False if it has used up MAX_SEND_ATTEMPTS and is now failed.
+        """
+        with self._lock, self._db:
+            attempts, draft = self._db.execute(
+                "SELECT attempts, draft FROM replies WHERE msg_id = ?", (msg_id,)).fetchone()
+            attempts += 1
+            state = FAILED if attempts >= MAX_SEND_ATTEMPTS else (DRAFTED if draft else PENDING)
+            self._db.execute(
+                "UPDATE replies SET attempts = ?, state = ?, send_at = ?, updated_at = ? WHERE msg_id = ?",
+                (attempts, state, send_at, time.time(), msg_id))
+            if state == FAILED:
+                return False
+            self._schedule(msg_id, send_at)
+            return True
+
+    def unfinished_sends(self) -> list:
+        """
+        Ids of replies that went out (or may have) but whose original
+        message was never marked read, e.g. after a crash mid-dispatch.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT msg_id FROM replies WHERE state IN (?, ?) AND marked_read = 0",
+                (SENDING, SENT))
+            return [msg_id for (msg_id,) in rows]
+
+    def count_by_state(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM replies GROUP BY state"))
+
+    def _reply_of(self, msg_id):
+        row = self._db.execute(
+            "SELECT reply_id FROM reply_messages WHERE msg_id = ?", (msg_id,)).fetchone()
+        return row[0] if row else None
+
+    def _waiting_reply(self, conversation_id):
+        """The reply for this conversation that is still scheduled, if any."""
+        if not conversation_id:
+            return None
+        rows = self._db.execute(
+            "SELECT msg_id FROM replies WHERE conversation_id = ? AND state IN (?, ?)",
+            (conversation_id, PENDING, DRAFTED))
+        return next((msg_id for (msg_id,) in rows if msg_id in self._entries), None)
+
+    def _migrate(self):
+        """Bring a queue created by an older version of this module up to date."""
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(replies)")]
+        if columns and "version" not in columns:
+            self._db.execute("ALTER TABLE replies ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        if columns and "conversation_id" not in columns:
+            self._db.execute("ALTER TABLE replies ADD COLUMN conversation_id TEXT")
+            self._db.executescript(_SCHEMA)
+            with self._db:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO reply_messages (msg_id, reply_id) SELECT msg_id, msg_id FROM replies")
+
+    def _schedule(self, msg_id, send_at):
+        entry = [send_at, next(self._seq), msg_id]
+        self._entries[msg_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _load(self, msg_id):
+        send_at, message, draft = self._db.execute(
+            "SELECT send_at, message, draft FROM replies WHERE msg_id = ?", (msg_id,)).fetchone()
+        return send_at, json.loads(message), draft
+
+    def _set_state(self, msg_ids, state):
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE replies SET state = ?, updated_at = ? WHERE msg_id = ?",
+                [(state, time.time(), msg_id) for msg_id in msg_ids])
+
+    def _discard_cancelled(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+def _merge_thread(current: dict, new: dict) -> dict:
+    """
+    Combine two messages of one thread: the newer one (by receivedDateTime)
+    becomes the message answered, the text of the older one joins the
+    `thread_context` list of [receivedDateTime, text], oldest first.
+    """
+    latest, earlier = (new, current) if new.get("receivedDateTime", "") >= current.get("receivedDateTime", "") \
+        else (current, new)
+    context = current.get("thread_context", []) + [
+        [earlier.get("receivedDateTime", ""),
+         earlier.get("trimmed_body_text") or earlier.get("full_body_text", "")]]
+    return dict(latest, thread_context=sorted(context, key=lambda item: item[0]))
@@ -0,0 +1,81 @@
+"""
+Shared setup for the tests: Graph and OpenAI calls go to the in-process
+fakes (utils/fake_graph.py, benchmarks/fake_openai.py), and nothing touches
+the network or the working directory.
+
+The project's modules read their settings at import time, so the
+environment is set here, before any test module imports them.
+"""
+
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+USER = "tests@example.com"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+WEBHOOK_PORT = _free_port()
+_STATE_DIR = tempfile.mkdtemp(prefix="agent-tests-")
+os.environ.update({
+    "EMAIL_ADDRESS": USER,
+    "GRAPH_ACCESS_TOKEN": "fake",
+    "GRAPH_RPS": "1000000",
+    "GRAPH_DELTA_LINK_PATH": os.path.join(_STATE_DIR, "delta_link"),
+    "MSAL_TOKEN_CACHE": os.path.join(_STATE_DIR, "msal_token_cache.json"),
+    "GRAPH_WEBHOOK_HOST": "127.0.0.1",
+    "GRAPH_WEBHOOK_PORT": str(WEBHOOK_PORT),
+    "GRAPH_NOTIFICATION_URL": f"http://127.0.0.1:{WEBHOOK_PORT}/notifications",
+    "OPENAI_API_KEY": "fake",
+    "REPLY_CACHE_PATH": "",
+    "AGENT_QUEUE_DB": ":memory:",
+    "AGENT_METRICS_PORT": "0",
+})
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """A fresh fake Graph, used by the process-wide GraphClient."""
+    import graph_client
+    from utils.fake_graph import FakeGraph
+    with FakeGraph() as fake:
+        monkeypatch.setattr(graph_client, "_client", graph_client.GraphClient(base_url=fake.base_url))
+        yield fake
+
+
+@pytest.fixture
+def agent(monkeypatch, tmp_path):
+    """agent.py with a fresh default mailbox and no runtime running."""
+    import agent
+    monkeypatch.setattr(agent, "DELTA_LINK_PATH", str(tmp_path / "delta_link"))
+    monkeypatch.setattr(agent, "_default_mailbox", None)
+    monkeypatch.setattr(agent, "_loop", None)
+    monkeypatch.setattr(agent, "_push_received", None)
+    agent._pushed_ids.clear()
+    agent._lifecycle_events.clear()
+    return agent
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """A fake OpenAI server behind gpt.generator's client, with an empty reply cache."""
+    from openai import OpenAI
+    from fake_openai import FakeOpenAI
+    import gpt.generator as generator
+    with FakeOpenAI() as fake:
+        monkeypatch.setattr(generator, "_client", OpenAI(api_key="fake", base_url=fake.base_url, max_retries=0))
+        monkeypatch.setattr(generator, "_reply_cache", None)
+        yield fake
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import graph_client
+from mailboxes import Mailbox
+from reply_queue import ReplyQueue
+
+ZONE = "America/Los_Angeles"
+
+
+def _message(msg_id, conversation_id=None):
+    return {"id": msg_id, "conversationId": conversation_id or msg_id, "subject": "Question",
+            "from": {"emailAddress": {"address": "fan@example.com"}},
+            "full_body_text": "Is the course still open?"}
+
+
+def test_dispatch_loop_waits_for_the_window_when_a_reply_is_overdue(agent, monkeypatch):
+    # Restarted at 03:00 with a reply that was due the evening before
+    night = datetime(2025, 6, 3, 3, 0, tzinfo=ZoneInfo(ZONE)).timestamp()
+    queue = ReplyQueue()
+    queue.push(_message("m1"), night - 6 * 3600)
+    mailbox = Mailbox(queue=queue, start_hour=7, end_hour=24, timezone=ZONE)
+    monkeypatch.setattr(agent.time, "time", lambda: night)
+    calls = []
+    monkeypatch.setattr(agent, "dispatch_queue", calls.append)
+
+    async def run():
+        mailbox.queue_changed = asyncio.Event()
+        task = asyncio.create_task(agent.dispatch_loop(mailbox))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert calls == []
+    assert agent.next_send_time(night, mailbox) == datetime(2025, 6, 3, 7, 0, tzinfo=ZoneInfo(ZONE)).timestamp()
+
+
+def test_dispatch_loop_sends_an_overdue_reply_inside_the_window(agent, monkeypatch):
+    noon = datetime(2025, 6, 3, 12, 0, tzinfo=ZoneInfo(ZONE)).timestamp()
+    queue = ReplyQueue()
+    queue.push(_message("m1"), noon - 3600)
+    mailbox = Mailbox(queue=queue, start_hour=7, end_hour=24, timezone=ZONE)
+    monkeypatch.setattr(agent.time, "time", lambda: noon)
+    calls = []
+
+    def dispatch(mb):
+        calls.append(mb)
+        mb.queue.pop_due(noon)
+
+    monkeypatch.setattr(agent, "dispatch_queue", dispatch)
+
+    async def run():
+        mailbox.queue_changed = asyncio.Event()
+        task = asyncio.create_task(agent.dispatch_loop(mailbox))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert calls == [mailbox]
+
+
+def test_dispatch_never_resends_after_a_batch_call_fails_midway(agent, graph, monkeypatch):
+    monkeypatch.setattr(agent, "START_HOUR", 0)
+    monkeypatch.setattr(agent, "END_HOUR", 24)
+    queue = agent.get_default_mailbox().queue
+    for i in range(25):
+        queue.push(_message(f"m{i}"), 0)
+        queue.set_draft(f"m{i}", "Thanks for writing!")
+    client = graph_client.get_graph_client()
+    post, calls = client.post, []
+
+    def flaky_post(url, **kwargs):
+        calls.append(url)
+        resp = post(url, **kwargs)
+        if len(calls) == 2:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")  # sent, answer unreadable
+        return resp
+
+    monkeypatch.setattr(client, "post", flaky_post)
+    agent.dispatch_queue()
+    agent.dispatch_queue()
+    assert len(graph.sent_mail) == 25
+    assert queue.count_by_state() == {"sent": 20, "sending": 5}
+
+
+def test_dispatch_without_drafts_fetches_no_token(agent, monkeypatch):
+    monkeypatch.setattr(agent, "START_HOUR", 0)
+    monkeypatch.setattr(agent, "END_HOUR", 24)
+    queue = agent.get_default_mailbox().queue
+    queue.push(_message("m1"), 0)
+    monkeypatch.setattr(agent, "send_emails", lambda *args: pytest.fail("send_emails called"))
+    monkeypatch.setattr(queue, "mark_sending", lambda ids: pytest.fail("mark_sending called"))
+    agent.dispatch_queue()
+    assert queue.count_by_state() == {"pending": 1}
+    assert queue.next_send_at() > 0
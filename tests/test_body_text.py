@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from bench_body_text import bs4_text, newsletter_html
+from utils import body_text
+
+HTML = [
+    "<p>Hello</p><p>World</p>",
+    "<div>Fish &amp; chips &nbsp; &quot;today&quot; &copy; 2025</div>",
+    "<p>a < b and c > d</p>",
+    "<a href='x' title='a>b'>link text</a> after",
+    '<td title="1 > 0">cell</td>',
+    "<!-- hidden --><p>shown</p><!-- also hidden -->",
+    "<script>var t = '<b>not text</b>';</script><p>text</p>",
+    "<STYLE>td{padding:0}</STYLE><P>Upper case tags</P>",
+    "<!DOCTYPE html><br/>line<br>break",
+    "   <p>  padded  </p>  \n\n <p></p>",
+    "<p>Café – déjà vu 🙂</p>",
+    "plain text, no tags",
+]
+
+
+@pytest.mark.parametrize("content", HTML)
+def test_html_to_text_matches_beautifulsoup(content):
+    assert body_text.html_to_text(content) == bs4_text(content)
+
+
+def test_html_to_text_matches_beautifulsoup_on_newsletters():
+    rng = random.Random(3)
+    for _ in range(10):
+        content = newsletter_html(20, rng)
+        assert body_text.html_to_text(content) == bs4_text(content)
+
+
+def test_extract_body_text_is_cached_per_change_key():
+    message = {"id": "cache-test", "changeKey": "ck1", "body": {"contentType": "html", "content": "<p>one</p>"}}
+    assert body_text.extract_body_text(message) == "one"
+    hits = body_text.cache_hits
+    assert body_text.extract_body_text(dict(message)) == "one"
+    assert body_text.cache_hits == hits + 1
+
+    edited = dict(message, changeKey="ck2", body={"contentType": "html", "content": "<p>two</p>"})
+    assert body_text.extract_body_text(edited) == "two"
+
+
+def test_extract_body_text_strips_plain_text():
+    assert body_text.extract_body_text({"body": {"contentType": "text", "content": "  Hi there \n"}}) == "Hi there"
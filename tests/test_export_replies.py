@@ -0,0 +1,68 @@
+import json
+
+from conftest import USER
+from export_replies import export_jsonl, export_to_json
+
+
+def _fill(graph, n, start=0):
+    for i in range(start, start + n):
+        graph.add_message(USER, subject=f"Question {i}", body="Is the course still open?")
+
+
+def _message_gets(graph):
+    return sum(1 for method, path in graph.requests if method == "GET" and path.endswith("/messages"))
+
+
+def test_rerun_after_a_complete_export_exports_again(graph, tmp_path):
+    path, checkpoint = str(tmp_path / "replies.jsonl"), str(tmp_path / "replies.jsonl.checkpoint")
+    _fill(graph, 25)
+    assert export_jsonl(path, checkpoint=checkpoint, page_size=10) == 25
+    assert not (tmp_path / "replies.jsonl.checkpoint").exists()
+
+    _fill(graph, 5, start=25)
+    assert export_jsonl(path, checkpoint=checkpoint, page_size=10) == 30
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 30
+
+
+def test_interrupted_export_resumes_from_the_checkpoint(graph, tmp_path, monkeypatch):
+    import export_replies
+    path, checkpoint = str(tmp_path / "replies.jsonl"), str(tmp_path / "replies.jsonl.checkpoint")
+    _fill(graph, 25)
+    pages = export_replies.iter_message_pages
+
+    def two_pages(*args, **kwargs):
+        for i, page in enumerate(pages(*args, **kwargs)):
+            if i == 2:
+                raise KeyboardInterrupt
+            yield page
+
+    monkeypatch.setattr(export_replies, "iter_message_pages", two_pages)
+    try:
+        export_jsonl(path, checkpoint=checkpoint, page_size=10)
+    except KeyboardInterrupt:
+        pass
+    assert json.load(open(checkpoint))["exported"] == 20
+
+    monkeypatch.setattr(export_replies, "iter_message_pages", pages)
+    assert export_jsonl(path, checkpoint=checkpoint, page_size=10) == 25
+    with open(path, encoding="utf-8") as f:
+        assert sorted(json.loads(line)["subject"] for line in f) == sorted(f"Question {i}" for i in range(25))
+
+
+def test_limit_fetches_no_page_past_it(graph, tmp_path):
+    _fill(graph, 250)
+    assert export_jsonl(str(tmp_path / "replies.jsonl"), limit=30) == 30
+    assert _message_gets(graph) == 1
+
+    graph.requests.clear()
+    assert export_jsonl(str(tmp_path / "more.jsonl"), limit=150) == 150
+    assert _message_gets(graph) == 2
+
+
+def test_json_export_fetches_no_page_past_the_limit(graph, tmp_path):
+    _fill(graph, 250)
+    path = tmp_path / "replies.json"
+    export_to_json(str(path), limit=50)
+    assert len(json.loads(path.read_text(encoding="utf-8"))) == 50
+    assert _message_gets(graph) == 1
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from utils.filters import COMPILED_FILTERS, FILTER_PATTERNS, FilterEngine, _required_literal
+
+ENGINE = FilterEngine(FILTER_PATTERNS)
+
+
+def naive_first_match(text):
+    for pat, reason in COMPILED_FILTERS:
+        if pat.search(text):
+            return reason
+    return None
+
+
+CASES = [
+    "Question\nIs the course still open?",
+    "Re: hi\nI am OUT OF OFFICE until Monday",
+    "Re: hi\nI am out Of oFFice until Monday",
+    # Characters that only match ASCII letters under re.IGNORECASE
+    "hello\nthis is ſpam",                       # long s
+    "hello\nthis is ſcam",
+    "hello\nI will be bacK on Monday",       # Kelvin sign
+    "hello\nNOT İNTERESTED",                 # dotted capital I
+    "hello\nnot ınterested",                 # dotless i
+    "hello\nAway from the DESK",
+    # Optional characters break the literal run
+    "Autoreply: hi\nback soon",
+    "AUTO-REPLY\nback soon",
+    "auto reply\nback soon",
+    # Alternation
+    "hi\nI am on HOLIDAY",
+    "hi\nI am on Vacation",
+    "hi\nI am on leave",
+    # ^ anchors at the start of the text only
+    "[Preview] weekly\nReport Domain: example.com",
+    "Preview weekly\nReport Domain: example.com",
+    "Weekly\n[Preview] Report Domain: example.com",
+    # .* spans
+    "Hi\nYour email has been successfully received",
+    "Hi\nPlease allow 48 hours to respond",
+    # Non-ASCII text around triggers
+    "Café ☕\nJE VOUS REMERCIE pour votre message",
+    "Grüße\nIch bin im Urlaub – ſcam alert",
+    "日本語の件名\nThank You For Contacting us",
+    "déjà vu\nYour ONE-TIME PASSCODE is 123456",
+    "déjà vu\nYour one time passcode is 123456",
+    "🙂\nplease remove me from this list",
+    "Ünïcödé\nnothing to see here",
+]
+
+
+@pytest.mark.parametrize("text", CASES)
+def test_first_match_agrees_with_a_loop_over_the_patterns(text):
+    assert ENGINE.first_match(text) == naive_first_match(text)
+
+
+def test_first_match_agrees_on_generated_text():
+    phrases = ["out of office", "ooo", "away until", "on holiday", "currently out", "will be back on",
+               "away from the desk", "auto-reply", "autoreply", "automatic response", "message received",
+               "thanks for your email", "thank you for contacting", "je vous remercie", "hours of operation",
+               "login passcode", "one-time passcode", "not interested", "unsubscribe", "remove me",
+               "stop emailing", "scam", "spam", "report domain:", "preview"]
+    swaps = {"s": "ſ", "k": "K", "i": "ı", "I": "İ"}
+    rng = random.Random(9)
+    for _ in range(3000):
+        words = [rng.choice(phrases + ["hello", "café", "déjà", "naïve", "🙂", "question"])
+                 for _ in range(rng.randint(1, 6))]
+        text = " ".join(words)
+        text = "".join(c.upper() if rng.random() < 0.3 else c for c in text)
+        text = "".join(swaps[c] if c in swaps and rng.random() < 0.2 else c for c in text)
+        if rng.random() < 0.5:
+            text = text.replace(" ", "\n", 1)
+        assert ENGINE.first_match(text) == naive_first_match(text), text
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    (r"\bOut of Office\b", "out of office"),
+    (r"\bauto-?reply\b", "reply"),
+    (r"\bOn (vacation|holiday)\b", "on "),
+    (r"^\[?Preview\]?.*Report Domain:", "report domain:"),
+    (r"(spam|scam)", ""),
+    (r"\bcafé\b", ""),
+])
+def test_required_literal(pattern, literal):
+    assert _required_literal(pattern) == literal
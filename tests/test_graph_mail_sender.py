@@ -0,0 +1,36 @@
+import pytest
+
+import graph_client
+from conftest import USER
+from graph_mail_sender import BATCH_LIMIT, NO_RESPONSE, send_emails
+
+
+def _replies(n):
+    return [(f"r{i}", f"fan{i}@example.com", "Re: Question", "Thanks for writing!") for i in range(n)]
+
+
+def _fail_second_batch(monkeypatch, error, after_sending):
+    client = graph_client.get_graph_client()
+    post, calls = client.post, []
+
+    def flaky_post(url, **kwargs):
+        calls.append(url)
+        if len(calls) != 2:
+            return post(url, **kwargs)
+        if after_sending:
+            post(url, **kwargs)
+        raise error
+
+    monkeypatch.setattr(client, "post", flaky_post)
+
+
+@pytest.mark.parametrize("error, after_sending", [
+    (ValueError("Expecting value: line 1 column 1 (char 0)"), True),  # unreadable answer
+    (RuntimeError("could not refresh the access token"), False),       # token refresh midway
+])
+def test_a_failing_batch_call_keeps_the_earlier_results(graph, monkeypatch, error, after_sending):
+    _fail_second_batch(monkeypatch, error, after_sending)
+    statuses = send_emails(_replies(BATCH_LIMIT + 5), USER)
+    assert [statuses[f"r{i}"] for i in range(BATCH_LIMIT)] == [202] * BATCH_LIMIT
+    assert [statuses[f"r{i}"] for i in range(BATCH_LIMIT, BATCH_LIMIT + 5)] == [NO_RESPONSE] * 5
+    assert len(graph.sent_mail) == BATCH_LIMIT + (5 if after_sending else 0)
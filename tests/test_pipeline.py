@@ -0,0 +1,152 @@
+"""
+The reply pipeline end to end against the fake Graph: reading, delta
+sync, the agent's fetch -> draft -> send cycle, and push mode.
+"""
+
+import asyncio
+import json
+import time
+import urllib.request
+
+from conftest import USER, WEBHOOK_PORT
+from synthetic_mailbox import fill_mailbox, generate_messages
+
+
+def test_reader_follows_every_page(graph):
+    from graph_mail_reader import iter_unread_messages
+    fill_mailbox(graph, USER, 120, html_ratio=0.5, html_kb=2, seed=1)
+    graph.update_message(USER, graph.message_ids(USER)[0], isRead=True)
+    messages = list(iter_unread_messages(page_size=50))
+    assert len(messages) == 119
+    assert len({m["id"] for m in messages}) == 119
+    assert all(m["full_body_text"] and "<table" not in m["full_body_text"] for m in messages)
+
+
+def test_delta_sync(graph, tmp_path):
+    from graph_mail_reader import iter_inbox_delta, load_delta_link
+    path = str(tmp_path / "delta_link")
+
+    def sync():
+        changes = {m["id"]: m for m in iter_inbox_delta(page_size=10, path=path)}
+        assert load_delta_link(path) is not None
+        return changes
+
+    fill_mailbox(graph, USER, 40, html_kb=2, seed=1)
+    assert set(sync()) == set(graph.message_ids(USER))
+
+    ids = graph.message_ids(USER)
+    read, deleted = ids[:3], ids[3:5]
+    new = [graph.add_message(USER, subject=f"New {i}", body="Is the course still open?") for i in range(3)]
+    for mid in read:
+        graph.update_message(USER, mid, isRead=True)
+    for mid in deleted:
+        graph.delete_message(USER, mid)
+    changes = sync()
+    assert set(changes) == set(new + read + deleted)
+    assert all(changes[mid]["isRead"] for mid in read)
+    assert all("@removed" in changes[mid] for mid in deleted)
+    assert sync() == {}
+
+    # Graph drops old sync state: the stored link gets 410 and a full resync follows
+    graph.expire_delta_tokens()
+    assert set(sync()) == set(graph.message_ids(USER))
+    assert sync() == {}
+
+
+def test_agent_fetches_drafts_and_sends(agent, graph, llm, monkeypatch):
+    monkeypatch.setattr(agent, "MIN_DELAY", 0)
+    monkeypatch.setattr(agent, "MAX_DELAY", 0)
+    monkeypatch.setattr(agent, "START_HOUR", 0)
+    monkeypatch.setattr(agent, "END_HOUR", 24)
+    messages = list(generate_messages(60, html_kb=2, seed=1))
+    for wave in (messages[:30], messages[30:]):
+        for m in wave:
+            graph.add_message(USER, **m)
+        already_sent = len(graph.sent_mail)
+        agent.enqueue_replies()
+        agent.draft_pending()
+        agent.dispatch_queue()
+        # Each thread has its own sender; messages of a thread arriving together share one reply
+        recipients = [mail["toRecipients"][0]["emailAddress"]["address"]
+                      for _, mail in graph.sent_mail[already_sent:]]
+        assert recipients and len(recipients) == len(set(recipients))
+
+    queue = agent.get_default_mailbox().queue
+    states = queue.count_by_state()
+    assert set(states) == {"sent"}
+    assert len(graph.sent_mail) == states["sent"]
+    assert queue.unfinished_sends() == []  # every answered message was marked read
+
+    # Nothing new: another cycle sends nothing
+    agent.enqueue_replies()
+    agent.draft_pending()
+    agent.dispatch_queue()
+    assert len(graph.sent_mail) == states["sent"]
+
+
+async def _until(condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
+
+
+def test_push_mode(agent, graph):
+    asyncio.run(_push_mode(agent, graph))
+
+
+async def _push_mode(agent, graph):
+    agent._loop = asyncio.get_running_loop()
+    agent._push_received = asyncio.Event()
+    mailbox = agent.get_default_mailbox()
+    mailbox.draft_requested, mailbox.queue_changed = asyncio.Event(), asyncio.Event()
+    mailbox.fetch_requested = asyncio.Event()
+    queue = mailbox.queue
+
+    def subscribed():
+        return [sid for sid, sub in graph.subscriptions.items() if sub["_user"] == USER]
+
+    def requests(method, path):
+        return sum(1 for m, p in graph.requests if m == method and p.endswith(path))
+
+    task = asyncio.create_task(agent.push_loop())
+    try:
+        assert await _until(lambda: len(subscribed()) == 1), "push_loop never subscribed"
+        (first_id,) = subscribed()
+
+        # New mail -> notification -> fetched by id -> enqueued
+        for i in range(10):
+            graph.add_message(USER, subject=f"Question {i}", sender=f"fan{i}@example.com",
+                              body="Hi! What is included in the course and how long do I have access?")
+        assert await _until(lambda: len(queue) == 10)
+
+        # A post without our client state is ignored
+        forged = json.dumps({"value": [{"clientState": "forged", "resourceData": {"id": "forged-id"}}]}).encode()
+        urllib.request.urlopen(urllib.request.Request(
+            f"http://127.0.0.1:{WEBHOOK_PORT}/notifications", data=forged, method="POST",
+            headers={"Content-Type": "application/json"}), timeout=5).close()
+        await asyncio.sleep(0.2)
+        assert not requests("GET", "/messages/forged-id")
+
+        # reauthorizationRequired -> the subscription is renewed
+        graph.send_lifecycle_event(first_id, "reauthorizationRequired")
+        assert await _until(lambda: requests("PATCH", f"/subscriptions/{first_id}") >= 1)
+
+        # missed -> a delta poll is requested
+        graph.send_lifecycle_event(first_id, "missed")
+        assert await _until(mailbox.fetch_requested.is_set)
+
+        # subscriptionRemoved -> subscribe again; new mail still arrives
+        graph.send_lifecycle_event(first_id, "subscriptionRemoved")
+        graph.subscriptions.pop(first_id)
+        assert await _until(lambda: len(subscribed()) == 1)
+        graph.add_message(USER, subject="After resubscribing", sender="late@example.com",
+                          body="Is the course still open for enrolment?")
+        assert await _until(lambda: len(queue) == 11)
+    finally:
+        # Shutting down deletes the subscription
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    assert subscribed() == []
@@ -0,0 +1,103 @@
+from reply_queue import ReplyQueue
+
+
+def _message(msg_id, conversation_id=None, received="2025-06-01T10:00:00Z", text="Is the course still open?"):
+    return {"id": msg_id, "conversationId": conversation_id, "receivedDateTime": received,
+            "subject": "Question", "from": {"emailAddress": {"address": "fan@example.com"}},
+            "full_body_text": text}
+
+
+def test_due_replies_come_out_earliest_first():
+    queue = ReplyQueue()
+    for msg_id, send_at in [("b", 20), ("a", 10), ("c", 30)]:
+        queue.push(_message(msg_id), send_at)
+    assert queue.next_send_at() == 10
+    assert [reply_id for reply_id, *_ in queue.pop_due(25)] == ["a", "b"]
+    assert len(queue) == 1 and queue.next_send_at() == 30
+
+
+def test_a_message_is_only_ever_queued_once():
+    queue = ReplyQueue()
+    assert queue.push(_message("a"), 10)
+    assert not queue.push(_message("a"), 20)
+    queue.pop_due(10)
+    queue.mark_sending(["a"])
+    queue.mark_sent(["a"])
+    assert not queue.push(_message("a"), 30)
+    assert queue.has_message("a")
+
+
+def test_follow_ups_fold_into_the_waiting_reply():
+    queue = ReplyQueue()
+    queue.push(_message("a", "conv", "2025-06-01T10:00:00Z", "First question"), 10)
+    queue.push(_message("b", "conv", "2025-06-01T11:00:00Z", "Second question"), 99)
+    assert len(queue) == 1 and queue.next_send_at() == 10  # keeps the first send time
+    assert queue.message_ids("a") == ["a", "b"]
+    msg = queue.get_message("a")
+    assert msg["id"] == "b"
+    assert msg["thread_context"] == [["2025-06-01T10:00:00Z", "First question"]]
+
+
+def test_a_draft_for_a_folded_message_is_refused():
+    queue = ReplyQueue()
+    queue.push(_message("a", "conv", "2025-06-01T10:00:00Z"), 10)
+    _, version = queue.get_message("a", with_version=True)
+    queue.push(_message("b", "conv", "2025-06-01T11:00:00Z"), 10)
+    assert not queue.set_draft("a", "Stale draft", version)
+    assert queue.pending_drafts() == ["a"]
+    _, version = queue.get_message("a", with_version=True)
+    assert queue.set_draft("a", "Fresh draft", version)
+    assert queue.count_by_state() == {"drafted": 1}
+
+
+def test_a_sent_reply_starts_a_new_one_for_its_conversation():
+    queue = ReplyQueue()
+    queue.push(_message("a", "conv"), 10)
+    queue.pop_due(10)
+    queue.mark_sending(["a"])
+    assert queue.push(_message("b", "conv"), 20)
+    assert queue.pop_due(20)[0][0] == "b"
+
+
+def test_cancel_drops_the_whole_reply():
+    queue = ReplyQueue()
+    queue.push(_message("a", "conv"), 10)
+    queue.push(_message("b", "conv"), 10)
+    queue.push(_message("c"), 20)
+    assert queue.cancel("b")
+    assert not queue.cancel("b")
+    assert "a" not in queue and len(queue) == 1
+    assert [reply_id for reply_id, *_ in queue.pop_due(100)] == ["c"]
+
+
+def test_postpone_and_retry():
+    queue = ReplyQueue()
+    queue.push(_message("a"), 10)
+    queue.set_draft("a", "Draft")
+    queue.pop_due(10)
+    queue.mark_sending(["a"])
+    queue.postpone("a", 50)  # failed before reaching Graph
+    assert queue.count_by_state() == {"drafted": 1} and queue.next_send_at() == 50
+    for send_at in (50, 60):  # rejected twice, then a third time
+        queue.pop_due(send_at)
+        assert queue.retry("a", send_at + 10)
+    queue.pop_due(70)
+    assert not queue.retry("a", 80)
+    assert queue.count_by_state() == {"failed": 1} and len(queue) == 0
+
+
+def test_the_schedule_survives_a_restart(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = ReplyQueue(path)
+    queue.push(_message("a"), 10)
+    queue.push(_message("b"), 20)
+    queue.set_draft("b", "Draft")
+    queue.push(_message("c"), 30)
+    queue.pop_due(30)
+    queue.mark_sending(["c"])
+
+    queue = ReplyQueue(path)
+    assert len(queue) == 2 and queue.next_send_at() == 10
+    assert queue.pending_drafts() == ["a"]
+    assert queue.unfinished_sends() == ["c"]
+    assert not queue.push(_message("c"), 40)
@@ -0,0 +1,37 @@
+import pytest
+
+from gpt.generator import trim_email_body
+
+# (email text, expected trimmed text)
+CASES = [
+    # Quoted history and forwarded headers go
+    ("Is the course still open?\n\nOn Mon, Jun 2, 2025 at 9:14 AM Support <support@example.com> wrote:\n> Hi!",
+     "Is the course still open?"),
+    ("Any update?\n\nFrom: Support <support@example.com>\nSent: Monday\nTo: me\nSubject: Order",
+     "Any update?"),
+    ("See below\n\n-----Original Message-----\nold text", "See below"),
+    # Signatures and footers go
+    ("Where is my download link?\n\nSent from my iPhone", "Where is my download link?"),
+    ("Where is my download link?\n--\nAnna", "Where is my download link?"),
+    ("Can you help?\n\nThanks,\nJane Doe\nFounder & CEO, Acme Studios\n+1 555-123-4567\nwww.acme.example",
+     "Can you help?\n\nThanks,"),
+    ("Hi\n\nBest regards,\nDr. Will Smith\nAcme Inc.", "Hi\n\nBest regards,"),
+    ("Question about the bundle?\nCheers\nBob\n\nThis email is confidential and intended only for you.",
+     "Question about the bundle?\nCheers\nBob"),
+    # A sign-off word followed by the actual message is not a signature
+    ("Hi Fiona,\nThanks!\nI bought the guide but can't find the download link. Can you resend it?",
+     "Hi Fiona,\nThanks!\nI bought the guide but can't find the download link. Can you resend it?"),
+    ("Best\n\nDoes the $28 product include the templates?",
+     "Best\n\nDoes the $28 product include the templates?"),
+    ("Love!\nWhen is the next drop", "Love!\nWhen is the next drop"),
+    ("Thanks\nI need the link for the workbook please", "Thanks\nI need the link for the workbook please"),
+    ("Thank you so much\nThe templates saved me hours this week.",
+     "Thank you so much\nThe templates saved me hours this week."),
+    # Nothing would be left: keep the text
+    ("> only quoted text", "> only quoted text"),
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_trim_email_body(text, expected):
+    assert trim_email_body(text) == expected
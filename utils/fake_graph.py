@@ -0,0 +1,451 @@
+"""
+A tiny in-process stand-in for the parts of Microsoft Graph this project uses.
+
+Run it locally and point the agent at it instead of graph.microsoft.com:
+
+    python -m utils.fake_graph --port 8765 --messages 200
+    GRAPH_BASE_URL=http://127.0.0.1:8765/v1.0 GRAPH_ACCESS_TOKEN=fake EMAIL_ADDRESS=me@example.com python graph_mail_reader.py
+
+Or drive it from Python:
+
+    with FakeGraph() as graph:
+        graph.add_message("me@example.com", subject="Hi", body="Hello")
+        ...  # graph.base_url -> http://127.0.0.1:<port>/v1.0
+
+Supported endpoints:
+    GET   /users/{u}/mailFolders/Inbox/messages         ($filter=isRead eq false, $top, $select)
+    GET   /users/{u}/mailFolders/Inbox/messages/delta   ($deltatoken / $skiptoken, odata.maxpagesize)
+    GET   /users/{u}/messages/{id}                      ($select)
+    PATCH /users/{u}/messages/{id}
+    POST  /users/{u}/sendMail
+    POST  /$batch                                        (up to 20 sub-requests)
+    POST  /subscriptions                                 (validates notificationUrl)
+    PATCH /subscriptions/{id}
+    DELETE /subscriptions/{id}
+
+latency= adds a delay to every HTTP request and throttle_rate= answers that
+fraction of requests (and of $batch sub-requests) with 429 and a
+Retry-After header, to see how clients behave under Graph throttling.
+
+With a subscription on a user's Inbox, adding, updating or deleting one of
+their messages POSTs a change notification to its notificationUrl, from a
+background thread, like Graph does. send_lifecycle_event() posts lifecycle
+notifications ("missed", "subscriptionRemoved", ...).
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+DEFAULT_PAGE_SIZE = 10
+
+_ROUTES = [
+    ("GET",   re.compile(r"^/v1\.0/users/([^/]+)/mailFolders/Inbox/messages/delta$"), "_get_delta"),
+    ("GET",   re.compile(r"^/v1\.0/users/([^/]+)/mailFolders/Inbox/messages$"), "_list_messages"),
+    ("GET",   re.compile(r"^/v1\.0/users/([^/]+)/messages/([^/]+)$"), "_get_message"),
+    ("PATCH", re.compile(r"^/v1\.0/users/([^/]+)/messages/([^/]+)$"), "_patch_message"),
+    ("POST",  re.compile(r"^/v1\.0/users/([^/]+)/sendMail$"), "_send_mail"),
+    ("POST",  re.compile(r"^/v1\.0/\$batch$"), "_batch"),
+    ("POST",  re.compile(r"^/v1\.0/subscriptions$"), "_create_subscription"),
+    ("PATCH", re.compile(r"^/v1\.0/subscriptions/([^/]+)$"), "_update_subscription"),
+    ("DELETE", re.compile(r"^/v1\.0/subscriptions/([^/]+)$"), "_delete_subscription"),
+]
+
+BATCH_LIMIT = 20
+_INBOX_RESOURCE_RE = re.compile(r"^/?users/([^/]+)/mailFolders\('?Inbox'?\)/messages$", re.IGNORECASE)
+# receivedDateTime ge/lt clauses in $filter; timestamps are ISO 8601 UTC, so they compare as strings
+_RECEIVED_RE = re.compile(r"receivedDateTime (ge|lt) (\S+)")
+
+
+class _Request:
+    """The bits of an HTTP request the route handlers need."""
+
+    def __init__(self, method, url, headers=None, body=None):
+        parts = urlsplit(url)
+        self.method = method
+        self.path = parts.path
+        self.query = parse_qs(parts.query)
+        self.headers = headers or {}
+        self.body = body
+
+
+class FakeGraph:
+    """
+    In-memory mailboxes served over HTTP on 127.0.0.1.
+    Every add/update/delete bumps a global change counter; delta tokens are
+    simply counter values, so a delta query returns everything changed since.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=None):
+        self.latency = latency            # seconds added to every HTTP request
+        self.throttle_rate = throttle_rate  # fraction of requests answered 429
+        self.retry_after = retry_after    # Retry-After sent with those 429s
+        self.throttled = 0                # 429s handed out so far
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._mailboxes = {}         # user -> {message_id: message}
+        self._tombstones = {}        # user -> {message_id: version}
+        self._version = 0
+        self._min_valid_token = 0    # delta tokens below this answer 410 Gone
+        self.requests = []           # (method, path) log, handy for assertions
+        self.sent_mail = []          # (user, message) for every sendMail
+        self.subscriptions = {}      # id -> subscription
+        self.notifications = []      # (url, payload, status) for every notification posted
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._thread = None
+
+    # --- lifecycle ---
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1.0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- mailbox manipulation ---
+    def add_message(self, user, subject="", body="", sender="someone@example.com",
+                    content_type="text", is_read=False, **extra):
+        with self._lock:
+            self._version += 1
+            message = {
+                "id": extra.pop("id", None) or uuid.uuid4().hex,
+                "subject": subject,
+                "from": {"emailAddress": {"name": sender.split("@")[0], "address": sender}},
+                "body": {"contentType": content_type, "content": body},
+                "isRead": is_read,
+                "receivedDateTime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "_version": self._version,
+            }
+            message.update(extra)
+            message.setdefault("conversationId", message["id"])
+            self._mailboxes.setdefault(user.lower(), {})[message["id"]] = message
+        self._notify(user, "created", message["id"])
+        return message["id"]
+
+    def update_message(self, user, message_id, **fields):
+        with self._lock:
+            message = self._mailboxes[user.lower()][message_id]
+            self._version += 1
+            message.update(fields)
+            message["_version"] = self._version
+        self._notify(user, "updated", message_id)
+
+    def delete_message(self, user, message_id):
+        with self._lock:
+            self._mailboxes[user.lower()].pop(message_id)
+            self._version += 1
+            self._tombstones.setdefault(user.lower(), {})[message_id] = self._version
+        self._notify(user, "deleted", message_id)
+
+    def get_message(self, user, message_id):
+        with self._lock:
+            return dict(self._mailboxes[user.lower()][message_id])
+
+    def message_ids(self, user):
+        with self._lock:
+            return list(self._mailboxes.get(user.lower(), {}))
+
+    def expire_delta_tokens(self):
+        """Invalidate every delta token handed out so far (next use gets 410)."""
+        with self._lock:
+            self._version += 1
+            self._min_valid_token = self._version
+
+    def send_lifecycle_event(self, subscription_id, event):
+        """POST a lifecycle notification such as "missed" for a subscription."""
+        with self._lock:
+            sub = self.subscriptions[subscription_id]
+        self._post_async(sub.get("lifecycleNotificationUrl") or sub["notificationUrl"], {"value": [{
+            "subscriptionId": sub["id"], "lifecycleEvent": event, "clientState": sub.get("clientState"),
+            "subscriptionExpirationDateTime": sub["expirationDateTime"],
+        }]})
+
+    # --- change notifications ---
+    def _notify(self, user, change_type, message_id):
+        with self._lock:
+            subs = [s for s in self.subscriptions.values()
+                    if s["_user"] == user.lower() and change_type in s["changeType"].split(",")]
+        for sub in subs:
+            self._post_async(sub["notificationUrl"], {"value": [{
+                "subscriptionId": sub["id"],
+                "clientState": sub.get("clientState"),
+                "changeType": change_type,
+                "resource": f"Users/{user}/Messages/{message_id}",
+                "resourceData": {"@odata.type": "#Microsoft.Graph.Message", "id": message_id},
+                "subscriptionExpirationDateTime": sub["expirationDateTime"],
+            }]})
+
+    def _post_async(self, url, payload):
+        threading.Thread(target=self._post, args=(url, payload), daemon=True).start()
+
+    def _post(self, url, payload, content_type="application/json"):
+        data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        request = urllib.request.Request(url, data=data, method="POST",
+                                         headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as resp:
+                status, body = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except OSError:
+            status, body = 0, b""
+        with self._lock:
+            self.notifications.append((url, payload, status))
+        return status, body
+
+    # --- fault injection ---
+    def serve(self, req):
+        """
+        Handle a request arriving over HTTP: wait out `latency`, maybe
+        throttle it, else route it. Returns (status, json_body, headers).
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_throttle():
+            return (429, {"error": {"code": "TooManyRequests", "message": "Too many requests."}},
+                    {"Retry-After": str(self.retry_after)})
+        status, data = self.handle(req)
+        return status, data, {}
+
+    def _should_throttle(self):
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            if self._rng.random() < self.throttle_rate:
+                self.throttled += 1
+                return True
+        return False
+
+    # --- request handlers: return (status, json_body) ---
+    def handle(self, req):
+        self.requests.append((req.method, req.path))
+        for method, pattern, name in _ROUTES:
+            m = pattern.match(req.path)
+            if method == req.method and m:
+                return getattr(self, name)(req, req.query, *m.groups())
+        return 404, {"error": {"code": "NotFound", "message": req.path}}
+
+    def _list_messages(self, req, query, user):
+        top = int(query.get("$top", [DEFAULT_PAGE_SIZE])[0])
+        skip = int(query.get("$skip", [0])[0])
+        filter_ = query.get("$filter", [""])[0]
+        with self._lock:
+            msgs = list(self._mailboxes.get(user.lower(), {}).values())
+        if "isRead eq false" in filter_:
+            msgs = [m for m in msgs if not m["isRead"]]
+        for op, value in _RECEIVED_RE.findall(filter_):
+            if op == "ge":
+                msgs = [m for m in msgs if m["receivedDateTime"] >= value]
+            else:
+                msgs = [m for m in msgs if m["receivedDateTime"] < value]
+        page = msgs[skip:skip + top]
+        data = {"value": [_project(m, query) for m in page]}
+        if skip + top < len(msgs):
+            data["@odata.nextLink"] = self._with_query(req, query, {"$skip": skip + top})
+        return 200, data
+
+    def _get_delta(self, req, query, user):
+        page_size = _max_page_size(req.headers.get("Prefer", "")) or DEFAULT_PAGE_SIZE
+        if "$skiptoken" in query:
+            since, offset, snapshot = (int(x) for x in query["$skiptoken"][0].split("."))
+        else:
+            since = int(query.get("$deltatoken", [0])[0])
+            offset = 0
+            with self._lock:
+                snapshot = self._version
+        if "$deltatoken" in query and (since < self._min_valid_token or since > self._version):
+            return 410, {"error": {"code": "SyncStateNotFound",
+                                   "message": "The sync state generation is not found."}}
+
+        with self._lock:
+            changed = [m for m in self._mailboxes.get(user.lower(), {}).values()
+                       if since < m["_version"] <= snapshot]
+            removed = [(mid, v) for mid, v in self._tombstones.get(user.lower(), {}).items()
+                       if 0 < since < v <= snapshot]  # initial sync has no removals
+        entries = sorted(
+            [(m["_version"], _project(m, query)) for m in changed] +
+            [(v, {"id": mid, "@removed": {"reason": "deleted"}}) for mid, v in removed],
+            key=lambda e: e[0],
+        )
+        page = [e[1] for e in entries[offset:offset + page_size]]
+        data = {"value": page}
+        base = {k: v for k, v in query.items() if k not in ("$skiptoken", "$deltatoken")}
+        if offset + page_size < len(entries):
+            data["@odata.nextLink"] = self._with_query(
+                req, base, {"$skiptoken": f"{since}.{offset + page_size}.{snapshot}"})
+        else:
+            data["@odata.deltaLink"] = self._with_query(req, base, {"$deltatoken": snapshot})
+        return 200, data
+
+    def _get_message(self, req, query, user, message_id):
+        try:
+            return 200, _project(self.get_message(user, message_id), query)
+        except KeyError:
+            return 404, {"error": {"code": "ErrorItemNotFound", "message": "Not found."}}
+
+    def _patch_message(self, req, query, user, message_id):
+        try:
+            self.update_message(user, message_id, **(req.body or {}))
+        except KeyError:
+            return 404, {"error": {"code": "ErrorItemNotFound", "message": "Not found."}}
+        return 200, _project(self.get_message(user, message_id), {})
+
+    def _send_mail(self, req, query, user):
+        message = (req.body or {}).get("message")
+        if not message or not message.get("toRecipients"):
+            return 400, {"error": {"code": "ErrorInvalidRecipients", "message": "No recipients."}}
+        with self._lock:
+            self.sent_mail.append((user.lower(), message))
+        return 202, None
+
+    def _batch(self, req, query):
+        sub_requests = (req.body or {}).get("requests", [])
+        if len(sub_requests) > BATCH_LIMIT:
+            return 400, {"error": {"code": "BadRequest",
+                                   "message": f"Batch limit is {BATCH_LIMIT} requests."}}
+        responses = []
+        for sub in sub_requests:
+            if self._should_throttle():
+                responses.append({"id": sub["id"], "status": 429,
+                                  "headers": {"Retry-After": str(self.retry_after)},
+                                  "body": {"error": {"code": "TooManyRequests", "message": "Throttled."}}})
+                continue
+            status, body = self.handle(_Request(sub["method"], "/v1.0" + sub["url"],
+                                                sub.get("headers"), sub.get("body")))
+            responses.append({"id": sub["id"], "status": status, "body": body})
+        return 200, {"responses": responses}
+
+    def _create_subscription(self, req, query):
+        sub = dict(req.body or {})
+        missing = [k for k in ("changeType", "notificationUrl", "resource", "expirationDateTime")
+                   if not sub.get(k)]
+        m = _INBOX_RESOURCE_RE.match(sub.get("resource", ""))
+        if missing or not m:
+            return 400, {"error": {"code": "InvalidRequest",
+                                   "message": f"Missing {missing}" if missing else "Unsupported resource."}}
+        # Like Graph: the endpoint must echo a validation token before we subscribe
+        token = uuid.uuid4().hex
+        sep = "&" if "?" in sub["notificationUrl"] else "?"
+        status, body = self._post(sub["notificationUrl"] + sep + "validationToken=" + quote(token),
+                                  "", content_type="text/plain")
+        if status != 200 or body.decode(errors="replace") != token:
+            return 400, {"error": {"code": "ValidationError",
+                                   "message": "Subscription validation request failed."}}
+        sub.update(id=uuid.uuid4().hex, _user=m.group(1).lower())
+        with self._lock:
+            self.subscriptions[sub["id"]] = sub
+        return 201, _project(sub, {})
+
+    def _update_subscription(self, req, query, subscription_id):
+        with self._lock:
+            sub = self.subscriptions.get(subscription_id)
+            if sub is None:
+                return 404, {"error": {"code": "ResourceNotFound", "message": "Subscription not found."}}
+            sub["expirationDateTime"] = (req.body or {}).get("expirationDateTime", sub["expirationDateTime"])
+            return 200, _project(sub, {})
+
+    def _delete_subscription(self, req, query, subscription_id):
+        with self._lock:
+            if self.subscriptions.pop(subscription_id, None) is None:
+                return 404, {"error": {"code": "ResourceNotFound", "message": "Subscription not found."}}
+        return 204, None
+
+    def _with_query(self, req, query, overrides):
+        params = {k: v[0] if isinstance(v, list) else v for k, v in query.items()}
+        params.update(overrides)
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{req.path}?" + "&".join(f"{k}={v}" for k, v in params.items())
+
+
+def _project(message, query):
+    """Apply $select and strip internal bookkeeping fields."""
+    select = query.get("$select", [""])[0]
+    fields = [f for f in select.split(",") if f]
+    out = {k: v for k, v in message.items() if not k.startswith("_")}
+    if fields:
+        out = {k: v for k, v in out.items() if k in fields or k == "id"}
+    return out
+
+
+def _max_page_size(prefer):
+    m = re.search(r"odata\.maxpagesize=(\d+)", prefer)
+    return int(m.group(1)) if m else None
+
+
+def _make_handler(graph):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass  # keep test output quiet
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"null")
+
+        def send_json(self, status, data, headers=None):
+            payload = json.dumps(data).encode() if data is not None else b""
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _dispatch(self, method):
+            body = self.read_json() if method in ("POST", "PATCH") else None
+            status, data, headers = graph.serve(_Request(method, self.path, self.headers, body))
+            self.send_json(status, data, headers)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Microsoft Graph mail server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--user", default="me@example.com")
+    parser.add_argument("--messages", type=int, default=25, help="unread messages to seed")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    args = parser.parse_args()
+
+    graph = FakeGraph(port=args.port, latency=args.latency, throttle_rate=args.throttle_rate)
+    for i in range(1, args.messages + 1):
+        graph.add_message(args.user, subject=f"Question {i}",
+                          body=f"Hi! What's included in the product? ({i})")
+    print(f"Fake Graph listening on {graph.base_url} with {args.messages} messages for {args.user}")
+    graph._server.serve_forever()
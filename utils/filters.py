@@ -1,6 +1,16 @@
 import re
+import os
 import json
+import gzip
 import sys
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
 # Senders we never want to hit (from old utils/filters.py)
 NO_REPLY_ADDRESSES = [
@@ -69,78 +79,248 @@ COMPILED_FILTERS = [
     for pattern, reason in FILTER_PATTERNS
 ]
 
-def should_reply(message: dict) -> tuple[bool, str]:
+# Characters that match an ASCII letter under re.IGNORECASE but don't
+# lower() to it; folded first so the literal pre-check never misses a match
+_CASE_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+def _required_literal(pattern: str) -> str:
+    """
+    The longest run of plain characters every match of `pattern` must
+    contain, lowercased (e.g. 'out of office' for r'\bOut of Office\b').
+    Returns '' when there is no such ASCII run, e.g. for a top-level
+    alternation.
+    """
+    best = run = ''
+    for op, arg in sre_parse.parse(pattern):
+        if op is sre_parse.LITERAL:
+            run += chr(arg)
+        else:
+            best, run = max(best, run, key=len), ''
+    best = max(best, run, key=len).lower()
+    return best if best.isascii() else ''
+
+class FilterEngine:
+    """
+    Matches text against (pattern, reason) rules; the first rule in list
+    order that matches wins, exactly as a loop over COMPILED_FILTERS would.
+
+    The text is lowercased once, and each rule's required literal is
+    looked up with a plain substring test before its regex runs. Most rules
+    never reach the regex engine. This is several times faster than a
+    search per rule, and faster than one big alternation, which loses
+    CPython re's literal fast path.
+    """
+
+    def __init__(self, patterns):
+        self.rules = [
+            (_required_literal(pattern), re.compile(pattern, re.IGNORECASE), reason)
+            for pattern, reason in patterns
+        ]
+
+    def first_match(self, text: str):
+        """
+        Reason of the first rule matching `text`, or None.
+        """
+        folded = text.lower() if text.isascii() else text.translate(_CASE_FOLD).lower()
+        for literal, pat, reason in self.rules:
+            if literal in folded and pat.search(text):
+                return reason
+        return None
+
+FILTER_ENGINE = FilterEngine(FILTER_PATTERNS)
+
+def should_reply(message: dict, engine: FilterEngine = FILTER_ENGINE) -> tuple[bool, str]:
     """
     Decide whether to reply to a message.
+    Accepts both exported messages (plain 'from' and 'body' strings) and
+    raw Graph messages (nested 'from', text in 'full_body_text').
     Returns (True, reason) if we should reply,
     or (False, reason) if we should filter it out.
     """
-    subject = message.get('subject', '')
+    subject = message.get('subject') or ''
     body = message.get('body', '') # Assumes this is the full plain text body
-    sender = message.get('from', '').lower() # Get sender, ensure it's a string
-    if isinstance(message.get('from'), dict):
-        sender = message['from'].get('emailAddress', {}).get('address', '').lower()
+    if isinstance(body, dict):
+        body = message.get('full_body_text', body.get('content', ''))
+    sender = message.get('from', '')
+    if isinstance(sender, dict):
+        sender = sender.get('emailAddress', {}).get('address', '')
+    sender = sender.lower()
 
     # 1. Check against no-reply senders
-    for deny_addr in NO_REPLY_ADDRESSES:
-        if deny_addr in sender:
-            return False, 'Sender in deny list'
+    if any(deny_addr in sender for deny_addr in NO_REPLY_ADDRESSES):
+        return False, 'Sender in deny list'
 
     # 2. Check for empty body (after sender check)
     if not body.strip():
         return False, 'Empty message body'
 
     # 3. Check combined subject and body against regex patterns
-    text_to_check = subject + '\n' + body
-    for pat, reason in COMPILED_FILTERS:
-        if pat.search(text_to_check):
-            return False, reason
+    reason = engine.first_match(subject + '\n' + body)
+    if reason is not None:
+        return False, reason
             
     # If no filter patterns matched, it's likely a genuine inquiry
     return True, 'Genuine question'
 
+def classify_batch(messages, engine: FilterEngine = FILTER_ENGINE) -> list:
+    """
+    Run should_reply over a list of messages.
+    Returns a list of (reply_flag, reason) in the same order.
+    """
+    return [should_reply(m, engine) for m in messages]
+
+def iter_messages(path: str):
+    """
+    Stream messages from a JSON array file or a JSON Lines file (as
+    written by export_replies.py, gzip-compressed if it ends in .gz), one
+    dict at a time, without loading the whole file. Use '-' to read JSON
+    Lines from stdin.
+    """
+    if path == '-':
+        for line in sys.stdin:
+            if line.strip():
+                yield json.loads(line)
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first != '[':
+            # JSON Lines: one object per line
+            for line in _prepend(first, f):
+                if line.strip():
+                    yield json.loads(line)
+            return
+        yield from _iter_json_array(f)
+
+def _prepend(first_char, f):
+    lines = iter(f)
+    yield first_char + next(lines, '')
+    yield from lines
+
+def _iter_json_array(f, read_size=1 << 16):
+    """
+    Decode the elements of a JSON array one by one from file `f`,
+    positioned just after the opening '['.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    eof = False
+    while True:
+        buf = buf.lstrip()
+        if buf.startswith(','):
+            buf = buf[1:].lstrip()
+        if buf.startswith(']'):
+            return
+        try:
+            if not buf:
+                raise json.JSONDecodeError("Need more data", buf, 0)
+            obj, end = decoder.raw_decode(buf)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = f.read(read_size)
+            eof = not more
+            buf += more
+            continue
+        yield obj
+        buf = buf[end:]
+
+def _classify_chunk(chunk: list) -> list:
+    """
+    Process-pool worker: classify [(index, message), ...] into decision
+    records.
+    """
+    decisions = []
+    for idx, message in chunk:
+        reply_flag, reason = should_reply(message)
+        decisions.append({
+            'index': idx,
+            'id': message.get('id', f'N/A_{idx}'),
+            'subject': str(message.get('subject', '')),
+            'reply': reply_flag,
+            'reason': reason,
+        })
+    return decisions
+
+def classify_stream(messages, workers: int = 1, chunk_size: int = 500):
+    """
+    Classify an iterable of messages, fanning chunks out to `workers`
+    processes. Yields decision records in input order while keeping only a
+    few chunks per worker in memory.
+    """
+    indexed = enumerate(messages, start=1)
+    chunks = iter(lambda: list(islice(indexed, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _classify_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_classify_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
 if __name__ == '__main__':
-    # Load messages from replies.json
-    try:
-        with open('replies.json', encoding='utf-8') as f:
-            messages = json.load(f)
-    except FileNotFoundError:
-        print("Error: replies.json not found. Please run export_replies.py first.", file=sys.stderr)
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON from replies.json: {e}", file=sys.stderr)
+    parser = argparse.ArgumentParser(description="Classify exported messages with should_reply.")
+    parser.add_argument('input', nargs='?', default='replies.jsonl',
+                        help="JSON array or JSON Lines file ('-' for JSON Lines on stdin)")
+    parser.add_argument('--output', help="write one JSON decision per line to this file")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="processes to classify with (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help="messages sent to a worker at a time")
+    args = parser.parse_args()
+
+    if args.input != '-' and not os.path.exists(args.input):
+        print(f"Error: {args.input} not found. Please run `python export_replies.py {args.input}` first.",
+              file=sys.stderr)
         sys.exit(1)
 
     # Print header
-    print(f"Processed from: replies.json")
+    print(f"Processed from: {args.input}")
     print("Msg#\tID\tSubject\tDecision\tReason")
     
     kept_count = 0
     filtered_count = 0
+    reason_counts = Counter()
+    out = open(args.output, 'w', encoding='utf-8') if args.output else None
 
-    # Process all messages or a sample (e.g., messages[:20] for sample)
-    for idx, msg_data in enumerate(messages, start=1):
-        msg_id = msg_data.get('id', f'N/A_{idx}')
-        # Ensure subject is a string before replace
-        subject_str = str(msg_data.get('subject', ''))
-        subject_preview = subject_str.replace('\n', ' ')[:50] # Preview of subject
-        
-        reply_flag, reason = should_reply(msg_data)
-        decision = 'Reply' if reply_flag else 'Filter'
-        
-        if reply_flag:
-            kept_count += 1
-        else:
-            filtered_count += 1
-            
-        # Print results for all messages or a sample
-        # For full log, remove this conditional print or adjust the number
-        if idx <= 20 or (reply_flag and kept_count <=5) or (not reply_flag and filtered_count <=10): 
-            print(f"{idx}\t{msg_id[:10]}...\t{subject_preview}...\t{decision}\t{reason}")
-        elif idx == 21:
-            print("... (further output condensed, showing summary at end) ...")
+    try:
+        for decision in classify_stream(iter_messages(args.input), args.workers, args.chunk_size):
+            idx = decision['index']
+            reply_flag, reason = decision['reply'], decision['reason']
+            reason_counts[reason] += 1
+            if reply_flag:
+                kept_count += 1
+            else:
+                filtered_count += 1
+            if out:
+                out.write(json.dumps(decision) + '\n')
+
+            # Print a sample; the full log goes to --output
+            if idx <= 20 or (reply_flag and kept_count <=5) or (not reply_flag and filtered_count <=10): 
+                subject_preview = decision['subject'].replace('\n', ' ')[:50] # Preview of subject
+                print(f"{idx}\t{str(decision['id'])[:10]}...\t{subject_preview}...\t{'Reply' if reply_flag else 'Filter'}\t{reason}")
+            elif idx == 21:
+                print("... (further output condensed, showing summary at end) ...")
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON from {args.input}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if out:
+            out.close()
 
     print("\n--- Summary ---")
-    print(f"Total messages processed: {len(messages)}")
+    print(f"Total messages processed: {kept_count + filtered_count}")
     print(f"Messages to reply to:   {kept_count}")
-    print(f"Messages filtered out:  {filtered_count}")
\ No newline at end of file
+    print(f"Messages filtered out:  {filtered_count}")
+    print("\n--- Reasons ---")
+    for reason, count in reason_counts.most_common():
+        print(f"{count:8d}  {reason}")
+    if args.output:
+        print(f"\nDecisions written to {os.path.abspath(args.output)}")
@@ -0,0 +1,268 @@
+"""
+In-process metrics for the agent: counters, histograms and gauges, served
+in the Prometheus text format and dumped as JSON for log-based monitoring.
+
+    from utils.metrics import counter, histogram
+
+    SENT = counter("replies_sent_total", "Replies accepted by Graph", ["status"])
+    SENT.inc(status="202")
+    with histogram("agent_stage_seconds", "Time per pipeline stage", ["stage"]).time(stage="send"):
+        ...
+
+Recording is a dict update under a lock, cheap enough to leave on in
+production. Metrics are created once at import time and registered in
+REGISTRY; serve() exposes them on /metrics.
+"""
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers a cached lookup up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        try:
+            key = tuple([str(labels[name]) for name in self.labels])
+        except KeyError:
+            key = None
+        if key is None or len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {sorted(labels)}")
+        return key
+
+    def _unwrap(self, values):
+        """{label values: v} as JSON-friendly data; a bare v without labels."""
+        if not self.labels:
+            return values.get((), None)
+        return {",".join(key): value for key, value in values.items()}
+
+    def _label_text(self, key, extra=""):
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._label_text(key), value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return self._unwrap(self._values)
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Either set() it, or pass `fn` returning
+    the current value (or {label value: value} for a single label), which
+    is called whenever the metrics are collected.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _current(self):
+        if self.fn is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            value = self.fn()
+        except Exception:
+            return {}
+        if isinstance(value, dict):
+            return {(str(k),): v for k, v in value.items()}
+        return {(): value}
+
+    def samples(self):
+        return [(self.name + self._label_text(key), value) for key, value in sorted(self._current().items())]
+
+    def snapshot(self):
+        return self._unwrap(self._current())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                out.append((self.name + "_bucket" + self._label_text(key, f'le="{le}"'), cumulative))
+            out.append((self.name + "_sum" + self._label_text(key), total))
+            out.append((self.name + "_count" + self._label_text(key), count))
+        return out
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._values.items()]
+        return self._unwrap({key: {"count": count, "sum": round(total, 6),
+                                   "p50": self._quantile(counts, count, 0.5),
+                                   "p99": self._quantile(counts, count, 0.99)}
+                             for key, counts, total, count in items})
+
+    def _quantile(self, counts, count, q):
+        """Upper bound of the bucket holding the q-quantile (None past the last bucket)."""
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            if cumulative >= q * count:
+                return bound
+        return None
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        return self._get(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{sample} {_format_value(value)}" for sample, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """All metrics as plain data, for JSON logs."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def log_line(registry=REGISTRY) -> str:
+    """One JSON line with a timestamp and every metric's current value."""
+    return json.dumps({"event": "metrics", "ts": round(time.time(), 3), "metrics": registry.snapshot()},
+                      separators=(",", ":"))
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serve registry.render() on http://host:port/metrics from a daemon
+    thread. Returns the server; call shutdown() to stop it.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            payload = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float) and value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,53 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second, up to
+    `capacity`. acquire(n) blocks until n tokens are available.
+
+    Used to keep bursts of API calls inside a per-minute quota, e.g.
+    TokenBucket(rate=500 / 60, capacity=500) for 500 requests per minute.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """
+        Take `amount` tokens if available. Returns 0 on success, otherwise
+        the number of seconds to wait before they will be.
+        """
+        # Never ask for more than the bucket can ever hold
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount: float = 1):
+        while True:
+            wait = self.try_acquire(amount)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def refund(self, amount: float):
+        """
+        Give back tokens that were reserved but not used (or, with a
+        negative amount, charge extra once the real cost is known).
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
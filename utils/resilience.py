@@ -0,0 +1,245 @@
+import email.utils
+import random
+import threading
+import time
+
+from utils.rate_limit import TokenBucket
+from utils.metrics import counter
+
+# HTTP statuses worth retrying: throttling and transient server trouble
+THROTTLED_STATUSES = (429,)
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+_RETRIES = counter("outbound_retries_total", "Retried outbound calls by service and reason",
+                   ["service", "kind"])
+_CIRCUIT_OPENS = counter("circuit_opens_total", "Times a service's circuit breaker opened", ["service"])
+
+class CircuitOpen(RuntimeError):
+    """
+    Raised instead of calling a service that has been failing persistently.
+    """
+
+def retry_after_seconds(value):
+    """
+    Seconds to wait according to a Retry-After header (delta-seconds or an
+    HTTP date), or None if it's missing or unreadable.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(cap, base * 2**attempt)],
+    so clients that failed together don't retry together.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class CircuitBreaker:
+    """
+    Closed while calls succeed. After `failure_threshold` failures in a row
+    it opens and rejects calls for `reset_timeout` seconds, then lets a
+    single trial call through (half-open): success closes it again, failure
+    reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_running:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+class ServiceGuard:
+    """
+    Everything outbound calls to one service go through: a token bucket for
+    its quota, a shared pause when it answers 429 (honouring Retry-After),
+    jittered exponential backoff for transient failures, and a circuit
+    breaker for when it's down.
+
+    `classify(result, error)` tells call() how an attempt went. It returns
+    None for success (or a permanent failure not worth retrying), else
+    ("throttled" | "failed", retry_after_seconds_or_None). Only "failed"
+    counts against the circuit breaker: a throttling service is up, it just
+    wants us to slow down.
+
+    The pause after a 429 applies to every thread using the guard, so a
+    burst backs off together and resumes at the rate the service allows
+    instead of each thread hammering it until its own retries run out.
+    """
+
+    def __init__(self, name, classify, rate=None, burst=None, max_retries=4,
+                 base_delay=1.0, max_delay=60.0, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.classify = classify
+        self.bucket = TokenBucket(rate, burst or rate) if rate else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retries = self.throttled = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, fn, *args, cost: float = 1, classify=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) with retries. Returns its last result (which
+        may still be an error response once retries are used up) or raises
+        its last exception; raises CircuitOpen without calling fn if the
+        service is failing. `classify` overrides the guard's own for this
+        call, e.g. for a request that must not be repeated.
+        """
+        classify = classify or self.classify
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpen(f"{self.name} is failing; circuit open for up to "
+                                  f"{self.breaker.reset_timeout:.0f}s")
+            self._wait_turn(cost)
+            result, error = None, None
+            try:
+                result = fn(*args, **kwargs)
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                error = e
+            outcome = classify(result, error)
+            if outcome is None:
+                self.breaker.record_success()
+                if error is not None:
+                    raise error
+                return result
+
+            kind, retry_after = outcome
+            if kind == "failed":
+                opens = self.breaker.opens
+                self.breaker.record_failure()
+                if self.breaker.opens > opens:
+                    _CIRCUIT_OPENS.inc(service=self.name)
+            else:
+                self.breaker.record_success()
+            if (attempt >= self.max_retries or
+                    self.backoff(attempt, retry_after, throttled=(kind == "throttled")) is None):
+                if error is not None:
+                    raise error
+                return result
+            attempt += 1
+
+    def backoff(self, attempt: int, retry_after=None, throttled=False):
+        """
+        Record a failed attempt and work out the wait before the next one:
+        Retry-After if the service sent one, else jittered exponential
+        backoff. A throttling pause is shared by every caller. Returns the
+        delay, or None if it's longer than max_delay (give up instead).
+        """
+        delay = retry_after if retry_after is not None else backoff_delay(
+            attempt, self.base_delay, self.max_delay)
+        if delay > self.max_delay:
+            return None
+        _RETRIES.inc(service=self.name, kind="throttled" if throttled else "failed")
+        with self._lock:
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        if not throttled:
+            time.sleep(delay)  # throttled waits happen in _wait_turn
+        return delay
+
+    def _wait_turn(self, cost):
+        while True:
+            with self._lock:
+                pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+        if self.bucket is not None:
+            self.bucket.acquire(cost)
+
+def never_sent(error) -> bool:
+    """
+    Whether a failed `requests` call certainly never reached the server:
+    the connection couldn't be opened, or the circuit breaker refused it.
+    A read timeout or a dropped connection may come after the server has
+    acted on the request.
+    """
+    if isinstance(error, CircuitOpen):
+        return True
+    import requests
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        import urllib3
+        return isinstance(getattr(error.args[0], "reason", None), urllib3.exceptions.NewConnectionError)
+    return False
+
+def http_outcome(response, error):
+    """
+    classify() for `requests` calls: connection errors and 5xx are
+    failures, 429 is throttling, anything else is final.
+    """
+    if error is not None:
+        import requests  # loaded by the caller already; not needed at import
+        if isinstance(error, requests.RequestException):
+            return "failed", None
+        return None
+    retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+    if response.status_code in THROTTLED_STATUSES:
+        return "throttled", retry_after
+    if response.status_code in TRANSIENT_STATUSES:
+        # 503 from Graph often carries Retry-After too
+        return "failed", retry_after
+    return None
+
+def send_once_outcome(response, error):
+    """
+    classify() for requests that must not run twice, like sending mail:
+    retried only when the server certainly didn't act on them, i.e. on
+    429 or when the connection was never made. A 5xx or a timeout waiting
+    for the answer is final.
+    """
+    if error is not None:
+        return ("failed", None) if never_sent(error) else None
+    if response.status_code in THROTTLED_STATUSES:
+        return "throttled", retry_after_seconds(response.headers.get("Retry-After"))
+    return None